@@ -1,6 +1,6 @@
 import enum
 from datetime import date, datetime
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Type, Union
 from uuid import UUID, uuid4
 
 from banking.error import (
@@ -9,14 +9,24 @@ from banking.error import (
     ClosingCompanyAccountError,
     DailyWithdrawalLimitError,
     InsufficientFundError,
+    InvalidAmountError,
 )
 from banking.date_helper import get_todays_date
+from banking.money import Amount, Money
 
 
 class Transaction:
     """Transaction object for all account transactions
     """
 
+    __slots__ = (
+        "transaction_id",
+        "account_id",
+        "transaction_type",
+        "amount",
+        "occurred_on",
+    )
+
     class TransactionType(str, enum.Enum):
         CREDIT = "credit"
         DEBIT = "debit"
@@ -25,39 +35,56 @@ class Transaction:
         self,
         account_id: UUID,
         transaction_type: TransactionType,
-        amount: float,
+        amount: Amount,
         occurred_on: date,
+        transaction_id: Optional[UUID] = None,
     ):
-        self.transaction_id = uuid4()
+        self.transaction_id = transaction_id if transaction_id is not None else uuid4()
         self.account_id = account_id
         self.transaction_type = transaction_type
-        self.amount = amount
+        self.amount: Money = Money.of(amount)
         self.occurred_on: date = occurred_on
 
-    def __radd__(self, other):
+    def __setstate__(self, state):
+        # Transactions pickled before __slots__ was added carry their
+        # attributes in a dict instead of a (dict, slots) pair
+        # and amounts that were floats before Money was added
+        if isinstance(state, tuple):
+            state = state[1]
+        for name, value in state.items():
+            setattr(self, name, Money.of(value) if name == "amount" else value)
+
+    def __radd__(self, other: Amount) -> Money:
         if self.transaction_type == Transaction.TransactionType.CREDIT:
             return other + self.amount
         else:
             return other - self.amount
 
+    @property
+    def signed_grosz(self) -> int:
+        """Amount in grosz, negative for DEBIT transactions"""
+        if self.transaction_type == Transaction.TransactionType.CREDIT:
+            return self.amount.grosz
+        return -self.amount.grosz
+
     def to_dict(self):
         return {
             "transaction_id": str(self.transaction_id),
             "account_id": str(self.account_id),
             "transaction_type": self.transaction_type.value,
             "occurred_on": self.occurred_on.strftime("%Y-%m-%d"),
-            "amount": f"{self.amount} PLN",
+            "amount": str(self.amount),
         }
 
     @classmethod
     def create(
-        cls, account_id: UUID, transaction_type: TransactionType, amount: float
+        cls, account_id: UUID, transaction_type: TransactionType, amount: Amount
     ) -> "Transaction":
         """Create a new transaction
 
         Arguments:
             account_id {UUID} -- Id of account the transaction was performed on
-            amount {float} -- Amount
+            amount {Amount} -- Amount
             tranaction_type {TransactionType} -- type of transaction debit or credit
 
         Returns:
@@ -69,14 +96,17 @@ class Transaction:
 
 class BankAccount:
 
-    MINIMUM_ACCOUNT_BALANCE = 0
+    MINIMUM_ACCOUNT_BALANCE: Money = Money.of(0)
 
     def __init__(
-        self, account_id: UUID, balance: float = 0, amount_withdrawn_today: float = 0
+        self,
+        account_id: UUID,
+        balance: Amount = 0,
+        amount_withdrawn_today: Amount = 0,
     ) -> None:
         self.account_id: UUID = account_id
-        self.balance = balance
-        self.amount_withdrawn_today = amount_withdrawn_today
+        self.balance: Money = Money.of(balance)
+        self.amount_withdrawn_today: Money = Money.of(amount_withdrawn_today)
 
     @classmethod
     def open(cls) -> "BankAccount":
@@ -84,30 +114,36 @@ class BankAccount:
         """
         return cls(uuid4())
 
-    def deposit(self, amount: float) -> Transaction:
+    def deposit(self, amount: Amount) -> Transaction:
         """Deposit funds into account.
 
         Arguments:
-            amount {float} -- Amount to deposit
+            amount {Amount} -- Amount to deposit
+
+        Raises:
+            InvalidAmountError: If amount isn't positive
 
         Returns:
             Transaction -- A new transaction object
         """
-        assert amount > 0
+        amount = Money.of(amount)
+        if amount <= 0:
+            raise InvalidAmountError("Deposit amount must be positive")
         return Transaction.create(
             self.account_id, Transaction.TransactionType.CREDIT, amount
         )
 
-    def withdraw(self, amount: float, is_atm: bool) -> Transaction:
+    def withdraw(self, amount: Amount, is_atm: bool) -> Transaction:
         """Withdraw funds from account.
 
         Arguments:
-            amount {float} -- Amount to withdraw
+            amount {Amount} -- Amount to withdraw
             is_atm {bool} -- Withdrawal method is atm or not
 
         Returns:
             Transaction -- A new transaction object
         """
+        amount = Money.of(amount)
         self.assert_can_withdraw(amount, is_atm)
         return Transaction.create(
             self.account_id, Transaction.TransactionType.DEBIT, amount
@@ -119,19 +155,21 @@ class BankAccount:
             return self.withdraw(self.balance, False)
 
     def assert_can_withdraw(
-        self, amount: float, is_atm: bool,
+        self, amount: Money, is_atm: bool,
     ):
         """Validate and verify if the withdrawal transaction
         should be allowed.
 
         Arguments:
-            amount {float} -- Amount to withdraw
+            amount {Money} -- Amount to withdraw
             is_atm {bool} -- Withdrawal method is atm or not
 
         Raises:
+            InvalidAmountError: If amount isn't positive
             InsufficientFundError: If amount specified is not available
         """
-        assert amount > 0
+        if amount <= 0:
+            raise InvalidAmountError("Withdrawal amount must be positive")
         if (self.balance - amount) < self.MINIMUM_ACCOUNT_BALANCE:
             raise InsufficientFundError("Insufficient funds in account")
 
@@ -142,11 +180,11 @@ class BankAccount_INT(BankAccount):
 
 class BankAccount_COVID19(BankAccount):
 
-    MAX_DAILY_WITHDRAWAL: float = 1000
+    MAX_DAILY_WITHDRAWAL: Money = Money.of(1000)
     RESTRICTION_DATE: date = datetime(2020, 4, 1).date()
 
     def assert_can_withdraw(
-        self, amount: float, is_atm: bool,
+        self, amount: Money, is_atm: bool,
     ):
         super().assert_can_withdraw(amount, is_atm)
         occurring_on = get_todays_date()
@@ -163,9 +201,9 @@ class BankAccount_COVID19(BankAccount):
 
 class BankAccount_COVID19_Company(BankAccount_COVID19):
 
-    MINIMUM_ACCOUNT_BALANCE = 5000
+    MINIMUM_ACCOUNT_BALANCE = Money.of(5000)
 
-    def deposit(self, amount: float) -> Transaction:
+    def deposit(self, amount: Amount) -> Transaction:
         """Ensure company's first deposit is beyond or equal to 
         the minimum account balance which is the non-returnable 
         government loan.
@@ -175,7 +213,7 @@ class BankAccount_COVID19_Company(BankAccount_COVID19):
         this would be it's first deposit.
 
         Arguments:
-            amount {float} -- Amount to deposit.
+            amount {Amount} -- Amount to deposit.
 
         Raises:
             AccountError: If this is company's first deposit and it does not meet the minimum
@@ -193,3 +231,15 @@ class BankAccount_COVID19_Company(BankAccount_COVID19):
 
     def close(self) -> Optional[Transaction]:
         raise ClosingCompanyAccountError("Company account cannot be closed")
+
+
+ACCOUNT_TYPE_CLASS_MAPPING: Dict[str, Type[BankAccount]] = {
+    "international": BankAccount_INT,
+    "covid": BankAccount_COVID19,
+    "company": BankAccount_COVID19_Company,
+}
+
+ACCOUNT_CLASS_TYPE_MAPPING: Dict[Type[BankAccount], str] = {
+    account_class: account_type
+    for account_type, account_class in ACCOUNT_TYPE_CLASS_MAPPING.items()
+}
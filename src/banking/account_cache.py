@@ -0,0 +1,133 @@
+import typing
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
+from uuid import UUID
+
+from banking.account import BankAccount, Transaction
+from banking.money import Money
+
+
+class AccountCache:
+    """Least recently used BankAccount objects of a ledger by account id.
+
+    An account's amount_withdrawn_today only holds for one day so the cache
+    is emptied whenever it's used on another day than it's entries were
+    built for. Cached accounts are shared by every caller and must not be
+    changed, a saved transaction replaces it's account's entry with a new
+    object instead.
+
+    Accounts may be built outside the ledger's lock between begin_read and
+    end_read, they are only cached if the account didn't change meanwhile.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Arguments:
+            max_size {int} -- number of accounts kept, the least recently
+            used one is dropped to make room for another
+        """
+        self.max_size = max_size
+        self.accounts: typing.OrderedDict[UUID, BankAccount] = OrderedDict()
+        self.day: Optional[date] = None
+        self.hits = 0
+        self.misses = 0
+        # Changes seen and number of builds in progress by account id
+        self.reads: typing.Dict[UUID, typing.List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def use_day(self, day: date):
+        """Drop the accounts built for another day"""
+        if day != self.day:
+            self.accounts.clear()
+            self.day = day
+
+    def get(self, account_id: UUID, day: date) -> Optional[BankAccount]:
+        """Return the cached account as of day or None if it isn't cached"""
+        self.use_day(day)
+        account = self.accounts.get(account_id)
+        if account is None:
+            self.misses += 1
+            return None
+        self.accounts.move_to_end(account_id)
+        self.hits += 1
+        return account
+
+    def put(self, account: BankAccount, day: date):
+        """Cache an account built as of day"""
+        self.use_day(day)
+        self.accounts[account.account_id] = account
+        self.accounts.move_to_end(account.account_id)
+        if len(self.accounts) > self.max_size:
+            self.accounts.popitem(last=False)
+
+    def begin_read(self, account_id: UUID) -> int:
+        """Note that the account is about to be built and return the number
+        of it's changes to pass to end_read"""
+        read = self.reads.setdefault(account_id, [0, 0])
+        read[1] += 1
+        return read[0]
+
+    def end_read(
+        self,
+        account_id: UUID,
+        day: date,
+        changes: int,
+        account: Optional[BankAccount],
+    ):
+        """Cache the account built since begin_read unless the build failed,
+        the account changed meanwhile or the cache moved to another day"""
+        read = self.reads[account_id]
+        read[1] -= 1
+        if account is not None and read[0] == changes and day == self.day:
+            self.put(account, day)
+        if read[1] == 0:
+            del self.reads[account_id]
+
+    def changed(self, account_id: UUID):
+        read = self.reads.get(account_id)
+        if read is not None:
+            read[0] += 1
+
+    def saved(self, obj: typing.Union[BankAccount, Transaction]):
+        """Bring the cache up to date with an account or transaction just
+        saved to the ledger"""
+        self.changed(obj.account_id)
+        if isinstance(obj, BankAccount):
+            self.discard(obj.account_id)
+            return
+        account = self.accounts.get(obj.account_id)
+        if account is None:
+            return
+        withdrawn_today = account.amount_withdrawn_today
+        if (
+            obj.transaction_type == Transaction.TransactionType.DEBIT
+            and obj.occurred_on == self.day
+        ):
+            withdrawn_today = withdrawn_today + obj.amount
+        self.accounts[obj.account_id] = type(account)(
+            obj.account_id,
+            Money(account.balance.grosz + obj.signed_grosz),
+            withdrawn_today,
+        )
+
+    def discard(self, account_id: UUID):
+        self.changed(account_id)
+        self.accounts.pop(account_id, None)
+
+    def clear(self):
+        for read in self.reads.values():
+            read[0] += 1
+        self.accounts.clear()
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Returns the number of cached accounts, the maximum and the
+        number of hits and misses so far"""
+        return {
+            "size": len(self.accounts),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -1,44 +1,131 @@
+import os
+import sys
+from contextlib import contextmanager
 from datetime import date, datetime
-from typing import Dict, List, Literal, Optional, Type
+from itertools import islice
+from typing import Dict, Iterator, List, Literal, Optional, Type
 from uuid import UUID
 
 from banking.account import (
+    ACCOUNT_CLASS_TYPE_MAPPING,
+    ACCOUNT_TYPE_CLASS_MAPPING,
     BankAccount,
-    BankAccount_COVID19,
-    BankAccount_COVID19_Company,
-    BankAccount_INT,
     Transaction,
 )
+from banking.columns import ColumnarLedger
+from banking.journal import JournalLedger
+from banking.lazy_ledger import LazyJournalLedger
 from banking.ledger import Ledger
+from banking.metrics import Metrics
+from banking.money import Amount, Money
+from banking.sharded_ledger import ShardedLedger
+from banking.sqlite_ledger import SQLiteLedger
 from banking.date_helper import get_todays_date, set_todays_date
 
 AccountType = Literal["international", "company", "covid"]
+LedgerBackend = Literal["pickle", "journal", "sqlite", "columnar", "sharded", "lazy"]
 
 
 class Application:
 
-    ACCOUNT_TYPE_CLASS_MAPPING: Dict[str, Type[BankAccount]] = {
-        "international": BankAccount_INT,
-        "covid": BankAccount_COVID19,
-        "company": BankAccount_COVID19_Company,
+    ACCOUNT_TYPE_CLASS_MAPPING: Dict[str, Type[BankAccount]] = (
+        ACCOUNT_TYPE_CLASS_MAPPING
+    )
+
+    LEDGER_BACKEND_CLASS_MAPPING: Dict[str, Type[Ledger]] = {
+        "pickle": Ledger,
+        "journal": JournalLedger,
+        "sqlite": SQLiteLedger,
+        "columnar": ColumnarLedger,
+        "sharded": ShardedLedger,
+        "lazy": LazyJournalLedger,
     }
 
-    def __init__(self, ledger_file_name: str) -> None:
+    # Service methods timed under application_<name> when metrics are on
+    INSTRUMENTED_METHODS = (
+        "start",
+        "flush",
+        "open_account",
+        "close_account",
+        "withdraw",
+        "deposit",
+        "change_current_date",
+        "all_accounts",
+        "all_transactions",
+        "stream_accounts",
+        "stream_transactions",
+        "all_account_ids",
+        "all_transaction_ids",
+        "has_account",
+        "get_account_details",
+        "get_transaction_details",
+        "report",
+    )
+
+    def __init__(
+        self,
+        ledger_file_name: str,
+        ledger_backend: LedgerBackend = "pickle",
+        metrics: Optional[Metrics] = None,
+        **ledger_options,
+    ) -> None:
+        """
+        Arguments:
+            ledger_file_name {str} -- name of the ledger file
+
+        Keyword Arguments:
+            ledger_backend {LedgerBackend} -- how the ledger is stored
+            (default: {"pickle"})
+            metrics {Optional[Metrics]} -- where the timings of the service
+            methods and the ledger's hot paths are recorded, nothing is
+            timed without it (default: {None})
+            ledger_options -- passed on to the ledger backend eg.
+            checkpoint_every_records for the journal backend
+        """
         self.ledger_file_name = ledger_file_name
-        self.ledger = Ledger(self.ledger_file_name)
+        self.ledger = self.LEDGER_BACKEND_CLASS_MAPPING[ledger_backend](
+            self.ledger_file_name, **ledger_options
+        )
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.instrument(self, self.INSTRUMENTED_METHODS, "application")
+            metrics.instrument_ledger(self.ledger)
 
     def start(self):
         """Start the application by loading stored accounts
-        and transactions into memory or creating a new pickle
+        and transactions into memory or creating a new ledger
         file if file doesn't exist.
         """
-        try:
-            open(self.ledger_file_name)
-        except FileNotFoundError:
+        if not os.path.exists(self.ledger_file_name):
             with open(self.ledger_file_name, "wb"):
                 pass
         self.ledger.load()
 
+    def flush(self):
+        """Write every pending ledger change to disk"""
+        if self.ledger.unflushed_writes:
+            self.ledger.flush()
+
+    @contextmanager
+    def batched_writes(self) -> Iterator[None]:
+        """Hold ledger writes until flush() is called or the block ends
+        instead of following the ledger's durability policy after every
+        write. Held writes are persisted and fsynced as a batch, also when
+        the block ends with an error so writes that succeeded are kept.
+        """
+        ledger = self.ledger
+        durability = (ledger.durability, ledger.batch_size, ledger.batch_window)
+        ledger.durability = "batch"
+        ledger.batch_size = sys.maxsize
+        ledger.batch_window = float("inf")
+        try:
+            yield
+        finally:
+            try:
+                self.flush()
+            finally:
+                ledger.durability, ledger.batch_size, ledger.batch_window = durability
+
     def change_current_date(self, new_date: date):
         """Change the current date the simulate the day on
         which actions are performed.
@@ -71,83 +158,203 @@ class Application:
         """Close an existing account"""
 
         ledger: Ledger = self.ledger
-        account = ledger.get_account(account_id)
-        transaction = account.close()
-        if transaction is not None:
-            self.save_transaction(transaction)
-        self.ledger.close_account(account_id)
+        with ledger.account_lock(account_id):
+            account = ledger.get_account(account_id)
+            transaction = account.close()
+            if transaction is not None:
+                self.save_transaction(transaction)
+            self.ledger.close_account(account_id)
         return transaction.transaction_id if transaction is not None else None
 
-    def withdraw(self, account_id: UUID, amount: float, is_atm: bool) -> UUID:
+    def withdraw(self, account_id: UUID, amount: Amount, is_atm: bool) -> UUID:
         """Withdraw a specific amount from an account
 
         Arguments:
             account_id {UUID} -- Id of account to debit
-            amount {float} -- Amount to debit from the account
+            amount {Amount} -- Amount to debit from the account
             is_atm {bool} -- Is withdrawal via ATM
 
         Returns:
             UUID -- Id of the newly created transaction
         """
-        account: BankAccount = self.ledger.get_account(account_id)
-        transaction = account.withdraw(amount, is_atm)
-        self.save_transaction(transaction)
+        with self.ledger.account_lock(account_id):
+            account: BankAccount = self.ledger.get_account(account_id)
+            transaction = account.withdraw(amount, is_atm)
+            self.save_transaction(transaction)
         return transaction.transaction_id
 
-    def deposit(self, account_id: UUID, amount: float) -> UUID:
+    def deposit(self, account_id: UUID, amount: Amount) -> UUID:
         """Deposit funds into an account.
 
         Arguments:
             account_id {UUID} -- Id of account to be credited
-            amount {float} -- amount to credit the account with
+            amount {Amount} -- amount to credit the account with
 
         Returns:
             UUID -- Id of the newly created transaction
         """
-        account = self.ledger.get_account(account_id)
-        transaction = account.deposit(amount)
-        self.save_transaction(transaction)
+        with self.ledger.account_lock(account_id):
+            account = self.ledger.get_account(account_id)
+            transaction = account.deposit(amount)
+            self.save_transaction(transaction)
         return transaction.transaction_id
 
     def all_accounts(self) -> List[dict]:
         """Returns details of all accounts from the ledger"""
-
-        result = []
-        for account_id in self.ledger.all_account_ids():
-            result.append(self.get_account_details(account_id))
-        return result
+        return list(self.stream_accounts())
 
     def all_transactions(self) -> List[dict]:
         """Returns details of all transactions from the ledger"""
-        result = []
-        for transaction in self.ledger.store["transactions"].values():
-            result.append(transaction.to_dict())
-        return result
+        return list(self.stream_transactions())
+
+    def stream_accounts(
+        self,
+        account_id: Optional[UUID] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        snapshot: bool = False,
+    ) -> Iterator[dict]:
+        """Yields details of the open accounts one at a time
+
+        Keyword Arguments:
+            account_id {Optional[UUID]} -- only this account (default: {None})
+            offset {int} -- number of accounts to skip (default: {0})
+            limit {Optional[int]} -- maximum number of accounts (default: {None})
+            snapshot {bool} -- list the accounts and balances when the first
+            one is read so writes made while the stream is read don't change
+            it (default: {False})
+
+        Raises:
+            ValueError: If offset or limit is negative
+        """
+        check_page(offset, limit)
+        if account_id is not None:
+            if self.ledger.has_account(account_id) and offset == 0 and limit != 0:
+                yield self.get_account_details(account_id)
+            return
+        summaries = self.ledger.account_summaries()
+        if snapshot:
+            summaries = iter(list(summaries))
+        for account_id, account_class, balance in islice(
+            summaries, offset, page_end(offset, limit)
+        ):
+            yield account_details(account_id, account_class, balance)
+
+    def stream_transactions(
+        self,
+        account_id: Optional[UUID] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        snapshot: bool = False,
+    ) -> Iterator[dict]:
+        """Yields details of transactions one at a time in the order they
+        were stored
+
+        Keyword Arguments:
+            account_id {Optional[UUID]} -- only this account's transactions
+            (default: {None})
+            since {Optional[date]} -- first day included (default: {None})
+            until {Optional[date]} -- last day included (default: {None})
+            offset {int} -- number of matching transactions to skip (default: {0})
+            limit {Optional[int]} -- maximum number of transactions
+            (default: {None})
+            snapshot {bool} -- list the matching transactions when the first
+            one is read so writes made while the stream is read don't change
+            it, every matching transaction is then held in memory
+            (default: {False})
+
+        Raises:
+            ValueError: If offset or limit is negative
+        """
+        check_page(offset, limit)
+        transactions = self.ledger.find_transactions(account_id, since, until)
+        if snapshot:
+            transactions = iter(list(transactions))
+        for transaction in islice(transactions, offset, page_end(offset, limit)):
+            yield transaction.to_dict()
+
+    def all_account_ids(self) -> List[UUID]:
+        """Returns the ids of all open accounts"""
+        return list(self.ledger.all_account_ids())
+
+    def all_transaction_ids(self) -> List[UUID]:
+        """Returns the ids of all transactions"""
+        return list(self.ledger.all_transaction_ids())
+
+    def has_account(self, account_id: UUID) -> bool:
+        """Returns True if the account is open"""
+        return self.ledger.has_account(account_id)
+
+    def get_transaction_details(self, transaction_id: UUID) -> Optional[dict]:
+        """Returns details of a transaction or None if it doesn't exist"""
+        transaction = self.ledger.get_transaction(transaction_id)
+        return transaction.to_dict() if transaction is not None else None
+
+    def report(self, withdrawals_on: Optional[date] = None) -> dict:
+        """Returns the balances of all open accounts, their daily withdrawal
+        totals and the totals by transaction type, computed in one pass
+        over the transactions
+
+        Keyword Arguments:
+            withdrawals_on {Optional[date]} -- only list the withdrawal totals
+            of this day (default: {None})
+        """
+        # Imported on first use as it imports NumPy when it's installed
+        from banking.report import report_ledger
+
+        return report_ledger(self.ledger).to_dict(withdrawals_on)
 
     def get_account_details(self, account_id: UUID) -> dict:
-        result = {}
+        """Returns the id, balance and type of an account
+
+        Raises:
+            AccountNotFoundError: When account doesn't exist or is closed
+        """
         account = self.ledger.get_account(account_id)
-        balance = self.ledger.get_account_balance(account_id)
-        result["account_id"] = str(account_id)
-        result["balance"] = f"{account.balance} PLN"
-        result["type"] = self.__get_account_type(account)
-        return result
-
-    def __get_account_type(self, account: BankAccount):
-        if isinstance(account, BankAccount_COVID19):
-            return "covid"
-        elif isinstance(account, BankAccount_COVID19_Company):
-            return "company"
-        elif isinstance(account, BankAccount_INT):
-            return "international"
-        raise Exception("Invalid account type")
-
-
-def create_application(ledger_file_name: str):
+        return account_details(account_id, type(account), account.balance)
+
+
+def account_details(
+    account_id: UUID, account_class: Type[BankAccount], balance: Money
+) -> dict:
+    return {
+        "account_id": str(account_id),
+        "balance": str(balance),
+        "type": ACCOUNT_CLASS_TYPE_MAPPING[account_class],
+    }
+
+
+def check_page(offset: int, limit: Optional[int]):
+    """
+    Raises:
+        ValueError: If offset or limit is negative
+    """
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit can't be negative")
+
+
+def page_end(offset: int, limit: Optional[int]) -> Optional[int]:
+    """Stop index of a page for islice"""
+    return offset + limit if limit is not None else None
+
+
+def create_application(
+    ledger_file_name: str,
+    ledger_backend: LedgerBackend = "pickle",
+    metrics: Optional[Metrics] = None,
+    **ledger_options,
+):
     """Create a bank application
 
     Arguments:
         ledger_file_name {str} -- name of the ledger.
+        ledger_backend {LedgerBackend} -- how the ledger is stored, either
+        pickle, journal, sqlite, columnar, sharded or lazy (default: {"pickle"})
+        metrics {Optional[Metrics]} -- records timings when given
+        (default: {None})
+        ledger_options -- passed on to the ledger backend
     """
 
-    return Application(ledger_file_name)
+    return Application(ledger_file_name, ledger_backend, metrics, **ledger_options)
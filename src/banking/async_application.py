@@ -0,0 +1,165 @@
+import asyncio
+import typing
+import weakref
+from contextlib import ExitStack
+from uuid import UUID
+
+from banking.application import AccountType, Application
+from banking.money import Amount
+
+
+class AsyncApplication:
+    """Asyncio facade over an Application for many concurrent callers.
+
+    Operations run the application's methods in the loop's default
+    executor, so they need a thread safe ledger. Operations on the same
+    account run one at a time in the order they were called, under the
+    account's asyncio lock, and the ledger's account lock keeps the balance
+    an operation checks from changing before it's transaction is stored.
+    Operations on different accounts run in parallel.
+
+    Writes are not persisted by the operation itself. A background writer
+    task group-commits every write stored since it's last commit with a
+    single ledger flush, run in a worker thread, and an operation returns
+    once the commit holding it's write is done. Operations carry on while a
+    commit is being written, their writes go to the next commit.
+    """
+
+    def __init__(self, app: Application, commit_delay: float = 0.0) -> None:
+        """
+        Arguments:
+            app {Application} -- a started application with a thread safe
+            ledger
+
+        Raises:
+            ValueError: If the application's ledger isn't thread safe
+
+        Keyword Arguments:
+            commit_delay {float} -- seconds the writer waits after the first
+            write of a commit to gather more writes (default: {0.0})
+        """
+        if not app.ledger.thread_safe:
+            raise ValueError("AsyncApplication needs a thread safe ledger")
+        self.app = app
+        self.commit_delay = commit_delay
+        self.account_locks: typing.MutableMapping[UUID, asyncio.Lock] = (
+            weakref.WeakValueDictionary()
+        )
+        self.commits = 0
+        self.closing = False
+        self.exit_stack = ExitStack()
+        self.writer: typing.Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Hold the ledger's writes for the writer and start it"""
+        loop = asyncio.get_running_loop()
+        self.exit_stack.enter_context(self.app.batched_writes())
+        self.writes_pending = asyncio.Event()
+        self.next_commit: asyncio.Future = loop.create_future()
+        self.writer = loop.create_task(self.write_commits())
+
+    async def close(self):
+        """Commit the remaining writes and stop the writer"""
+        if self.writer is None:
+            return
+        self.closing = True
+        self.writes_pending.set()
+        await self.writer
+        self.writer = None
+        self.exit_stack.close()
+
+    async def __aenter__(self) -> "AsyncApplication":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def write_commits(self):
+        while not self.closing:
+            await self.writes_pending.wait()
+            if self.commit_delay and not self.closing:
+                await asyncio.sleep(self.commit_delay)
+            await self.commit()
+
+    async def commit(self):
+        """Flush every write stored since the last commit and resolve the
+        operations waiting on them.
+
+        Operations that return while the flush runs wait for the next
+        commit, whether or not the flush already wrote their write.
+        """
+        loop = asyncio.get_running_loop()
+        self.writes_pending.clear()
+        commit = self.next_commit
+        self.next_commit = loop.create_future()
+        try:
+            await loop.run_in_executor(None, self.app.flush)
+        except Exception as e:
+            commit.set_exception(e)
+        else:
+            commit.set_result(None)
+        self.commits += 1
+
+    def account_lock(self, account_id: UUID) -> asyncio.Lock:
+        lock = self.account_locks.get(account_id)
+        if lock is None:
+            lock = self.account_locks[account_id] = asyncio.Lock()
+        return lock
+
+    async def run(
+        self, method: typing.Callable, *args
+    ) -> typing.Tuple[typing.Any, asyncio.Future]:
+        """Apply an application method in a worker thread and return it's
+        result with the commit that will hold it's write"""
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(None, method, *args)
+        # The write is stored, the commit after this point includes it
+        commit = self.next_commit
+        self.writes_pending.set()
+        return result, commit
+
+    async def run_on_account(
+        self, account_id: UUID, method: typing.Callable, *args
+    ) -> typing.Tuple[typing.Any, asyncio.Future]:
+        """Apply an application method once the operations called before it
+        on the account are applied, see run"""
+        async with self.account_lock(account_id):
+            return await self.run(method, account_id, *args)
+
+    async def open_account(self, account_type: AccountType) -> UUID:
+        """Open a new bank account, see Application.open_account"""
+        account_id, commit = await self.run(self.app.open_account, account_type)
+        await asyncio.shield(commit)
+        return account_id
+
+    async def deposit(self, account_id: UUID, amount: Amount) -> UUID:
+        """Deposit funds into an account, see Application.deposit"""
+        transaction_id, commit = await self.run_on_account(
+            account_id, self.app.deposit, amount
+        )
+        await asyncio.shield(commit)
+        return transaction_id
+
+    async def withdraw(self, account_id: UUID, amount: Amount, is_atm: bool) -> UUID:
+        """Withdraw funds from an account, see Application.withdraw"""
+        transaction_id, commit = await self.run_on_account(
+            account_id, self.app.withdraw, amount, is_atm
+        )
+        await asyncio.shield(commit)
+        return transaction_id
+
+    async def close_account(self, account_id: UUID) -> typing.Optional[UUID]:
+        """Close an account, see Application.close_account"""
+        transaction_id, commit = await self.run_on_account(
+            account_id, self.app.close_account
+        )
+        await asyncio.shield(commit)
+        return transaction_id
+
+    async def get_account_details(self, account_id: UUID) -> dict:
+        async with self.account_lock(account_id):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, self.app.get_account_details, account_id
+            )
@@ -0,0 +1,183 @@
+import csv
+import json
+import time
+import typing
+from datetime import datetime
+from uuid import UUID
+
+from banking.application import Application
+from banking.date_helper import get_todays_date
+from banking.error import AccountError
+
+BatchFormat = typing.Literal["csv", "jsonl"]
+OperationType = typing.Dict[str, typing.Any]
+
+BATCH_DATE_FORMAT = "%Y-%m-%d"
+TRUE_VALUES = ("1", "true", "yes", "y")
+
+
+class BatchResult:
+    """Counts and timing of a finished batch run"""
+
+    def __init__(self) -> None:
+        self.succeeded = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def total(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def read_operations(
+    lines: typing.Iterable[str], batch_format: BatchFormat = "csv"
+) -> typing.Iterator[typing.Tuple[int, OperationType]]:
+    """Parse batch operations one line at a time, yielding each with
+    it's line number.
+
+    CSV input starts with a header naming the fields used out of
+    operation, account_id, amount, account_type, atm and date eg.
+    `operation,account_id,amount`. JSON lines input has one object per
+    line with the same keys. Blank lines are skipped.
+
+    Arguments:
+        lines {Iterable[str]} -- lines of the batch file
+        batch_format {BatchFormat} -- either csv or jsonl (default: {"csv"})
+
+    Returns:
+        Iterator[Tuple[int, OperationType]] -- line numbers and operations
+    """
+    if batch_format == "csv":
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, {
+                key: value for key, value in row.items() if value not in ("", None)
+            }
+    elif batch_format == "jsonl":
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                operation = json.loads(line)
+            except ValueError:
+                operation = None
+            if not isinstance(operation, dict):
+                operation = {"error": "Line is not a JSON object"}
+            yield line_number, operation
+    else:
+        raise ValueError(f"Invalid batch format {batch_format}")
+
+
+def apply_operation(
+    app: Application, operation: OperationType
+) -> typing.Optional[UUID]:
+    """Run a single batch operation through the application, on it's date
+    if it has one. The current date is restored afterwards so the date
+    only applies to this operation.
+
+    Arguments:
+        app {Application} -- a started application
+        operation {OperationType} -- the operation and it's arguments
+
+    Returns:
+        Optional[UUID] -- id of the opened account or the created transaction
+
+    Raises:
+        AccountError: If the account refuses the operation
+        KeyError: If a required field or the account type is unknown
+        ValueError: If a field can't be parsed
+    """
+    if "error" in operation:
+        raise ValueError(operation["error"])
+    if not operation.get("date"):
+        return run_operation(app, operation)
+    batch_date = get_todays_date()
+    app.change_current_date(
+        datetime.strptime(operation["date"], BATCH_DATE_FORMAT).date()
+    )
+    try:
+        return run_operation(app, operation)
+    finally:
+        app.change_current_date(batch_date)
+
+
+def run_operation(app: Application, operation: OperationType) -> typing.Optional[UUID]:
+    """Run a batch operation on the current date, see apply_operation"""
+    kind = operation.get("operation")
+    if kind == "open":
+        return app.open_account(operation["account_type"])
+    account_id = UUID(operation["account_id"])
+    if kind == "deposit":
+        return app.deposit(account_id, operation["amount"])
+    if kind == "withdraw":
+        atm = operation.get("atm", False)
+        if isinstance(atm, str):
+            atm = atm.strip().lower() in TRUE_VALUES
+        return app.withdraw(account_id, operation["amount"], bool(atm))
+    if kind == "close":
+        return app.close_account(account_id)
+    raise ValueError(f"Invalid operation {kind}")
+
+
+def run_batch(
+    app: Application,
+    operations: typing.Iterable[typing.Tuple[int, OperationType]],
+    report: typing.TextIO,
+    chunk_size: int = 1000,
+) -> BatchResult:
+    """Apply operations to the application, persisting the ledger once per
+    chunk_size operations instead of after every write, and write a JSON
+    line with the result or error of each operation to report.
+
+    A failed operation is reported and the batch carries on with the next.
+    Any other error stops the batch once the operations run before it are
+    persisted.
+
+    Arguments:
+        app {Application} -- a started application
+        operations {Iterable[Tuple[int, OperationType]]} -- numbered
+        operations eg. from read_operations
+        report {TextIO} -- where the per line report is written
+
+    Keyword Arguments:
+        chunk_size {int} -- operations between ledger flushes (default: {1000})
+
+    Returns:
+        BatchResult -- operation counts and elapsed time
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    result = BatchResult()
+    started_at = time.perf_counter()
+    try:
+        with app.batched_writes():
+            for line_number, operation in operations:
+                entry: typing.Dict[str, typing.Any] = {
+                    "line": line_number,
+                    "operation": operation.get("operation"),
+                }
+                try:
+                    entity_id = apply_operation(app, operation)
+                    entry["status"] = "ok"
+                    entry["id"] = str(entity_id) if entity_id is not None else None
+                    result.succeeded += 1
+                except (
+                    AccountError,
+                    KeyError,
+                    TypeError,
+                    ValueError,
+                    ArithmeticError,
+                ) as e:
+                    entry["status"] = "error"
+                    entry["error"] = f"{type(e).__name__}: {e}"
+                    result.failed += 1
+                report.write(json.dumps(entry) + "\n")
+                if result.total % chunk_size == 0:
+                    app.flush()
+    finally:
+        result.elapsed = time.perf_counter() - started_at
+    return result
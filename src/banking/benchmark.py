@@ -0,0 +1,368 @@
+"""Benchmarks of the ledger and application hot paths.
+
+A synthetic ledger is generated for every backend and size and the
+scenarios below are timed against it. Results are printed and written as
+JSON, a previous results file can be given to flag regressions. Run it with
+
+    python -m banking.benchmark --sizes 10000 100000 1000000 \
+        --backends pickle journal --output results.json --baseline old.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+from datetime import date, datetime, timedelta
+from uuid import UUID
+
+from banking.account import ACCOUNT_TYPE_CLASS_MAPPING, BankAccount, Transaction
+from banking.application import Application
+from banking.date_helper import get_todays_date, set_todays_date
+from banking.money import Money
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_ACCOUNT_MIX = {"international": 0.5, "covid": 0.3, "company": 0.2}
+
+MetricsType = typing.Dict[str, float]
+
+
+def generate_ledger(
+    app: Application,
+    accounts: int,
+    transactions_per_account: int,
+    account_mix: typing.Dict[str, float] = DEFAULT_ACCOUNT_MIX,
+    days: int = 30,
+    start_date: date = date(2020, 3, 1),
+    seed: int = 0,
+) -> typing.List[UUID]:
+    """Fill a started application with random accounts and transactions.
+
+    Transactions are stored straight into the ledger, day by day, with
+    every account's balance kept above it's minimum so the generated
+    history is one the application could have written.
+
+    Arguments:
+        app {Application} -- a started application with an empty ledger
+        accounts {int} -- number of accounts
+        transactions_per_account {int} -- transactions of each account
+
+    Keyword Arguments:
+        account_mix {Dict[str, float]} -- share of each account type
+        (default: {DEFAULT_ACCOUNT_MIX})
+        days {int} -- days the transactions are spread over (default: {30})
+        start_date {date} -- day of the first transactions
+        (default: {date(2020, 3, 1)})
+        seed {int} -- seed of the random amounts and types (default: {0})
+
+    Returns:
+        List[UUID] -- the ids of the generated accounts
+    """
+    rng = random.Random(seed)
+    account_types = rng.choices(
+        list(account_mix), weights=list(account_mix.values()), k=accounts
+    )
+    opened: typing.List[BankAccount] = [
+        ACCOUNT_TYPE_CLASS_MAPPING[account_type](UUID(int=rng.getrandbits(128)))
+        for account_type in account_types
+    ]
+    balances = [0] * accounts
+    with app.batched_writes():
+        app.ledger.save(opened)  # type: ignore
+        for number in range(transactions_per_account):
+            occurred_on = start_date + timedelta(
+                days=number * days // transactions_per_account
+            )
+            transactions = []
+            for index, account in enumerate(opened):
+                minimum = account.MINIMUM_ACCOUNT_BALANCE.grosz
+                if balances[index] == 0:
+                    amount = minimum + rng.randint(1, 50_000)
+                else:
+                    amount = rng.randint(1, 50_000)
+                withdrawable = balances[index] - minimum
+                if withdrawable > 0 and rng.random() < 0.4:
+                    transaction_type = Transaction.TransactionType.DEBIT
+                    amount = min(amount, withdrawable)
+                    balances[index] -= amount
+                else:
+                    transaction_type = Transaction.TransactionType.CREDIT
+                    balances[index] += amount
+                transactions.append(
+                    Transaction(
+                        account.account_id,
+                        transaction_type,
+                        Money(amount),
+                        occurred_on,
+                        UUID(int=rng.getrandbits(128)),
+                    )
+                )
+            app.ledger.save(transactions)  # type: ignore
+    return [account.account_id for account in opened]
+
+
+def percentile(samples: typing.List[float], fraction: float) -> float:
+    """Return the sample below which the given fraction of samples fall"""
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def time_call(function: typing.Callable, *args) -> float:
+    started_at = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - started_at
+
+
+def latency_metrics(name: str, samples: typing.List[float]) -> MetricsType:
+    return {
+        f"{name}_p50_seconds": percentile(samples, 0.5),
+        f"{name}_p95_seconds": percentile(samples, 0.95),
+    }
+
+
+def run_scenarios(
+    filename: str,
+    backend: str,
+    transactions: int,
+    transactions_per_account: int = 10,
+    samples: int = 100,
+    seed: int = 0,
+    serializer: str = "pickle",
+) -> MetricsType:
+    """Generate a ledger of the given size and time every scenario on it
+
+    Arguments:
+        filename {str} -- ledger file to create
+        backend {str} -- ledger backend, see Application
+        transactions {int} -- number of transactions to generate
+
+    Keyword Arguments:
+        transactions_per_account {int} -- sets the number of accounts
+        (default: {10})
+        samples {int} -- operations timed by the latency and throughput
+        scenarios (default: {100})
+        seed {int} -- seed of the generated ledger and sampled accounts
+        (default: {0})
+        serializer {str} -- how the ledger store is written, see Ledger
+        (default: {"pickle"})
+
+    Returns:
+        MetricsType -- metric name to value, names end with their unit
+    """
+    accounts = max(transactions // transactions_per_account, 1)
+    metrics: MetricsType = {}
+
+    app = Application(filename, backend, serializer=serializer)  # type: ignore
+    app.start()
+    started_at = time.perf_counter()
+    account_ids = generate_ledger(app, accounts, transactions_per_account, seed=seed)
+    metrics["generate_seconds"] = time.perf_counter() - started_at
+    metrics["ledger_bytes"] = sum(
+        os.path.getsize(os.path.join(os.path.dirname(filename), name))
+        for name in os.listdir(os.path.dirname(filename))
+        if name.startswith(os.path.basename(filename))
+    )
+
+    # Startup: loading the ledger in a new application
+    app = Application(filename, backend, serializer=serializer)  # type: ignore
+    metrics["load_seconds"] = time_call(app.start)
+    tracemalloc.start()
+    Application(filename, backend, serializer=serializer).start()  # type: ignore
+    _, metrics["load_peak_memory_bytes"] = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # The date is global, the caller's date is restored afterwards
+    todays_date = get_todays_date()
+    try:
+        # Single operation latency, without the ledger writes which are
+        # measured by the persist scenario
+        rng = random.Random(seed)
+        app.change_current_date(date(2020, 6, 1))
+        sampled = [rng.choice(account_ids) for _ in range(samples)]
+        with app.batched_writes():
+            metrics.update(
+                latency_metrics(
+                    "get_account",
+                    [time_call(app.ledger.get_account, uid) for uid in sampled],
+                )
+            )
+            metrics.update(
+                latency_metrics(
+                    "deposit", [time_call(app.deposit, uid, 1) for uid in sampled]
+                )
+            )
+            metrics.update(
+                latency_metrics(
+                    "withdraw",
+                    [time_call(app.withdraw, uid, 1, False) for uid in sampled],
+                )
+            )
+
+        # Writing the ledger after a single change
+        with app.batched_writes():
+            app.deposit(account_ids[0], 1)
+            metrics["persist_seconds"] = time_call(app.flush)
+
+        # Bulk throughput of writes flushed once
+        started_at = time.perf_counter()
+        with app.batched_writes():
+            for uid in sampled * 10:
+                app.deposit(uid, 1)
+        metrics["deposit_ops_per_second"] = (
+            len(sampled) * 10 / (time.perf_counter() - started_at)
+        )
+
+        metrics["all_accounts_seconds"] = time_call(app.all_accounts)
+
+        # ls --format jsonl
+        started_at = time.perf_counter()
+        entries = app.stream_transactions()
+        json.dumps(next(entries))
+        metrics["ls_first_entry_seconds"] = time.perf_counter() - started_at
+        for entry in entries:
+            json.dumps(entry)
+        metrics["ls_seconds"] = time.perf_counter() - started_at
+        return metrics
+    finally:
+        set_todays_date(todays_date)
+
+
+def is_regression(
+    metric: str, baseline: float, current: float, tolerance: float
+) -> bool:
+    """Returns True if current is worse than baseline by more than the
+    tolerance, a fraction of the baseline"""
+    if metric.endswith("_per_second"):
+        return current < baseline * (1 - tolerance)
+    return current > baseline * (1 + tolerance)
+
+
+def compare_results(
+    baseline: dict, current: dict, tolerance: float = 0.2
+) -> typing.List[str]:
+    """List the metrics of current results that regressed from a baseline
+
+    Arguments:
+        baseline {dict} -- results of an earlier run
+        current {dict} -- results of this run
+
+    Keyword Arguments:
+        tolerance {float} -- change allowed as a fraction of the baseline
+        (default: {0.2})
+
+    Returns:
+        List[str] -- a description of each regression
+    """
+    baseline_runs = {
+        (run["backend"], run["transactions"]): run["metrics"]
+        for run in baseline["results"]
+    }
+    regressions = []
+    for run in current["results"]:
+        key = (run["backend"], run["transactions"])
+        for metric, value in run["metrics"].items():
+            previous = baseline_runs.get(key, {}).get(metric)
+            if previous is not None and is_regression(
+                metric, previous, value, tolerance
+            ):
+                regressions.append(
+                    f"{key[0]} {key[1]} transactions {metric}: "
+                    f"{previous:.6g} -> {value:.6g}"
+                )
+    return regressions
+
+
+def run_benchmarks(
+    backends: typing.Iterable[str],
+    sizes: typing.Iterable[int],
+    transactions_per_account: int = 10,
+    samples: int = 100,
+    seed: int = 0,
+    serializer: str = "pickle",
+) -> dict:
+    """Run the scenarios for every backend and size in temporary
+    directories and return the results document"""
+    results = []
+    for backend in backends:
+        for transactions in sizes:
+            with tempfile.TemporaryDirectory() as directory:
+                metrics = run_scenarios(
+                    os.path.join(directory, "ledger"),
+                    backend,
+                    transactions,
+                    transactions_per_account,
+                    samples,
+                    seed,
+                    serializer,
+                )
+            results.append(
+                {"backend": backend, "transactions": transactions, "metrics": metrics}
+            )
+            print_metrics(backend, transactions, metrics)
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "transactions_per_account": transactions_per_account,
+            "samples": samples,
+            "seed": seed,
+            "serializer": serializer,
+        },
+        "results": results,
+    }
+
+
+def print_metrics(backend: str, transactions: int, metrics: MetricsType):
+    print(f"{backend}, {transactions} transactions", file=sys.stderr)
+    for metric, value in metrics.items():
+        print(f"  {metric:<28} {value:>14.6g}", file=sys.stderr)
+
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m banking.benchmark", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--backends", nargs="+", default=["pickle"])
+    parser.add_argument("--transactions-per-account", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serializer", choices=["pickle", "binary"], default="pickle")
+    parser.add_argument("--output", help="file the JSON results are written to")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.backends,
+        args.sizes,
+        args.transactions_per_account,
+        args.samples,
+        args.seed,
+        args.serializer,
+    )
+    document = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(document + "\n")
+    else:
+        print(document)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_results(
+                json.load(baseline_file), results, args.tolerance
+            )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,564 @@
+import mmap
+import struct
+import sys
+import typing
+from array import array
+from datetime import date, timedelta
+from uuid import UUID
+
+from banking.account import BankAccount, Transaction
+from banking.error import LedgerCorruptedError
+from banking.ledger import Ledger, sync_directory, write_atomically
+from banking.money import Money
+from banking.serializer import TRANSACTION_TYPE_CODES, TRANSACTION_TYPES
+
+UINT64_MASK = (1 << 64) - 1
+
+
+class TransactionColumns:
+    """Transactions stored column by column in parallel arrays.
+
+    A row takes 33 bytes: the 128 bit transaction id split in two 64 bit
+    halves, the account ordinal (position of the account id in
+    `account_ids`), a type code, the day ordinal of occurred_on and the
+    amount in grosz. Transaction objects are only built when a row is read.
+
+    Rows are looked up by transaction id through `row_by_transaction_id`,
+    which isn't pickled but rebuilt from the id columns when the columns
+    are unpickled.
+    """
+
+    def __init__(self) -> None:
+        self.ids_high = array("Q")
+        self.ids_low = array("Q")
+        self.account_ordinals = array("I")
+        self.transaction_types = array("B")
+        self.days = array("I")
+        self.amounts = array("q")
+        self.account_ids: typing.List[UUID] = []
+        self.account_ordinal_by_id: typing.Dict[UUID, int] = {}
+        # Row of each transaction by the int of it's id
+        self.row_by_transaction_id: typing.Dict[int, int] = {}
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["row_by_transaction_id"]
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.build_row_index()
+
+    def build_row_index(self):
+        """Rebuild the row of each transaction id from the id columns"""
+        self.row_by_transaction_id = {
+            (high << 64) | low: row
+            for row, (high, low) in enumerate(zip(self.ids_high, self.ids_low))
+        }
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def copy(self) -> "TransactionColumns":
+        """Return a copy whose rows don't change when rows are added here"""
+        columns = TransactionColumns()
+        columns.ids_high = self.ids_high[:]
+        columns.ids_low = self.ids_low[:]
+        columns.account_ordinals = self.account_ordinals[:]
+        columns.transaction_types = self.transaction_types[:]
+        columns.days = self.days[:]
+        columns.amounts = self.amounts[:]
+        columns.account_ids = self.account_ids[:]
+        columns.account_ordinal_by_id = self.account_ordinal_by_id.copy()
+        columns.row_by_transaction_id = self.row_by_transaction_id.copy()
+        return columns
+
+    def account_ordinal(self, account_id: UUID) -> int:
+        """Return the ordinal of an account, assigning the next one to
+        accounts not seen before"""
+        ordinal = self.account_ordinal_by_id.get(account_id)
+        if ordinal is None:
+            ordinal = len(self.account_ids)
+            self.account_ids.append(account_id)
+            self.account_ordinal_by_id[account_id] = ordinal
+        return ordinal
+
+    def append(self, transaction: Transaction) -> int:
+        """Add a transaction as a new row
+
+        Arguments:
+            transaction {Transaction} -- Transaction to store
+
+        Returns:
+            int -- The row of the transaction
+        """
+        transaction_id = transaction.transaction_id.int
+        self.ids_high.append(transaction_id >> 64)
+        self.ids_low.append(transaction_id & UINT64_MASK)
+        self.account_ordinals.append(self.account_ordinal(transaction.account_id))
+        self.transaction_types.append(
+            TRANSACTION_TYPE_CODES[transaction.transaction_type]
+        )
+        self.days.append(transaction.occurred_on.toordinal())
+        self.amounts.append(transaction.amount.grosz)
+        row = len(self.amounts) - 1
+        self.row_by_transaction_id[transaction_id] = row
+        return row
+
+    def transaction_id(self, row: int) -> UUID:
+        return UUID(int=(self.ids_high[row] << 64) | self.ids_low[row])
+
+    def transaction(self, row: int) -> Transaction:
+        """Build the transaction object stored in a row"""
+        return Transaction(
+            self.account_ids[self.account_ordinals[row]],
+            TRANSACTION_TYPES[self.transaction_types[row]],
+            Money(self.amounts[row]),
+            date.fromordinal(self.days[row]),
+            self.transaction_id(row),
+        )
+
+    def find(self, transaction_id: UUID) -> typing.Optional[int]:
+        """Return the row of a transaction or None if it isn't stored"""
+        return self.row_by_transaction_id.get(transaction_id.int)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the arrays holding the rows"""
+        return sum(
+            column.itemsize * len(column)
+            for column in (
+                self.ids_high,
+                self.ids_low,
+                self.account_ordinals,
+                self.transaction_types,
+                self.days,
+                self.amounts,
+            )
+        )
+
+    def to_bytes(self) -> bytes:
+        """Lay the columns out as a transaction file, see TransactionFile"""
+        chunks = [
+            TransactionFile.HEADER.pack(
+                TransactionFile.MAGIC, len(self), len(self.account_ids)
+            )
+        ]
+        for name, _ in TransactionFile.COLUMNS:
+            column: array = getattr(self, name)
+            if TransactionFile.BYTESWAP:
+                column = column[:]
+                column.byteswap()
+            chunks.append(column.tobytes())
+        size = sum(len(chunk) for chunk in chunks)
+        chunks.append(bytes(-size % 8))
+        chunks += [account_id.bytes for account_id in self.account_ids]
+        return b"".join(chunks)
+
+
+class TransactionFile:
+    """Read only, memory mapped file of transactions in columns.
+
+    After a header holding the number of rows and accounts the file holds
+    the columns of TransactionColumns one after the other as little endian
+    arrays, the 64 bit ones first so every column is aligned, followed by
+    the 16 byte account ids the account ordinals refer to.
+
+    Each column is exposed as a memoryview of the mapped file and, when
+    NumPy is installed, as a NumPy array by `arrays()`, neither copies the
+    file. On big endian hosts the memoryviews are of byteswapped copies of
+    the columns instead. Views handed out must be released before the file
+    is closed.
+    """
+
+    MAGIC = b"BANKTXC1"
+    HEADER = struct.Struct("<8sQQ")
+    COLUMNS = (
+        ("ids_high", "Q"),
+        ("ids_low", "Q"),
+        ("amounts", "q"),
+        ("account_ordinals", "I"),
+        ("days", "I"),
+        ("transaction_types", "B"),
+    )
+    NUMPY_TYPES = {"Q": "<u8", "q": "<i8", "I": "<u4", "B": "u1"}
+    # Columns are read in native byte order
+    BYTESWAP = sys.byteorder != "little"
+
+    def __init__(self, filename: str) -> None:
+        """
+        Arguments:
+            filename {str} -- name of a file written by write_transaction_file
+
+        Raises:
+            LedgerCorruptedError: If the file isn't a complete transaction file
+        """
+        self.filename = filename
+        with open(filename, "rb") as transaction_file:
+            self.data = mmap.mmap(transaction_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.map_columns()
+        except LedgerCorruptedError:
+            self.data.close()
+            raise
+
+    def map_columns(self):
+        if len(self.data) < self.HEADER.size:
+            raise LedgerCorruptedError(f"{self.filename} is not a transaction file")
+        magic, rows, accounts = self.HEADER.unpack_from(self.data)
+        offset = self.HEADER.size
+        self.column_offsets: typing.Dict[str, int] = {}
+        for name, typecode in self.COLUMNS:
+            self.column_offsets[name] = offset
+            offset += rows * struct.calcsize(typecode)
+        offset += -offset % 8
+        if magic != self.MAGIC or len(self.data) != offset + 16 * accounts:
+            raise LedgerCorruptedError(f"{self.filename} is not a transaction file")
+        self.rows = rows
+        self.accounts_offset = offset
+        self.account_count = accounts
+        self.buffer = memoryview(self.data)
+        self.views: typing.Dict[str, memoryview] = {}
+        for name, typecode in self.COLUMNS:
+            start = self.column_offsets[name]
+            end = start + rows * struct.calcsize(typecode)
+            if self.BYTESWAP:
+                column = array(typecode, self.buffer[start:end].tobytes())
+                column.byteswap()
+                self.views[name] = memoryview(column)
+            else:
+                self.views[name] = self.buffer[start:end].cast(typecode)
+        self.ids_high = self.views["ids_high"]
+        self.ids_low = self.views["ids_low"]
+        self.amounts = self.views["amounts"]
+        self.account_ordinals = self.views["account_ordinals"]
+        self.days = self.views["days"]
+        self.transaction_types = self.views["transaction_types"]
+        self._account_ids: typing.Optional[typing.List[UUID]] = None
+        self._account_ordinal_by_id: typing.Optional[typing.Dict[UUID, int]] = None
+
+    def close(self):
+        for view in self.views.values():
+            view.release()
+        self.buffer.release()
+        self.data.close()
+
+    def __enter__(self) -> "TransactionFile":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.rows
+
+    @property
+    def account_ids(self) -> typing.List[UUID]:
+        """Account ids by account ordinal"""
+        if self._account_ids is None:
+            start = self.accounts_offset
+            self._account_ids = [
+                UUID(bytes=bytes(self.buffer[offset : offset + 16]))
+                for offset in range(start, start + 16 * self.account_count, 16)
+            ]
+        return self._account_ids
+
+    @property
+    def account_ordinal_by_id(self) -> typing.Dict[UUID, int]:
+        """Account ordinals by account id"""
+        if self._account_ordinal_by_id is None:
+            self._account_ordinal_by_id = {
+                account_id: ordinal
+                for ordinal, account_id in enumerate(self.account_ids)
+            }
+        return self._account_ordinal_by_id
+
+    def account_ordinal(self, account_id: UUID) -> typing.Optional[int]:
+        """Return the ordinal of an account or None if it has no
+        transactions in the file"""
+        return self.account_ordinal_by_id.get(account_id)
+
+    def transaction_id(self, row: int) -> UUID:
+        return UUID(int=(self.ids_high[row] << 64) | self.ids_low[row])
+
+    def transaction(self, row: int) -> Transaction:
+        """Build the transaction object stored in a row"""
+        return Transaction(
+            self.account_ids[self.account_ordinals[row]],
+            TRANSACTION_TYPES[self.transaction_types[row]],
+            Money(self.amounts[row]),
+            date.fromordinal(self.days[row]),
+            self.transaction_id(row),
+        )
+
+    def select(
+        self,
+        account_id: typing.Optional[UUID] = None,
+        since: typing.Optional[date] = None,
+        until: typing.Optional[date] = None,
+    ) -> typing.Iterator[int]:
+        """Yield the rows matching every given filter, in file order
+
+        Keyword Arguments:
+            account_id {Optional[UUID]} -- only this account's transactions
+            (default: {None})
+            since {Optional[date]} -- first day included (default: {None})
+            until {Optional[date]} -- last day included (default: {None})
+        """
+        rows: typing.Iterable[int] = range(self.rows)
+        if account_id is not None:
+            ordinal = self.account_ordinal(account_id)
+            if ordinal is None:
+                return
+            ordinals = self.account_ordinals
+            rows = (row for row in rows if ordinals[row] == ordinal)
+        if since is not None or until is not None:
+            first = since.toordinal() if since is not None else 0
+            last = until.toordinal() if until is not None else sys.maxsize
+            days = self.days
+            rows = (row for row in rows if first <= days[row] <= last)
+        yield from rows
+
+    def signed_total(self, rows: typing.Optional[typing.Iterable[int]] = None) -> Money:
+        """Sum the amounts of rows, DEBIT amounts negated
+
+        Keyword Arguments:
+            rows {Optional[Iterable[int]]} -- rows to sum, all rows when None
+            (default: {None})
+        """
+        debit = TRANSACTION_TYPE_CODES[Transaction.TransactionType.DEBIT]
+        amounts, types = self.amounts, self.transaction_types
+        if rows is None:
+            rows = range(self.rows)
+        return Money(
+            sum(-amounts[row] if types[row] == debit else amounts[row] for row in rows)
+        )
+
+    def arrays(self) -> typing.Dict[str, typing.Any]:
+        """Return the columns as NumPy arrays sharing the mapped file
+
+        Raises:
+            ImportError: If NumPy isn't installed
+        """
+        import numpy
+
+        return {
+            name: numpy.frombuffer(
+                self.data,
+                dtype=self.NUMPY_TYPES[typecode],
+                count=self.rows,
+                offset=self.column_offsets[name],
+            )
+            for name, typecode in self.COLUMNS
+        }
+
+
+def write_transaction_file(
+    filename: str,
+    transactions: typing.Union[TransactionColumns, typing.Iterable[Transaction]],
+):
+    """Atomically write transactions as a TransactionFile
+
+    Arguments:
+        filename {str} -- name of the file to write
+        transactions {Union[TransactionColumns, Iterable[Transaction]]} --
+        columns or transactions in the order they were stored
+    """
+    if isinstance(transactions, TransactionColumns):
+        columns = transactions
+    else:
+        columns = TransactionColumns()
+        for transaction in transactions:
+            columns.append(transaction)
+    write_atomically(filename, columns.to_bytes())
+
+
+class ColumnarLedger(Ledger):
+    """Ledger that keeps it's transactions in TransactionColumns instead
+    of as Transaction objects.
+
+    The columns are persisted in the store under "columns" and the per
+    account index holds row numbers. Transaction objects are only built
+    when they are read eg. to display them.
+
+    With `transaction_file` the columns are also written to a
+    TransactionFile next to the ledger file on every persist, for reports
+    that scan every transaction.
+    """
+
+    TRANSACTION_FILE_SUFFIX = ".transactions"
+
+    def __init__(
+        self, filename: str, transaction_file: bool = False, **ledger_options
+    ) -> None:
+        """
+        Arguments:
+            filename {str} -- name of the ledger file
+
+        Keyword Arguments:
+            transaction_file {bool} -- keep a TransactionFile of the columns
+            up to date. The file is rewritten whole on every persist, which
+            costs O(n) in the number of transactions like the ledger file
+            itself (default: {False})
+            ledger_options -- durability options, see Ledger
+        """
+        if ledger_options.get("serializer", "pickle") != "pickle":
+            raise ValueError("The columnar ledger's columns are only pickled")
+        super().__init__(filename, **ledger_options)
+        self.transaction_filename = (
+            filename + self.TRANSACTION_FILE_SUFFIX if transaction_file else None
+        )
+        self.rows_by_account: typing.Dict[UUID, array] = {}
+
+    @staticmethod
+    def empty_store():
+        store = Ledger.empty_store()
+        store["columns"] = TransactionColumns()  # type: ignore
+        return store
+
+    @property
+    def columns(self) -> TransactionColumns:
+        return self.store["columns"]  # type: ignore
+
+    def save_to_store(self, obj: typing.Union[BankAccount, Transaction]):
+        if isinstance(obj, Transaction):
+            row = self.columns.append(obj)
+            self.index_row(obj, row)
+        else:
+            super().save_to_store(obj)
+
+    def persist(self):
+        super().persist()
+        if self.transaction_filename is not None:
+            with self.store_lock:
+                data = self.columns.to_bytes()
+            write_atomically(self.transaction_filename, data)
+            self.bytes_written += len(data)
+
+    def sync(self):
+        super().sync()
+        if self.transaction_filename is not None:
+            sync_directory(self.transaction_filename)
+
+    def open_transaction_file(self) -> TransactionFile:
+        """Map the transaction file, written by the last flush
+
+        Raises:
+            ValueError: If the ledger doesn't keep a transaction file
+        """
+        if self.transaction_filename is None:
+            raise ValueError("The ledger doesn't keep a transaction file")
+        return TransactionFile(self.transaction_filename)
+
+    def index_row(self, transaction: Transaction, row: int):
+        """Add a row to the per account index and apply it's transaction
+        to the running balance and withdrawal totals"""
+        rows = self.rows_by_account.get(transaction.account_id)
+        if rows is None:
+            rows = self.rows_by_account[transaction.account_id] = array("I")
+        rows.append(row)
+        self.aggregate_transaction(transaction)
+
+    def build_indexes(self):
+        if "columns" not in self.store:
+            # Ledger file written by the pickle backend
+            columns = TransactionColumns()
+            for transaction in self.store["transactions"].values():
+                columns.append(transaction)
+            self.store["transactions"].clear()
+            self.store["columns"] = columns  # type: ignore
+        super().build_indexes()
+        self.index_columns()
+
+    def index_columns(self):
+        """Build the per account index, running balances and daily
+        withdrawal totals from the columns in one pass without building
+        Transaction objects. The totals are the ones index_row would add
+        up row by row."""
+        columns = self.columns
+        account_ids = columns.account_ids
+        rows_by_ordinal = [array("I") for _ in account_ids]
+        balances = [0] * len(account_ids)
+        debit = TRANSACTION_TYPE_CODES[Transaction.TransactionType.DEBIT]
+        debit_rows = array("I")
+        for row, (ordinal, code, amount) in enumerate(
+            zip(columns.account_ordinals, columns.transaction_types, columns.amounts)
+        ):
+            rows_by_ordinal[ordinal].append(row)
+            if code == debit:
+                balances[ordinal] -= amount
+                debit_rows.append(row)
+            else:
+                balances[ordinal] += amount
+        self.rows_by_account = {
+            account_id: rows_by_ordinal[ordinal]
+            for ordinal, account_id in enumerate(account_ids)
+        }
+        self.balances = {
+            account_id: balances[ordinal]
+            for ordinal, account_id in enumerate(account_ids)
+        }
+        if not debit_rows:
+            return
+        # Only the days in the withdrawal window ending on the last day
+        # withdrawn from are kept, see index_withdrawal
+        ordinals, days, amounts = (
+            columns.account_ordinals,
+            columns.days,
+            columns.amounts,
+        )
+        last_day = max(days[row] for row in debit_rows)
+        self.withdrawals_since = date.fromordinal(last_day) - timedelta(
+            days=self.WITHDRAWAL_WINDOW_DAYS - 1
+        )
+        first_day = self.withdrawals_since.toordinal()
+        withdrawals: typing.Dict[typing.Tuple[int, int], int] = {}
+        for row in debit_rows:
+            if days[row] >= first_day:
+                key = (ordinals[row], days[row])
+                withdrawals[key] = withdrawals.get(key, 0) + amounts[row]
+        self.withdrawals = {
+            (account_ids[ordinal], date.fromordinal(day)): amount
+            for (ordinal, day), amount in withdrawals.items()
+        }
+
+    def all_transaction_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        columns = self.columns
+        return (columns.transaction_id(row) for row in range(len(columns)))
+
+    def all_transactions(self) -> typing.Iterator[Transaction]:
+        columns = self.columns
+        return (columns.transaction(row) for row in range(len(columns)))
+
+    def find_transactions(
+        self,
+        account_id: typing.Optional[UUID] = None,
+        since: typing.Optional[date] = None,
+        until: typing.Optional[date] = None,
+    ) -> typing.Iterator[Transaction]:
+        """Transactions are filtered on the days column and only the
+        matching rows are built, see Ledger.find_transactions"""
+        columns = self.columns
+        with self.store_lock:
+            if account_id is None:
+                rows: typing.Iterable[int] = range(len(columns))
+            else:
+                rows = self.rows_by_account.get(account_id, array("I"))[:]
+        if since is not None or until is not None:
+            first = since.toordinal() if since is not None else 0
+            last = until.toordinal() if until is not None else sys.maxsize
+            days = columns.days
+            rows = (row for row in rows if first <= days[row] <= last)
+        return (columns.transaction(row) for row in rows)
+
+    def get_transaction(self, transaction_id: UUID) -> typing.Optional[Transaction]:
+        row = self.columns.find(transaction_id)
+        return self.columns.transaction(row) if row is not None else None
+
+    def get_account_transactions(self, account_id: UUID) -> typing.List[Transaction]:
+        rows = self.rows_by_account.get(account_id, ())
+        return [self.columns.transaction(row) for row in rows]
+
+    @property
+    def is_empty(self) -> bool:
+        return len(self.store["accounts"]) == 0 and len(self.columns) == 0
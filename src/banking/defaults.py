@@ -0,0 +1,8 @@
+"""Defaults shared by the ledger backends and the command line, kept apart
+from the backends so the command line can use them without importing them"""
+
+# Shards of a new sharded ledger
+DEFAULT_SHARDS = 16
+
+# Backends a ledger can be opened with, see Application.LEDGER_BACKEND_CLASS_MAPPING
+LEDGER_BACKENDS = ("pickle", "journal", "sqlite", "columnar", "sharded", "lazy")
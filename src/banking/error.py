@@ -2,6 +2,11 @@ class AccountError(Exception):
     """Base class for all account errors"""
 
 
+class InvalidAmountError(AccountError):
+    """Raised when trying to deposit or withdraw an amount that isn't
+    positive or isn't a number of zloty at all eg. NaN"""
+
+
 class InsufficientFundError(AccountError):
     """Raised when trying to withdrw more than available balance"""
 
@@ -23,3 +28,17 @@ class ATMWithdrawalNotAllowedError(AccountError):
 class AccountNotFoundError(AccountError):
     """Raised when trying to perform action a non-existing or deleted account
     """
+
+
+class LedgerError(Exception):
+    """Base class for all ledger errors"""
+
+
+class LedgerCorruptedError(LedgerError):
+    """Raised when a ledger file fails it's integrity checks and can't be
+    loaded"""
+
+
+class RemoteError(Exception):
+    """Raised by the banking server client when the server rejects a request
+    or the connection to it fails"""
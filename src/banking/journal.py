@@ -0,0 +1,408 @@
+import os
+import pickle
+import struct
+import typing
+import zlib
+from uuid import UUID
+
+from banking.account import BankAccount, Transaction
+from banking.error import LedgerCorruptedError
+from banking.ledger import (
+    Ledger,
+    pack_checked,
+    sync_directory,
+    unpack_checked,
+    write_atomically,
+)
+from banking.money import Money
+
+RecordType = typing.Tuple[str, typing.Any]
+
+ACCOUNT_RECORD = "account"
+TRANSACTION_RECORD = "transaction"
+CLOSE_ACCOUNT_RECORD = "close"
+RECORD_KINDS = (ACCOUNT_RECORD, TRANSACTION_RECORD, CLOSE_ACCOUNT_RECORD)
+
+
+class JournalLedger(Ledger):
+    """Ledger persisted as an append-only journal.
+
+    Every saved account, transaction and account closure is appended
+    to the journal file as a single record prefixed with it's length and
+    CRC32 instead of re-pickling the whole store on each write. Loading
+    the ledger replays the journal from the start.
+
+    A checkpoint writes a snapshot of the accounts, running balances and
+    recent withdrawal totals together with the journal offset it covers.
+    Loading then restores the snapshot and replays only the journal tail
+    written after it. The transactions covered by the snapshot are read
+    back from the journal the first time something needs them.
+    """
+
+    JOURNAL_MAGIC = b"BANKJNL1"
+    RECORD_HEADER = struct.Struct(">II")
+    # Journals written before records were checksummed have no magic and
+    # prefix records with their length only
+    LEGACY_RECORD_HEADER = struct.Struct(">I")
+    SNAPSHOT_SUFFIX = ".snapshot"
+
+    def __init__(
+        self,
+        filename: str,
+        checkpoint_every_records: typing.Optional[int] = None,
+        checkpoint_every_bytes: typing.Optional[int] = None,
+        **ledger_options,
+    ) -> None:
+        """
+        Arguments:
+            filename {str} -- name of the journal file
+
+        Keyword Arguments:
+            checkpoint_every_records {Optional[int]} -- checkpoint once this many
+            records have been appended since the last one (default: {None})
+            checkpoint_every_bytes {Optional[int]} -- checkpoint once this many
+            bytes have been appended since the last one (default: {None})
+            ledger_options -- durability options, see Ledger
+        """
+        if ledger_options.get("serializer", "pickle") != "pickle":
+            raise ValueError("The journal's records and snapshots are only pickled")
+        super().__init__(filename, **ledger_options)
+        self.snapshot_filename = filename + self.SNAPSHOT_SUFFIX
+        self.checkpoint_every_records = checkpoint_every_records
+        self.checkpoint_every_bytes = checkpoint_every_bytes
+        self.pending_records: typing.List[RecordType] = []
+        self.journal_size = 0
+        self.records_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
+        self.history_loaded = True
+
+    def save_to_store(self, obj: typing.Union[BankAccount, Transaction]):
+        super().save_to_store(obj)
+        if isinstance(obj, BankAccount):
+            self.pending_records.append((ACCOUNT_RECORD, (obj.account_id, type(obj))))
+        else:
+            self.pending_records.append((TRANSACTION_RECORD, obj))
+
+    def remove_from_store(self, account_id: UUID):
+        super().remove_from_store(account_id)
+        self.pending_records.append((CLOSE_ACCOUNT_RECORD, account_id))
+
+    def persist(self):
+        """Append the records saved since the last persist to the journal
+        and checkpoint if one of the checkpoint triggers is reached"""
+        if self.append_records() and self.checkpoint_due:
+            self.checkpoint()
+
+    def append_records(self) -> bool:
+        """Append the records saved since the last append to the journal
+
+        Returns:
+            bool -- False if there were no records to append
+        """
+        with self.store_lock:
+            records, self.pending_records = self.pending_records, []
+        if not records:
+            return False
+        chunks = [self.JOURNAL_MAGIC] if self.journal_size == 0 else []
+        offsets = []
+        offset = self.journal_size + sum(len(chunk) for chunk in chunks)
+        for record in records:
+            chunk = self.encode_record(record)
+            chunks.append(chunk)
+            offsets.append(offset)
+            offset += len(chunk)
+        data = b"".join(chunks)
+        with open(self.filename, "ab") as journal:
+            journal.write(data)
+        self.journal_size += len(data)
+        self.bytes_written += len(data)
+        for record, offset in zip(records, offsets):
+            self.record_written(record, offset)
+        self.records_since_checkpoint += len(records)
+        self.bytes_since_checkpoint += len(data)
+        return True
+
+    def sync(self):
+        """Force the appended journal records to disk"""
+        with open(self.filename, "rb") as journal:
+            os.fsync(journal.fileno())
+
+    @property
+    def checkpoint_due(self) -> bool:
+        """Returns True if a checkpoint trigger has been reached"""
+        return (
+            self.checkpoint_every_records is not None
+            and self.records_since_checkpoint >= self.checkpoint_every_records
+        ) or (
+            self.checkpoint_every_bytes is not None
+            and self.bytes_since_checkpoint >= self.checkpoint_every_bytes
+        )
+
+    def checkpoint(self):
+        """Persist pending records and write a snapshot of the current state
+        that covers the whole journal"""
+        with self.flush_lock:
+            self.flush()
+            with self.store_lock:
+                # The snapshot covers records saved since the flush too so
+                # they have to be in the journal before it's offset
+                self.append_records()
+                snapshot = {
+                    "offset": self.journal_size,
+                    "accounts": self.store["accounts"].copy(),
+                    "balances": self.balances.copy(),
+                    "withdrawals": self.withdrawals.copy(),
+                    "withdrawals_since": self.withdrawals_since,
+                }
+            self.write_snapshot(snapshot)
+
+    def write_snapshot(self, snapshot: dict):
+        payload = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        data = pack_checked(payload)
+        write_atomically(self.snapshot_filename, data)
+        self.bytes_written += len(data)
+        if self.durability != "os":
+            sync_directory(self.snapshot_filename)
+        self.records_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
+
+    def load(self):
+        """Restore the latest snapshot if there's one and replay the
+        journal written after it"""
+        self.pending_records = []
+        self.records_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
+        snapshot = self.read_snapshot()
+        if snapshot is None:
+            self.replay(0)
+            return
+        self.store = self.empty_store()
+        self.build_indexes()
+        self.store["accounts"] = snapshot["accounts"]
+        self.balances = snapshot["balances"]
+        self.withdrawals = snapshot["withdrawals"]
+        self.withdrawals_since = snapshot["withdrawals_since"]
+        self.history_loaded = snapshot["offset"] == 0
+        self.replay_records(snapshot["offset"])
+
+    def read_snapshot(self) -> typing.Optional[dict]:
+        """Read the snapshot or return None if there's no usable snapshot
+        for the journal"""
+        try:
+            with open(self.snapshot_filename, "rb") as snapshot_file:
+                snapshot = pickle.loads(unpack_checked(snapshot_file.read()))
+        except (OSError, LedgerCorruptedError):
+            return None
+        if snapshot["offset"] > os.path.getsize(self.filename):
+            return None
+        return snapshot
+
+    def replay(self, offset: int):
+        """Rebuild accounts and transactions by replaying the journal"""
+        self.store = self.empty_store()
+        self.build_indexes()
+        self.history_loaded = offset == 0
+        self.replay_records(offset)
+
+    def replay_records(self, offset: int):
+        """Apply every record of the journal from offset onwards and cut off
+        a record left incomplete by a crash so new records can follow.
+
+        A journal written before records were checksummed is converted to
+        the current format first.
+
+        Raises:
+            LedgerCorruptedError: If the file isn't a journal or a record
+            before the end of the journal is damaged
+        """
+        if offset == 0 and self.is_legacy_journal():
+            self.convert_legacy_journal()
+        with open(self.filename, "rb+") as journal:
+            journal.seek(offset)
+            if offset == 0:
+                if journal.read(len(self.JOURNAL_MAGIC)) == self.JOURNAL_MAGIC:
+                    offset = journal.tell()
+            for record, end in self.read_records(journal):
+                self.apply_record(record)
+                self.record_written(record, offset)
+                offset = end
+            journal.truncate(offset)
+        self.journal_size = offset
+
+    def is_legacy_journal(self) -> bool:
+        """Returns True if the journal doesn't start with JOURNAL_MAGIC and
+        isn't a magic cut short by a crash either"""
+        with open(self.filename, "rb") as journal:
+            magic = journal.read(len(self.JOURNAL_MAGIC))
+        return bool(magic) and not self.JOURNAL_MAGIC.startswith(magic)
+
+    def convert_legacy_journal(self):
+        """Rewrite a journal written before records were checksummed in the
+        current format, dropping a last record cut short by a crash
+
+        Raises:
+            LedgerCorruptedError: If the file isn't a journal
+        """
+        with open(self.filename, "rb") as journal:
+            data = journal.read()
+        chunks = [self.JOURNAL_MAGIC]
+        header_size = self.LEGACY_RECORD_HEADER.size
+        offset = 0
+        while offset + header_size <= len(data):
+            (length,) = self.LEGACY_RECORD_HEADER.unpack_from(data, offset)
+            end = offset + header_size + length
+            if end > len(data):
+                break
+            try:
+                record = pickle.loads(data[offset + header_size : end])
+            except Exception:
+                record = None
+            if not (
+                isinstance(record, tuple)
+                and len(record) == 2
+                and record[0] in RECORD_KINDS
+            ):
+                raise LedgerCorruptedError(
+                    f"Ledger file {self.filename} is not a journal"
+                )
+            chunks.append(self.encode_record(record))
+            offset = end
+        if offset == 0:
+            raise LedgerCorruptedError(f"Ledger file {self.filename} is not a journal")
+        converted = b"".join(chunks)
+        write_atomically(self.filename, converted)
+        sync_directory(self.filename)
+        self.bytes_written += len(converted)
+
+    def load_history(self):
+        """Read the transactions covered by the snapshot back from the journal"""
+        if self.history_loaded:
+            return
+        with self.flush_lock, self.store_lock:
+            if self.history_loaded:
+                return
+            self.append_records()
+            # Replayed aside and swapped in so readers that take no lock
+            # never see half rebuilt balances
+            history = JournalLedger(self.filename)
+            history.replay(0)
+            self.store = history.store
+            self.transactions_by_account = history.transactions_by_account
+            self.balances = history.balances
+            self.withdrawals = history.withdrawals
+            self.withdrawals_since = history.withdrawals_since
+            self.history_loaded = True
+
+    def apply_record(self, record: RecordType):
+        kind, value = record
+        if kind == ACCOUNT_RECORD:
+            account_id, account_class = value
+            self.store["accounts"][account_id] = account_class
+        elif kind == TRANSACTION_RECORD:
+            self.store["transactions"][value.transaction_id] = value
+            self.index_transaction(value)
+        elif kind == CLOSE_ACCOUNT_RECORD:
+            self.store["accounts"].pop(value, None)
+        else:
+            raise Exception(f"Programming Error: Invalid journal record {kind}")
+
+    def record_written(self, record: RecordType, offset: int):
+        """Called with every record appended to or replayed from the journal
+        and the offset it starts at"""
+
+    def encode_record(self, record: RecordType) -> bytes:
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        return self.RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def read_records(
+        self, journal: typing.BinaryIO
+    ) -> typing.Iterator[typing.Tuple[RecordType, int]]:
+        """Read records from the journal until it's end, yielding each
+        record with the offset right after it.
+
+        The last record is ignored if it was cut short or garbled by a crash
+        while it was being appended.
+
+        Raises:
+            LedgerCorruptedError: If a record before the last one fails it's
+            checksum
+        """
+        journal_end = os.fstat(journal.fileno()).st_size
+        header_size = self.RECORD_HEADER.size
+        while True:
+            start = journal.tell()
+            header = journal.read(header_size)
+            if len(header) < header_size:
+                return
+            length, checksum = self.RECORD_HEADER.unpack(header)
+            payload = journal.read(length)
+            if len(payload) < length:
+                return
+            if zlib.crc32(payload) != checksum:
+                if journal.tell() == journal_end:
+                    return
+                raise LedgerCorruptedError(
+                    f"Journal record at offset {start} failed it's checksum"
+                )
+            yield pickle.loads(payload), journal.tell()
+
+    def all_transaction_ids(self) -> typing.List[UUID]:
+        self.load_history()
+        return super().all_transaction_ids()
+
+    def all_transactions(self) -> typing.Iterable[Transaction]:
+        self.load_history()
+        return super().all_transactions()
+
+    def get_transaction(self, transaction_id: UUID) -> typing.Optional[Transaction]:
+        transaction = super().get_transaction(transaction_id)
+        if transaction is None and not self.history_loaded:
+            self.load_history()
+            transaction = super().get_transaction(transaction_id)
+        return transaction
+
+    def get_account_transactions(self, account_id: UUID) -> typing.List[Transaction]:
+        self.load_history()
+        return super().get_account_transactions(account_id)
+
+    def verify_balances(self) -> typing.Dict[UUID, typing.Tuple[Money, Money]]:
+        self.load_history()
+        return super().verify_balances()
+
+    @property
+    def is_empty(self) -> bool:
+        return self.journal_size == 0 and not self.pending_records
+
+    def import_ledger(self, ledger: Ledger):
+        """Append all accounts and transactions of another ledger to this
+        journal.
+
+        Arguments:
+            ledger {Ledger} -- A loaded ledger to copy from
+        """
+        objs: typing.List[typing.Union[BankAccount, Transaction]] = [
+            account_class(account_id)
+            for account_id, account_class in ledger.store["accounts"].items()
+        ]
+        objs.extend(ledger.all_transactions())
+        self.save(objs)
+        self.flush()
+
+
+def migrate_from_pickle(pickle_filename: str, journal_filename: str) -> JournalLedger:
+    """Convert a pickled ledger into a new journal
+
+    Arguments:
+        pickle_filename {str} -- name of the existing pickled ledger eg. ledger.pkl
+        journal_filename {str} -- name of the journal to create
+
+    Returns:
+        JournalLedger -- The journal ledger holding the migrated store
+    """
+    source = Ledger(pickle_filename)
+    source.load()
+    with open(journal_filename, "wb"):
+        pass
+    journal = JournalLedger(journal_filename)
+    journal.import_ledger(source)
+    return journal
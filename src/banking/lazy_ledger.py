@@ -0,0 +1,552 @@
+import mmap
+import os
+import pickle
+import struct
+import typing
+import zlib
+from collections import OrderedDict, defaultdict
+from datetime import date
+from uuid import UUID
+
+from banking.account import ACCOUNT_TYPE_CLASS_MAPPING, BankAccount, Transaction
+from banking.error import LedgerCorruptedError
+from banking.journal import (
+    ACCOUNT_RECORD,
+    CLOSE_ACCOUNT_RECORD,
+    TRANSACTION_RECORD,
+    JournalLedger,
+    RecordType,
+)
+from banking.ledger import AccountSummaryType, sync_directory, write_atomically
+from banking.money import Money
+
+# Account classes are stored in the index by their position in this list
+ACCOUNT_CLASSES: typing.List[typing.Type[BankAccount]] = list(
+    ACCOUNT_TYPE_CLASS_MAPPING.values()
+)
+ACCOUNT_CLASS_CODES: typing.Dict[typing.Type[BankAccount], int] = {
+    account_class: code for code, account_class in enumerate(ACCOUNT_CLASSES)
+}
+
+AccountEntryType = typing.Tuple[typing.Type[BankAccount], typing.List[int]]
+
+
+class JournalIndex:
+    """Read only view of a journal index file.
+
+    The file starts with a header holding the journal offset the index
+    covers and the number of accounts and transactions, followed by
+
+    - account rows sorted by account id: the account id, it's class code and
+      the position and number of it's transaction offsets
+    - transaction rows sorted by transaction id: the transaction id and the
+      journal offset of it's record
+    - the journal offsets of every account's transactions, grouped by
+      account in the order they were stored
+
+    Rows have a fixed width so entries are found by binary search and the
+    file is memory mapped, opening it doesn't depend on it's size.
+    """
+
+    MAGIC = b"BANKIDX1"
+    HEADER = struct.Struct(">8sQQQ")
+    ACCOUNT_ROW = struct.Struct(">16sBQQ")
+    TRANSACTION_ROW = struct.Struct(">16sQ")
+    OFFSET = struct.Struct(">Q")
+
+    def __init__(self, data: typing.Union[bytes, mmap.mmap]) -> None:
+        """
+        Raises:
+            LedgerCorruptedError: If data isn't an index
+        """
+        if len(data) < self.HEADER.size:
+            raise LedgerCorruptedError("Journal index header is incomplete")
+        magic, covered, accounts, transactions = self.HEADER.unpack_from(data)
+        self.transactions_start = self.HEADER.size + accounts * self.ACCOUNT_ROW.size
+        self.offsets_start = (
+            self.transactions_start + transactions * self.TRANSACTION_ROW.size
+        )
+        if magic != self.MAGIC or len(data) < self.offsets_start:
+            raise LedgerCorruptedError("Journal index is damaged")
+        self.data = data
+        self.covered_offset = covered
+        self.account_count = accounts
+        self.transaction_count = transactions
+
+    @classmethod
+    def open(cls, filename: str) -> "JournalIndex":
+        with open(filename, "rb") as index_file:
+            data = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(data)
+        except LedgerCorruptedError:
+            data.close()
+            raise
+
+    @classmethod
+    def empty(cls) -> "JournalIndex":
+        return cls(cls.HEADER.pack(cls.MAGIC, 0, 0, 0))
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def find_row(self, start: int, count: int, size: int, key: bytes) -> int:
+        """Return the position of the row starting with key or -1"""
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            row_key = self.data[start + middle * size : start + middle * size + 16]
+            if row_key < key:
+                low = middle + 1
+            elif row_key > key:
+                high = middle
+            else:
+                return middle
+        return -1
+
+    def find_account(self, account_id: UUID) -> typing.Optional[AccountEntryType]:
+        """Return the class of an account and the journal offsets of it's
+        transactions or None if the index doesn't have the account"""
+        size = self.ACCOUNT_ROW.size
+        row = self.find_row(
+            self.HEADER.size, self.account_count, size, account_id.bytes
+        )
+        if row < 0:
+            return None
+        _, code, first, count = self.ACCOUNT_ROW.unpack_from(
+            self.data, self.HEADER.size + row * size
+        )
+        return ACCOUNT_CLASSES[code], self.account_offsets(first, count)
+
+    def account_offsets(self, first: int, count: int) -> typing.List[int]:
+        start = self.offsets_start + first * self.OFFSET.size
+        return list(struct.unpack_from(f">{count}Q", self.data, start))
+
+    def find_transaction(self, transaction_id: UUID) -> typing.Optional[int]:
+        """Return the journal offset of a transaction or None"""
+        size = self.TRANSACTION_ROW.size
+        row = self.find_row(
+            self.transactions_start, self.transaction_count, size, transaction_id.bytes
+        )
+        if row < 0:
+            return None
+        return self.TRANSACTION_ROW.unpack_from(
+            self.data, self.transactions_start + row * size
+        )[1]
+
+    def accounts(self) -> typing.Iterator[typing.Tuple[UUID, AccountEntryType]]:
+        """Iterate over the accounts of the index in account id order"""
+        for row in range(self.account_count):
+            account_id, code, first, count = self.ACCOUNT_ROW.unpack_from(
+                self.data, self.HEADER.size + row * self.ACCOUNT_ROW.size
+            )
+            yield UUID(bytes=account_id), (
+                ACCOUNT_CLASSES[code],
+                self.account_offsets(first, count),
+            )
+
+    def account_ids(self) -> typing.Iterator[UUID]:
+        for row in range(self.account_count):
+            start = self.HEADER.size + row * self.ACCOUNT_ROW.size
+            yield UUID(bytes=bytes(self.data[start : start + 16]))
+
+    def transaction_rows(self) -> typing.List[typing.Tuple[bytes, int]]:
+        size = self.TRANSACTION_ROW.size
+        return [
+            self.TRANSACTION_ROW.unpack_from(
+                self.data, self.transactions_start + row * size
+            )
+            for row in range(self.transaction_count)
+        ]
+
+    @classmethod
+    def pack(
+        cls,
+        covered_offset: int,
+        accounts: typing.Dict[UUID, AccountEntryType],
+        transactions: typing.List[typing.Tuple[bytes, int]],
+    ) -> bytes:
+        """Build the contents of an index file
+
+        Arguments:
+            covered_offset {int} -- journal offset the index covers
+            accounts {Dict[UUID, AccountEntryType]} -- classes and transaction
+            offsets of the open accounts
+            transactions {List[Tuple[bytes, int]]} -- transaction ids as bytes
+            and their offsets
+        """
+        chunks = [
+            cls.HEADER.pack(cls.MAGIC, covered_offset, len(accounts), len(transactions))
+        ]
+        offsets: typing.List[int] = []
+        for account_id in sorted(accounts, key=lambda account_id: account_id.bytes):
+            account_class, account_offsets = accounts[account_id]
+            chunks.append(
+                cls.ACCOUNT_ROW.pack(
+                    account_id.bytes,
+                    ACCOUNT_CLASS_CODES[account_class],
+                    len(offsets),
+                    len(account_offsets),
+                )
+            )
+            offsets += account_offsets
+        chunks += [cls.TRANSACTION_ROW.pack(*row) for row in sorted(transactions)]
+        chunks.append(struct.pack(f">{len(offsets)}Q", *offsets))
+        return b"".join(chunks)
+
+
+class LazyJournalLedger(JournalLedger):
+    """Journal ledger that loads accounts on demand.
+
+    A checkpoint writes an index of the journal (see JournalIndex) instead
+    of a snapshot. Loading the ledger maps the index and replays only the
+    journal written after it, so it takes the same time however big the
+    ledger is. An account's history is read from the journal the first
+    time the account is used and at most `max_resident_accounts` histories
+    stay in memory, the least recently used are dropped first.
+
+    Running balances and withdrawal totals are only kept for the accounts
+    in memory. Listing every account or transaction reads the whole index
+    or journal.
+    """
+
+    INDEX_SUFFIX = ".index"
+    DEFAULT_CHECKPOINT_EVERY_RECORDS = 10000
+
+    def __init__(
+        self,
+        filename: str,
+        max_resident_accounts: int = 1000,
+        checkpoint_every_records: typing.Optional[
+            int
+        ] = DEFAULT_CHECKPOINT_EVERY_RECORDS,
+        **ledger_options,
+    ) -> None:
+        """
+        Arguments:
+            filename {str} -- name of the journal file
+
+        Keyword Arguments:
+            max_resident_accounts {int} -- account histories kept in memory
+            (default: {1000})
+            checkpoint_every_records {Optional[int]} -- records appended
+            between index rebuilds, the records after the index are replayed
+            on load (default: {DEFAULT_CHECKPOINT_EVERY_RECORDS})
+            ledger_options -- checkpoint and durability options, see
+            JournalLedger
+        """
+        if max_resident_accounts < 1:
+            raise ValueError("At least one account has to fit in memory")
+        super().__init__(
+            filename,
+            checkpoint_every_records=checkpoint_every_records,
+            **ledger_options,
+        )
+        self.index_filename = filename + self.INDEX_SUFFIX
+        self.max_resident_accounts = max_resident_accounts
+        self.index = JournalIndex.empty()
+        self.journal_reader: typing.Optional[typing.BinaryIO] = None
+        self.resident: typing.OrderedDict[UUID, None] = OrderedDict()
+        self.reset_tail()
+
+    def reset_tail(self):
+        """Forget the records after the index once they are indexed"""
+        # Records saved after the index, as objects
+        self.tail_accounts: typing.Dict[UUID, typing.Type[BankAccount]] = {}
+        self.closed_accounts: typing.Set[UUID] = set()
+        self.tail_transactions: typing.Dict[UUID, Transaction] = {}
+        self.tail_by_account: typing.DefaultDict[UUID, typing.List[Transaction]] = (
+            defaultdict(list)
+        )
+        # and the offsets of the ones written to the journal
+        self.tail_offsets: typing.DefaultDict[UUID, typing.List[int]] = defaultdict(
+            list
+        )
+        self.tail_transaction_rows: typing.List[typing.Tuple[bytes, int]] = []
+
+    def load(self):
+        """Map the index and replay the journal written after it. The index
+        is rebuilt from the whole journal if it's missing or damaged."""
+        self.pending_records = []
+        self.records_since_checkpoint = 0
+        self.bytes_since_checkpoint = 0
+        self.store = self.empty_store()
+        self.build_indexes()
+        self.resident = OrderedDict()
+        self.reset_tail()
+        self.close_index()
+        try:
+            self.index = JournalIndex.open(self.index_filename)
+            if self.index.covered_offset > os.path.getsize(self.filename):
+                raise LedgerCorruptedError("Journal index is ahead of the journal")
+        except (OSError, LedgerCorruptedError):
+            self.close_index()
+            self.index = JournalIndex.empty()
+        self.replay_records(self.index.covered_offset)
+
+    def close_index(self):
+        self.index.close()
+        if self.journal_reader is not None:
+            self.journal_reader.close()
+            self.journal_reader = None
+
+    def apply_record(self, record: RecordType):
+        kind, value = record
+        if kind == ACCOUNT_RECORD:
+            account_id, account_class = value
+            self.tail_accounts[account_id] = account_class
+            self.closed_accounts.discard(account_id)
+        elif kind == TRANSACTION_RECORD:
+            self.tail_transactions[value.transaction_id] = value
+            self.tail_by_account[value.account_id].append(value)
+        elif kind == CLOSE_ACCOUNT_RECORD:
+            self.tail_accounts.pop(value, None)
+            self.closed_accounts.add(value)
+        else:
+            raise Exception(f"Programming Error: Invalid journal record {kind}")
+
+    def record_written(self, record: RecordType, offset: int):
+        kind, value = record
+        if kind == TRANSACTION_RECORD:
+            self.tail_offsets[value.account_id].append(offset)
+            self.tail_transaction_rows.append((value.transaction_id.bytes, offset))
+
+    def checkpoint(self):
+        """Persist pending records and rebuild the index so it covers the
+        whole journal"""
+        with self.flush_lock:
+            self.flush()
+            with self.store_lock:
+                self.append_records()
+                accounts = {
+                    account_id: entry
+                    for account_id, entry in self.index.accounts()
+                    if account_id not in self.closed_accounts
+                }
+                for account_id, account_class in self.tail_accounts.items():
+                    accounts[account_id] = (account_class, [])
+                for account_id, offsets in self.tail_offsets.items():
+                    if account_id in accounts:
+                        accounts[account_id][1].extend(offsets)
+                transactions = self.index.transaction_rows()
+                transactions += self.tail_transaction_rows
+                data = JournalIndex.pack(self.journal_size, accounts, transactions)
+                write_atomically(self.index_filename, data)
+                self.bytes_written += len(data)
+                if self.durability != "os":
+                    sync_directory(self.index_filename)
+                self.close_index()
+                self.index = JournalIndex.open(self.index_filename)
+                self.reset_tail()
+            self.records_since_checkpoint = 0
+            self.bytes_since_checkpoint = 0
+
+    def read_record(self, offset: int) -> RecordType:
+        """Read the journal record starting at offset
+
+        Raises:
+            LedgerCorruptedError: If the record fails it's checksum
+        """
+        if self.journal_reader is None:
+            self.journal_reader = open(self.filename, "rb")
+        self.journal_reader.seek(offset)
+        length, checksum = self.RECORD_HEADER.unpack(
+            self.journal_reader.read(self.RECORD_HEADER.size)
+        )
+        payload = self.journal_reader.read(length)
+        if zlib.crc32(payload) != checksum:
+            raise LedgerCorruptedError(
+                f"Journal record at offset {offset} failed it's checksum"
+            )
+        return pickle.loads(payload)
+
+    def find_account(self, account_id: UUID) -> typing.Optional[AccountEntryType]:
+        """Return the class and indexed transaction offsets of an open
+        account or None"""
+        if account_id in self.closed_accounts:
+            return None
+        if account_id in self.tail_accounts:
+            return self.tail_accounts[account_id], []
+        return self.index.find_account(account_id)
+
+    def make_resident(self, account_id: UUID) -> bool:
+        """Read an account's history into memory unless it's there already,
+        dropping the least recently used histories over the limit
+
+        Returns:
+            bool -- False if the account doesn't exist or is closed
+        """
+        with self.store_lock:
+            if account_id in self.resident:
+                self.resident.move_to_end(account_id)
+                return True
+            entry = self.find_account(account_id)
+            if entry is None:
+                return False
+            account_class, offsets = entry
+            self.store["accounts"][account_id] = account_class
+            for offset in offsets:
+                _, transaction = self.read_record(offset)
+                self.add_transaction(transaction)
+            for transaction in self.tail_by_account.get(account_id, []):
+                self.add_transaction(transaction)
+            self.add_resident(account_id)
+            return True
+
+    def add_resident(self, account_id: UUID):
+        self.resident[account_id] = None
+        while len(self.resident) > self.max_resident_accounts:
+            self.evict(next(iter(self.resident)))
+
+    def add_transaction(self, transaction: Transaction):
+        self.store["transactions"][transaction.transaction_id] = transaction
+        self.index_transaction(transaction)
+
+    def evict(self, account_id: UUID):
+        """Drop an account's history from memory"""
+        self.resident.pop(account_id, None)
+        self.store["accounts"].pop(account_id, None)
+        for transaction in self.transactions_by_account.pop(account_id, []):
+            self.store["transactions"].pop(transaction.transaction_id, None)
+        self.balances.pop(account_id, None)
+        for key in [key for key in self.withdrawals if key[0] == account_id]:
+            del self.withdrawals[key]
+
+    def save_to_store(self, obj: typing.Union[BankAccount, Transaction]):
+        if isinstance(obj, BankAccount):
+            super().save_to_store(obj)
+            self.apply_record((ACCOUNT_RECORD, (obj.account_id, type(obj))))
+            self.add_resident(obj.account_id)
+        else:
+            self.make_resident(obj.account_id)
+            super().save_to_store(obj)
+            self.apply_record((TRANSACTION_RECORD, obj))
+
+    def remove_from_store(self, account_id: UUID):
+        self.make_resident(account_id)
+        super().remove_from_store(account_id)
+        self.apply_record((CLOSE_ACCOUNT_RECORD, account_id))
+        self.evict(account_id)
+
+    # Readers keep the store lock from making an account resident until
+    # they have read it, so another thread can't evict it in between
+
+    def read_account(self, account_id: UUID, current_date: date) -> BankAccount:
+        with self.store_lock:
+            self.make_resident(account_id)
+            return super().read_account(account_id, current_date)
+
+    def has_account(self, account_id: UUID) -> bool:
+        return account_id in self.resident or self.find_account(account_id) is not None
+
+    def get_account_class(
+        self, account_id: UUID
+    ) -> typing.Optional[typing.Type[BankAccount]]:
+        entry = self.find_account(account_id)
+        return entry[0] if entry is not None else None
+
+    def account_summaries(self) -> typing.Iterator[AccountSummaryType]:
+        """Balances are summed in one pass over the journal instead of
+        reading every account's history into memory"""
+        with self.store_lock:
+            classes = {
+                account_id: account_class
+                for account_id, (account_class, _) in self.index.accounts()
+                if account_id not in self.closed_accounts
+            }
+            classes.update(self.tail_accounts)
+            transactions = self.all_transactions()
+        balances: typing.Dict[UUID, int] = {}
+        for transaction in transactions:
+            account_id = transaction.account_id
+            balances[account_id] = (
+                balances.get(account_id, 0) + transaction.signed_grosz
+            )
+        for account_id, account_class in classes.items():
+            yield account_id, account_class, Money(balances.get(account_id, 0))
+
+    def get_account_balance(self, account_id: UUID) -> Money:
+        with self.store_lock:
+            self.make_resident(account_id)
+            return super().get_account_balance(account_id)
+
+    def get_total_withdrawn_amount_by_date(self, account_id: UUID, date: date) -> Money:
+        with self.store_lock:
+            self.make_resident(account_id)
+            return super().get_total_withdrawn_amount_by_date(account_id, date)
+
+    def get_account_transactions(self, account_id: UUID) -> typing.List[Transaction]:
+        with self.store_lock:
+            self.make_resident(account_id)
+            return super().get_account_transactions(account_id)
+
+    def get_transaction(self, transaction_id: UUID) -> typing.Optional[Transaction]:
+        transaction = self.store["transactions"].get(
+            transaction_id
+        ) or self.tail_transactions.get(transaction_id)
+        if transaction is not None:
+            return transaction
+        with self.store_lock:
+            offset = self.index.find_transaction(transaction_id)
+            if offset is None:
+                return None
+            return self.read_record(offset)[1]
+
+    def all_account_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        with self.store_lock:
+            account_ids = [
+                account_id
+                for account_id in self.index.account_ids()
+                if account_id not in self.closed_accounts
+            ]
+            account_ids += list(self.tail_accounts)
+        return iter(account_ids)
+
+    def all_transactions(self) -> typing.Iterator[Transaction]:
+        """Read every transaction from the journal, followed by the ones not
+        persisted yet"""
+        with self.store_lock:
+            journal_size = self.journal_size
+            pending = [
+                value
+                for kind, value in self.pending_records
+                if kind == TRANSACTION_RECORD
+            ]
+        return self.read_transactions(journal_size, pending)
+
+    def read_transactions(
+        self, journal_size: int, pending: typing.List[Transaction]
+    ) -> typing.Iterator[Transaction]:
+        if journal_size:
+            with open(self.filename, "rb") as journal:
+                journal.seek(len(self.JOURNAL_MAGIC))
+                for (kind, value), end in self.read_records(journal):
+                    if kind == TRANSACTION_RECORD:
+                        yield value
+                    if end >= journal_size:
+                        break
+        yield from pending
+
+    def all_transaction_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        return (transaction.transaction_id for transaction in self.all_transactions())
+
+    def verify_balances(self) -> typing.Dict[UUID, typing.Tuple[Money, Money]]:
+        """Audit the running balances of the accounts in memory"""
+        with self.store_lock:
+            balances = {
+                account_id: self.balances.get(account_id, 0)
+                for account_id in self.resident
+            }
+        replayed = {account_id: 0 for account_id in balances}
+        for transaction in self.all_transactions():
+            if transaction.account_id in replayed:
+                replayed[transaction.account_id] += transaction.signed_grosz
+        return {
+            account_id: (Money(balance), Money(replayed[account_id]))
+            for account_id, balance in balances.items()
+            if balance != replayed[account_id]
+        }
+
+    def load_history(self):
+        """Histories are read per account by make_resident"""
@@ -1,27 +1,189 @@
+import hashlib
+import os
 import pickle
+import struct
+import threading
+import time
 import typing
-from collections import OrderedDict
-from datetime import date
-from typing import Optional
+from collections import OrderedDict, defaultdict
+from contextlib import nullcontext
+from datetime import date, timedelta
+from typing import Literal, Optional
 from uuid import UUID
 
 from banking.account import BankAccount, Transaction
-from banking.error import AccountNotFoundError
+from banking.account_cache import AccountCache
+from banking.error import AccountNotFoundError, LedgerCorruptedError
+from banking.money import Money
 from banking.date_helper import get_todays_date
+from banking.serializer import SERIALIZER_CLASS_MAPPING, StoreSerializer
 
 EntryType = typing.OrderedDict[
     UUID, typing.Union[typing.Type[BankAccount], Transaction]
 ]
 StoreType = typing.Dict[str, EntryType]
+IndexType = typing.DefaultDict[UUID, typing.List[Transaction]]
+# Running balances and withdrawal totals are kept in grosz
+BalancesType = typing.Dict[UUID, int]
+WithdrawalsType = typing.Dict[typing.Tuple[UUID, date], int]
+# Account id, account class and balance of an open account
+AccountSummaryType = typing.Tuple[UUID, typing.Type[BankAccount], Money]
+Durability = Literal["always", "batch", "os"]
+LockType = typing.ContextManager
+
+# Checked files start with the magic, the sha256 digest of the payload
+# and the payload length
+CHECKED_FILE_MAGIC = b"BANKLDG1"
+CHECKED_FILE_HEADER = struct.Struct(">8s32sQ")
+
+
+def pack_checked(payload: bytes) -> bytes:
+    """Prefix payload with a header holding it's checksum and length"""
+    digest = hashlib.sha256(payload).digest()
+    return CHECKED_FILE_HEADER.pack(CHECKED_FILE_MAGIC, digest, len(payload)) + payload
+
+
+def is_checked(data: bytes) -> bool:
+    """Returns True if data was written by pack_checked"""
+    return data.startswith(CHECKED_FILE_MAGIC)
+
+
+def unpack_checked(data: bytes) -> bytes:
+    """Return the payload of data written by pack_checked
+
+    Raises:
+        LedgerCorruptedError: If the header is missing or the payload doesn't
+        match it's length or checksum
+    """
+    if not is_checked(data) or len(data) < CHECKED_FILE_HEADER.size:
+        raise LedgerCorruptedError("Ledger file header is missing or incomplete")
+    _, digest, length = CHECKED_FILE_HEADER.unpack_from(data)
+    payload = data[CHECKED_FILE_HEADER.size :]
+    if len(payload) != length or hashlib.sha256(payload).digest() != digest:
+        raise LedgerCorruptedError("Ledger file failed it's checksum")
+    return payload
+
+
+def write_atomically(filename: str, data: bytes):
+    """Replace filename with data so that a crash leaves either the old or
+    the new file but never a partially written one.
+
+    The data is written to a temporary file next to filename, fsynced and
+    renamed over filename.
+    """
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(temp_filename, "wb") as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_filename, filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def sync_directory(filename: str):
+    """Force the directory entry of filename to disk so a rename over it
+    survives a crash"""
+    fd = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 class Ledger:
-    def __init__(self, filename: str) -> None:
+
+    # Number of most recent days whose withdrawal totals are kept in memory.
+    # Daily withdrawal limits only ever look at a single day.
+    WITHDRAWAL_WINDOW_DAYS = 1
+
+    # Number of locks account ids are spread over in thread safe mode
+    ACCOUNT_LOCK_STRIPES = 64
+
+    DURABILITY_POLICIES = ("always", "batch", "os")
+
+    def __init__(
+        self,
+        filename: str,
+        durability: Durability = "os",
+        batch_size: int = 100,
+        batch_window: float = 0.5,
+        thread_safe: bool = False,
+        serializer: str = "pickle",
+        account_cache_size: int = 1024,
+    ) -> None:
+        """
+        Arguments:
+            filename {str} -- name of the ledger file
+
+        Keyword Arguments:
+            durability {Durability} -- when writes reach the disk (default: {"os"})
+            - always -- every write is persisted and fsynced before returning
+            - batch -- writes are grouped and persisted with a single fsync once
+            batch_size writes are pending or batch_window seconds have passed
+            since the first of them, or on flush(). A thread safe ledger
+            flushes an idle batch from a timer thread when the window ends,
+            otherwise the window is only checked on the next write and the
+            caller must flush() the last writes
+            - os -- every write is persisted and flushing to disk is left to the OS
+            batch_size {int} -- writes grouped in a batch (default: {100})
+            batch_window {float} -- seconds a write may wait in a batch
+            (default: {0.5})
+            thread_safe {bool} -- guard the ledger with locks so it can be
+            used from several threads at once (default: {False})
+            - account_lock(account_id) serializes the check and the write of
+            operations on an account, accounts share one of
+            ACCOUNT_LOCK_STRIPES locks
+            - writes to the store hold the store lock only while they change it
+            - persist writes a copy of the store taken under the store lock
+            - readers iterate over a copy of the store taken under the store
+            lock, lookups of a single entry take no lock
+            serializer {str} -- how persist writes the store, see
+            SERIALIZER_CLASS_MAPPING (default: {"pickle"})
+            - pickle -- the store pickled as it is
+            - binary -- fixed width struct records, faster to load and
+            never unpickled. Only binary ledger files are loaded, pickled
+            ones are converted with migrate_to_binary.
+            The pickle serializer loads ledger files of either.
+            account_cache_size {int} -- number of most recently used
+            accounts get_account keeps built, 0 turns the cache off
+            (default: {1024})
+        """
+        if durability not in self.DURABILITY_POLICIES:
+            raise ValueError(f"Invalid durability policy {durability}")
+        if serializer not in SERIALIZER_CLASS_MAPPING:
+            raise ValueError(f"Invalid serializer {serializer}")
         self.filename = filename
-        self.store: StoreType = {
-            "accounts": OrderedDict(),
-            "transactions": OrderedDict(),
-        }
+        self.serializer_name = serializer
+        self.serializer: StoreSerializer = SERIALIZER_CLASS_MAPPING[serializer]()
+        self.durability = durability
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.unflushed_writes = 0
+        self.first_unflushed_at: Optional[float] = None
+        self.flush_timer: Optional[threading.Timer] = None
+        self.thread_safe = thread_safe
+        self.store_lock: LockType = threading.RLock() if thread_safe else nullcontext()
+        self.flush_lock: LockType = threading.RLock() if thread_safe else nullcontext()
+        self.account_locks: typing.List[LockType] = (
+            [threading.RLock() for _ in range(self.ACCOUNT_LOCK_STRIPES)]
+            if thread_safe
+            else [nullcontext()]
+        )
+        self.store: StoreType = self.empty_store()
+        self.transactions_by_account: IndexType = defaultdict(list)
+        self.balances: BalancesType = {}
+        self.withdrawals: WithdrawalsType = {}
+        self.withdrawals_since: Optional[date] = None
+        # Bytes written to the ledger files by persist since the ledger
+        # was created
+        self.bytes_written = 0
+        self.account_cache: Optional[AccountCache] = (
+            AccountCache(account_cache_size) if account_cache_size > 0 else None
+        )
 
     def save_object(self, obj: typing.Union[BankAccount, Transaction]):
         """Store a single account or transaction object"""
@@ -29,56 +191,337 @@ class Ledger:
 
     def save(self, objs: typing.List[typing.Union[BankAccount, Transaction]]):
         """Store a list of account and/or transacion objects"""
-        for obj in objs:
-            self.save_to_store(obj)
-        self.persist()
+        account_cache = self.account_cache
+        with self.store_lock:
+            for obj in objs:
+                self.save_to_store(obj)
+                if account_cache is not None:
+                    account_cache.saved(obj)
+        self.mark_unflushed(len(objs))
 
     def save_to_store(self, obj: typing.Union[BankAccount, Transaction]):
         if isinstance(obj, BankAccount):
             self.store["accounts"][obj.account_id] = type(obj)
         elif isinstance(obj, Transaction):
             self.store["transactions"][obj.transaction_id] = obj
+            self.index_transaction(obj)
         else:
             raise Exception("Programming Error: Invalid object type")
 
     def persist(self):
-        pickle.dump(self.store, open(self.filename, "wb"))
+        """Atomically replace the ledger file with the serialized store
+        and it's checksum"""
+        data = pack_checked(self.serializer.dumps(self.snapshot_store()))
+        write_atomically(self.filename, data)
+        self.bytes_written += len(data)
+
+    def snapshot_store(self) -> StoreType:
+        """Return the store to persist, a copy taken under the store lock
+        in thread safe mode so writers can carry on while it's written"""
+        if not self.thread_safe:
+            return self.store
+        with self.store_lock:
+            return {name: entries.copy() for name, entries in self.store.items()}
+
+    def read_view(self, view: typing.Iterable) -> typing.Iterable:
+        """Return the view of the store to a reader, copied under the store
+        lock in thread safe mode so writers can carry on while it's read"""
+        if not self.thread_safe:
+            return view
+        with self.store_lock:
+            return list(view)
+
+    def account_lock(self, account_id: UUID) -> LockType:
+        """Return the lock to hold while checking and changing an account"""
+        return self.account_locks[hash(account_id) % len(self.account_locks)]
+
+    def sync(self):
+        """Force the rename of the persisted ledger file to disk"""
+        sync_directory(self.filename)
+
+    def mark_unflushed(self, count: int):
+        """Record writes made to the store and flush them if the
+        durability policy says they are due"""
+        with self.store_lock:
+            self.unflushed_writes += count
+            if self.first_unflushed_at is None:
+                self.first_unflushed_at = time.monotonic()
+                self.schedule_window_flush(self.batch_window)
+        if self.flush_due:
+            with self.flush_lock:
+                # Another thread may have flushed these writes meanwhile
+                if self.flush_due:
+                    self.flush()
+
+    def schedule_window_flush(self, delay: float):
+        """Start a timer flushing the batch once it's window has passed.
+
+        Only thread safe ledgers are flushed from another thread, the store
+        of any other ledger may be changed while the timer persists it.
+        """
+        if (
+            self.durability != "batch"
+            or not self.thread_safe
+            or self.flush_timer is not None
+            or delay == float("inf")
+        ):
+            return
+        self.flush_timer = threading.Timer(delay, self.flush_window)
+        self.flush_timer.daemon = True
+        self.flush_timer.start()
+
+    def flush_window(self):
+        """Flush the batch if it's window has passed or wait for the
+        window of a batch started after the last flush"""
+        with self.flush_lock:
+            with self.store_lock:
+                self.flush_timer = None
+                if self.first_unflushed_at is None:
+                    return
+                if not self.flush_due:
+                    self.schedule_window_flush(
+                        self.first_unflushed_at
+                        + self.batch_window
+                        - time.monotonic()
+                    )
+                    return
+            self.flush()
+
+    @property
+    def flush_due(self) -> bool:
+        """Returns True if the unflushed writes should be flushed now"""
+        if self.durability != "batch":
+            return self.unflushed_writes > 0
+        return self.unflushed_writes >= self.batch_size or (
+            self.first_unflushed_at is not None
+            and time.monotonic() - self.first_unflushed_at >= self.batch_window
+        )
+
+    def flush(self):
+        """Persist all writes made to the store, fsyncing them unless
+        durability is left to the OS"""
+        with self.flush_lock:
+            with self.store_lock:
+                # Writes made while persisting are flushed by the next flush
+                unflushed = (self.unflushed_writes, self.first_unflushed_at)
+                self.unflushed_writes = 0
+                self.first_unflushed_at = None
+            try:
+                self.persist()
+                if self.durability != "os":
+                    self.sync()
+            except BaseException:
+                with self.store_lock:
+                    self.unflushed_writes += unflushed[0]
+                    self.first_unflushed_at = unflushed[1]
+                raise
+
+    def __enter__(self) -> "Ledger":
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.unflushed_writes:
+            self.flush()
 
     def load(self):
-        """Load transaction and accounts from store"""
-        try:
-            self.store = pickle.load(open(self.filename, "rb"))
-        except EOFError:
-            self.store: StoreType = {
-                "accounts": OrderedDict(),
-                "transactions": OrderedDict(),
-            }
+        """Load transaction and accounts from store.
+
+        An empty ledger file is a new ledger. Ledger files written before
+        checksums were added are loaded as plain pickles by the pickle
+        serializer.
+
+        Raises:
+            LedgerCorruptedError: If the ledger file is damaged or isn't in
+            a format the serializer loads
+        """
+        with open(self.filename, "rb") as ledger_file:
+            data = ledger_file.read()
+        if not data:
+            self.store = self.empty_store()
+        elif is_checked(data):
+            payload = unpack_checked(data)
+            try:
+                self.store = self.serializer.loads(payload)
+            except LedgerCorruptedError:
+                raise
+            except Exception:
+                # eg. the manifest of a sharded ledger
+                raise LedgerCorruptedError(
+                    f"Ledger file {self.filename} is not a {self.serializer_name} "
+                    "ledger"
+                )
+        elif self.serializer_name != "pickle":
+            raise LedgerCorruptedError(
+                f"Ledger file {self.filename} is not a {self.serializer_name} ledger"
+            )
+        else:
+            try:
+                self.store = pickle.loads(data)
+            except Exception:
+                raise LedgerCorruptedError(
+                    f"Ledger file {self.filename} is neither empty nor a ledger"
+                )
+        self.build_indexes()
+
+    @staticmethod
+    def empty_store() -> StoreType:
+        return {
+            "accounts": OrderedDict(),
+            "transactions": OrderedDict(),
+        }
+
+    def index_transaction(self, transaction: Transaction):
+        """Add a transaction to the per account transaction index
+        and apply it to the account's running balance"""
+        self.transactions_by_account[transaction.account_id].append(transaction)
+        self.aggregate_transaction(transaction)
+
+    def aggregate_transaction(self, transaction: Transaction):
+        """Apply a transaction to it's account's running balance and
+        daily withdrawal totals"""
+        account_id = transaction.account_id
+        self.balances[account_id] = (
+            self.balances.get(account_id, 0) + transaction.signed_grosz
+        )
+        if transaction.transaction_type == Transaction.TransactionType.DEBIT:
+            self.index_withdrawal(transaction)
+
+    def index_withdrawal(self, transaction: Transaction):
+        """Add a DEBIT transaction to the daily withdrawal totals of it's
+        account, dropping days that fall out of the withdrawal window"""
+        occurred_on = transaction.occurred_on
+        since = occurred_on - timedelta(days=self.WITHDRAWAL_WINDOW_DAYS - 1)
+        if self.withdrawals_since is None or since > self.withdrawals_since:
+            self.prune_withdrawals(since)
+        if occurred_on < self.withdrawals_since:  # type: ignore
+            # Day is no longer kept in memory, it will be computed on demand
+            return
+        key = (transaction.account_id, occurred_on)
+        self.withdrawals[key] = self.withdrawals.get(key, 0) + transaction.amount.grosz
+
+    def prune_withdrawals(self, since: date):
+        """Drop the daily withdrawal totals of days before `since`"""
+        self.withdrawals_since = since
+        for key in [key for key in self.withdrawals if key[1] < since]:
+            del self.withdrawals[key]
+
+    def build_indexes(self):
+        """Rebuild the per account transaction index, running
+        balances and daily withdrawal totals from the store"""
+        self.clear_account_cache()
+        self.transactions_by_account = defaultdict(list)
+        self.balances = {}
+        self.withdrawals = {}
+        self.withdrawals_since = None
+        for transaction in self.store["transactions"].values():
+            self.index_transaction(transaction)
+
+    def get_account_transactions(self, account_id: UUID) -> typing.List[Transaction]:
+        """Return all transactions performed on an account in the
+        order they were stored.
+
+        Arguments:
+            account_id {UUID} -- Target account id
+
+        Returns:
+            typing.List[Transaction] -- the account's transactions
+        """
+        return self.read_view(self.transactions_by_account.get(account_id, []))
 
     def all_account_ids(self) -> typing.List[UUID]:
         """Return all account Ids"""
-        return self.store["accounts"].keys()
+        return self.read_view(self.store["accounts"].keys())
 
     def all_transaction_ids(self) -> typing.List[UUID]:
         """Return all transaction ids"""
-        return self.store["transactions"].keys()
+        return self.read_view(self.store["transactions"].keys())
+
+    def all_transactions(self) -> typing.Iterable[Transaction]:
+        """Return all transactions in the order they were stored"""
+        return self.read_view(self.store["transactions"].values())
+
+    def find_transactions(
+        self,
+        account_id: Optional[UUID] = None,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+    ) -> typing.Iterator[Transaction]:
+        """Yield transactions in the order they were stored, only those of
+        an account when account_id is given and only those occurring
+        between since and until when they are given, both days included.
+
+        The account filter is answered from the per account index.
+        """
+        if account_id is None:
+            transactions = self.all_transactions()
+        else:
+            transactions = self.get_account_transactions(account_id)
+        for transaction in transactions:
+            if (since is None or transaction.occurred_on >= since) and (
+                until is None or transaction.occurred_on <= until
+            ):
+                yield transaction
+
+    def get_transaction(self, transaction_id: UUID) -> Optional[Transaction]:
+        """Return the transaction with the given id or None if there's none"""
+        return self.store["transactions"].get(transaction_id)
+
+    def has_account(self, account_id: UUID) -> bool:
+        """Returns True if the account exists and has not been closed"""
+        return account_id in self.store["accounts"]
+
+    def get_account_class(self, account_id: UUID) -> Optional[typing.Type[BankAccount]]:
+        """Return the class of an open account or None"""
+        return self.store["accounts"].get(account_id)
+
+    def account_summaries(self) -> typing.Iterator[AccountSummaryType]:
+        """Yield the id, class and balance of every open account in the
+        order they were opened, read straight from the store and the
+        running balances without building BankAccount objects"""
+        with self.store_lock:
+            accounts = list(self.store["accounts"].items())
+            balances = self.balances.copy() if self.thread_safe else self.balances
+        for account_id, account_class in accounts:
+            yield account_id, account_class, Money(balances.get(account_id, 0))
 
-    def get_account_balance(self, account_id: UUID) -> float:
-        """Fetch and calculate the account balance of a transacion
-        from all it's previous transactions
+    def get_account_balance(self, account_id: UUID) -> Money:
+        """Fetch the account's running balance which is kept up to date
+        as each of it's transactions is stored
 
         Arguments:
             account_id {UUID} -- Target account id
 
         Returns:
-            float -- account balance
+            Money -- account balance
         """
-        account_transactions: typing.List[Transaction] = []
-        for transaction in self.store["transactions"].values():
-            if transaction.account_id == account_id:
-                account_transactions.append(transaction)
-        return sum(account_transactions)  # type: ignore
+        return Money(self.balances.get(account_id, 0))
+
+    def verify_balances(self) -> typing.Dict[UUID, typing.Tuple[Money, Money]]:
+        """Audit the running balances by replaying every stored transaction
+
+        Returns:
+            typing.Dict[UUID, typing.Tuple[Money, Money]] -- the accounts whose
+            running balance differs from the replayed one mapped to
+            (running balance, replayed balance). Empty if all balances agree.
+        """
+        with self.store_lock:
+            transactions = self.all_transactions()
+            balances = dict(self.balances)
+        replayed: BalancesType = {}
+        for transaction in transactions:
+            account_id = transaction.account_id
+            replayed[account_id] = (
+                replayed.get(account_id, 0) + transaction.signed_grosz
+            )
+        mismatches = {}
+        for account_id in set(replayed) | set(balances):
+            balance = balances.get(account_id, 0)
+            expected = replayed.get(account_id, 0)
+            if balance != expected:
+                mismatches[account_id] = (Money(balance), Money(expected))
+        return mismatches
 
-    def get_total_withdrawn_amount_by_date(self, account_id: UUID, date: date) -> float:
+    def get_total_withdrawn_amount_by_date(self, account_id: UUID, date: date) -> Money:
         """Get the sum of amount withdrawn by the account on the day 
         denoted by the passed in date.
 
@@ -87,20 +530,25 @@ class Ledger:
             date {date} -- The date to fetch sum of withdrawal transactions for
 
         Returns:
-            float -- sum of amount of each withdrawal transaction on that day
+            Money -- sum of amount of each withdrawal transaction on that day
         """
-        withdrawal_transactions = []
-        for transaction in self.store["transactions"].values():
-            if (
-                transaction.transaction_type == Transaction.TransactionType.DEBIT
-                and transaction.account_id == account_id
-            ):
-                withdrawal_transactions.append(transaction)
-        return abs(sum(withdrawal_transactions))  # type: ignore
+        if self.withdrawals_since is None or date >= self.withdrawals_since:
+            return Money(self.withdrawals.get((account_id, date), 0))
+        return Money(
+            sum(
+                transaction.amount.grosz
+                for transaction in self.get_account_transactions(account_id)
+                if transaction.transaction_type == Transaction.TransactionType.DEBIT
+                and transaction.occurred_on == date
+            )
+        )
 
     def get_account(self, account_id: UUID) -> BankAccount:
         """Get an account from the ledger
 
+        Recently used accounts are kept in the account cache, the account
+        returned may be shared and must not be changed.
+
         Arguments:
             account_id {UUID} -- Id of account
 
@@ -111,6 +559,30 @@ class Ledger:
             BankAccount -- Returns a bank account object.
         """
         current_date = get_todays_date()
+        account_cache = self.account_cache
+        if account_cache is None:
+            return self.read_account(account_id, current_date)
+        with self.store_lock:
+            account = account_cache.get(account_id, current_date)
+            if account is not None:
+                return account
+            changes = account_cache.begin_read(account_id)
+        # Built without the lock, it's only cached if nothing was saved to
+        # the account meanwhile
+        account = None
+        try:
+            account = self.read_account(account_id, current_date)
+        finally:
+            with self.store_lock:
+                account_cache.end_read(account_id, current_date, changes, account)
+        return account
+
+    def read_account(self, account_id: UUID, current_date: date) -> BankAccount:
+        """Build an account from the ledger as of current_date
+
+        Raises:
+            AccountNotFoundError: When account doesn't exist or is deleted
+        """
         try:
             account_class: typing.Type[BankAccount] = self.store["accounts"][account_id]
             current_balance = self.get_account_balance(account_id)
@@ -126,14 +598,50 @@ class Ledger:
     def close_account(self, account_id: UUID):
         """Delete account from store"""
         try:
-            del self.store["accounts"][account_id]
-            self.persist()
+            with self.store_lock:
+                self.remove_from_store(account_id)
+                self.discard_cached_account(account_id)
         except KeyError:
             raise AccountNotFoundError(
                 "This account does not exist or has already been deleted"
             )
+        self.mark_unflushed(1)
+
+    def remove_from_store(self, account_id: UUID):
+        del self.store["accounts"][account_id]
+
+    def discard_cached_account(self, account_id: UUID):
+        if self.account_cache is not None:
+            self.account_cache.discard(account_id)
+
+    def clear_account_cache(self):
+        if self.account_cache is not None:
+            self.account_cache.clear()
 
     @property
     def is_empty(self) -> bool:
         """Returns True if store is empty i.e no accounts and no transactions"""
         return len(self.store["accounts"]) == 0 and len(self.store["transactions"]) == 0
+
+
+def migrate_to_binary(pickle_filename: str, binary_filename: str) -> Ledger:
+    """Convert a pickled ledger into a ledger written by the binary serializer
+
+    Only convert ledger files from a trusted source, they are unpickled.
+
+    Arguments:
+        pickle_filename {str} -- name of the existing pickled ledger eg. ledger.pkl
+        binary_filename {str} -- name of the ledger to write, may be
+        pickle_filename to convert it in place
+
+    Returns:
+        Ledger -- The ledger holding the migrated store
+    """
+    source = Ledger(pickle_filename)
+    source.load()
+    target = Ledger(binary_filename, serializer="binary")
+    target.store = source.store
+    target.build_indexes()
+    target.persist()
+    target.sync()
+    return target
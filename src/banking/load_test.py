@@ -0,0 +1,119 @@
+"""Concurrent load test of AsyncApplication.
+
+Clients deposit to and withdraw from a small set of shared accounts and the
+balances the clients expect are compared with the balances read back from
+the committed ledger. Run it with
+
+    python -m banking.load_test [backend] [operations]
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import typing
+from uuid import UUID
+
+from banking.application import Application
+from banking.async_application import AsyncApplication
+from banking.error import InsufficientFundError
+from banking.money import Money
+
+CLIENT_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+
+
+class LoadTestResult:
+    def __init__(
+        self, clients: int, operations: int, elapsed: float, commits: int
+    ) -> None:
+        self.clients = clients
+        self.operations = operations
+        self.elapsed = elapsed
+        self.commits = commits
+        self.lost_updates = 0
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.operations / self.elapsed if self.elapsed > 0 else 0.0
+
+
+async def run_load_test(
+    app: Application,
+    clients: int,
+    operations_per_client: int,
+    accounts: int = 10,
+    seed: int = 0,
+) -> LoadTestResult:
+    """Run clients concurrently against a started application and check
+    every acknowledged write reached the ledger file
+
+    Arguments:
+        app {Application} -- a started application with a thread safe ledger
+        clients {int} -- number of concurrent clients
+        operations_per_client {int} -- deposits and withdrawals per client
+
+    Keyword Arguments:
+        accounts {int} -- number of accounts shared by the clients (default: {10})
+        seed {int} -- seed of the random operations (default: {0})
+
+    Returns:
+        LoadTestResult -- throughput and the number of accounts whose
+        balance on disk differs from the expected balance
+    """
+    rng = random.Random(seed)
+    async with AsyncApplication(app) as bank:
+        account_ids = [
+            await bank.open_account("international") for _ in range(accounts)
+        ]
+        expected: typing.Dict[UUID, Money] = {
+            account_id: Money() for account_id in account_ids
+        }
+
+        async def client():
+            for _ in range(operations_per_client):
+                account_id = rng.choice(account_ids)
+                amount = Money(rng.randint(1, 500))
+                if rng.random() < 0.5:
+                    await bank.deposit(account_id, amount)
+                    expected[account_id] += amount
+                    continue
+                try:
+                    await bank.withdraw(account_id, amount, False)
+                    expected[account_id] -= amount
+                except InsufficientFundError:
+                    pass
+
+        started_at = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - started_at
+        commits = bank.commits
+    result = LoadTestResult(clients, clients * operations_per_client, elapsed, commits)
+    committed = type(app.ledger)(app.ledger.filename)
+    committed.load()
+    for account_id, balance in expected.items():
+        if committed.get_account_balance(account_id) != balance or balance < 0:
+            result.lost_updates += 1
+    return result
+
+
+def main(backend: str = "journal", operations: int = 2000):
+    print(f"{'clients':>8} {'ops/sec':>10} {'commits':>8} {'lost updates':>13}")
+    for clients in CLIENT_COUNTS:
+        with tempfile.TemporaryDirectory() as directory:
+            app = Application(
+                os.path.join(directory, "ledger"), backend, thread_safe=True  # type: ignore
+            )
+            app.start()
+            result = asyncio.run(
+                run_load_test(app, clients, max(operations // clients, 1))
+            )
+        print(
+            f"{clients:>8} {result.ops_per_second:>10.0f} "
+            f"{result.commits:>8} {result.lost_updates:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2], *(int(arg) for arg in sys.argv[2:3]))  # type: ignore
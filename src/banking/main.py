@@ -1,20 +1,155 @@
+import os
+import time
+import typing
 from datetime import date, datetime
 from functools import wraps
-from typing import Callable
+from typing import Callable, Iterator, Optional, Union
 from uuid import UUID
 
 import json
 import typer
 
-from banking.application import Application, create_application
-from banking.error import AccountError
-from banking.date_helper import get_todays_date
+from banking.defaults import DEFAULT_SHARDS, LEDGER_BACKENDS
+from banking.error import AccountError, LedgerError
+from banking.server import DEFAULT_SOCKET_PATH, BankingClient, is_serving, serve
+
+if typing.TYPE_CHECKING:
+    from banking.application import Application
+    from banking.metrics import Metrics
+
+# The application and the ledger backends are only imported by the
+# commands that use them so --help and usage errors don't pay for them
+
+DEFAULT_LEDGER_PATH = "ledger.pkl"
+SOCKET_PATH = os.environ.get("BANKING_SOCKET", DEFAULT_SOCKET_PATH)
+
+ledger_path = os.environ.get("BANKING_LEDGER", DEFAULT_LEDGER_PATH)
+# Set when the ledger was chosen with --ledger or BANKING_LEDGER
+ledger_path_given = "BANKING_LEDGER" in os.environ
+# Set by --backend or BANKING_BACKEND, otherwise it's taken from the ledger file
+ledger_backend: Optional[str] = os.environ.get("BANKING_BACKEND")
+banking_app: Optional[Union["Application", BankingClient]] = None
+# Set by --profile, --metrics-file and serve --metrics-port
+app_metrics: Optional["Metrics"] = None
+
+
+def connect_application(
+    ledger_file_name: str, ledger_given: bool = False, backend: Optional[str] = None
+) -> Union["Application", BankingClient]:
+    """Use the running banking server if there's one, otherwise load
+    the ledger in this process with backend. A ledger given explicitly has
+    to be the one the server serves, the command is aborted otherwise.
+
+    Without a backend a sharded ledger file is opened with the sharded
+    backend and any other with the pickle backend."""
+    if is_serving(SOCKET_PATH):
+        client = BankingClient(SOCKET_PATH)
+        served_ledger = client.ledger_file()
+        if ledger_given and served_ledger != os.path.abspath(ledger_file_name):
+            client.close()
+            typer.echo(
+                style(
+                    f"The server on {SOCKET_PATH} serves {served_ledger}, "
+                    f"stop it to use {ledger_file_name}",
+                    False,
+                )
+            )
+            raise typer.Abort()
+        return client
+    from banking.application import create_application
+    from banking.sharded_ledger import is_sharded_ledger
+
+    if backend is None:
+        # A resharded ledger file holds the manifest of it's shards
+        backend = "sharded" if is_sharded_ledger(ledger_file_name) else "pickle"
+    application = create_application(
+        ledger_file_name, backend, metrics=app_metrics  # type: ignore
+    )
+    application.start()
+    return application
+
+
+def get_banking_app() -> Union["Application", BankingClient]:
+    """Return the application, connecting to it on first use"""
+    global banking_app
+    if banking_app is None:
+        banking_app = connect_application(
+            ledger_path, ledger_path_given, ledger_backend
+        )
+    return banking_app
 
-banking_app: Application = create_application("ledger.pkl")
-banking_app.start()
 
 app = typer.Typer()
 
+
+def enable_metrics() -> "Metrics":
+    """Record metrics of the application, it's connected again if it was
+    connected without them"""
+    global app_metrics, banking_app
+    if app_metrics is None:
+        from banking.metrics import Metrics
+
+        app_metrics = Metrics()
+        banking_app = None
+    return app_metrics
+
+
+@app.callback()
+def main(
+    ctx: typer.Context,
+    ledger: str = typer.Option(
+        None,
+        envvar="BANKING_LEDGER",
+        help="Ledger file, it's only loaded by commands that use it "
+        f"[default: {DEFAULT_LEDGER_PATH}]",
+    ),
+    backend: str = typer.Option(
+        None,
+        envvar="BANKING_BACKEND",
+        help="How the ledger file is stored, one of "
+        + ", ".join(LEDGER_BACKENDS)
+        + ". By default sharded ledgers use sharded and others pickle",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Print the time spent in each stage of the command to stderr",
+    ),
+    metrics_file: str = typer.Option(
+        None, help="Write the command's metrics to this file in Prometheus format"
+    ),
+):
+    """Manage bank accounts and their transactions"""
+    global ledger_path, ledger_path_given, ledger_backend, banking_app
+    if backend is not None and backend not in LEDGER_BACKENDS:
+        typer.echo(f"Invalid backend {style(backend, is_success=False)}")
+        raise typer.Abort()
+    # The ledger option has no default so a ledger given with --ledger or
+    # BANKING_LEDGER can be told apart from the default one
+    ledger_path_given = ledger is not None
+    if ledger is None:
+        ledger = DEFAULT_LEDGER_PATH
+    if ledger != ledger_path or backend != ledger_backend:
+        ledger_path = ledger
+        ledger_backend = backend
+        banking_app = None
+    if profile or metrics_file:
+        metrics = enable_metrics()
+        started_at = time.perf_counter()
+
+        def report_metrics():
+            global app_metrics, banking_app
+            metrics.observe("command_seconds", time.perf_counter() - started_at)
+            metrics.increment("command_calls_total")
+            if profile:
+                typer.echo(metrics.profile(), err=True)
+            if metrics_file:
+                metrics.write_prometheus(metrics_file)
+            app_metrics = banking_app = None
+
+        ctx.call_on_close(report_metrics)
+
+
 DATE_FORMAT = "%Y-%m-%d"
 
 
@@ -33,8 +168,8 @@ def set_occurring_on(func: Callable):
             occurring_on_date: date = datetime.strptime(
                 occurring_on, DATE_FORMAT
             ).date()
-            banking_app.change_current_date(occurring_on_date)
-            typer.echo(f"Current date set to {get_todays_date().strftime(DATE_FORMAT)}")
+            get_banking_app().change_current_date(occurring_on_date)
+            typer.echo(f"Current date set to {occurring_on_date.strftime(DATE_FORMAT)}")
             func(*args, **kwargs)
         except ValueError:
             typer.echo("Invalid date")
@@ -75,7 +210,7 @@ def open(account_type: str, date: str = None):
     - banking open covid --date 2018-12-23
     """
     try:
-        account_id: UUID = banking_app.open_account(account_type)  # type: ignore
+        account_id: UUID = get_banking_app().open_account(account_type)  # type: ignore
         account_type_string: str = style(account_type)
         account_id_string: str = style(str(account_id))
         result_string: str = f"{account_type_string}"
@@ -112,7 +247,7 @@ def withdraw(account_id: str, amount: float, atm: bool = False, date: str = None
     - banking withdraw 7ae3fcfd-da50-43c3-9c6f-c5d1adaaebbc 45.37 --date 2018-12-23
     """
     try:
-        transaction_id = banking_app.withdraw(UUID(account_id), amount, atm)
+        transaction_id = get_banking_app().withdraw(UUID(account_id), amount, atm)
         transaction_id_string: str = style(str(transaction_id))
         typer.echo(f"Withdrawal successful, transaction id is {transaction_id_string}")
     except AccountError as e:
@@ -139,7 +274,7 @@ def deposit(account_id: str, amount: float, date: str = None):
     - banking deposit 7ae3fcfd-da50-43c3-9c6f-c5d1adaaebbc 45.37 --date 2018-12-23
     """
     try:
-        transaction_id = banking_app.deposit(UUID(account_id), amount)
+        transaction_id = get_banking_app().deposit(UUID(account_id), amount)
         transaction_id_string: str = style(str(transaction_id))
         typer.echo(f"Deposit successful, transaction id is {transaction_id_string}")
     except AccountError as e:
@@ -148,7 +283,15 @@ def deposit(account_id: str, amount: float, date: str = None):
 
 @app.command()
 def ls(
-    show_accounts: bool = True, show_transactions: bool = True, only_ids: bool = False
+    show_accounts: bool = True,
+    show_transactions: bool = True,
+    only_ids: bool = False,
+    account: str = None,
+    since: str = None,
+    until: str = None,
+    offset: int = typer.Option(0, min=0),
+    limit: int = typer.Option(None, min=0),
+    format: str = "text",
 ):
     """Display all accounts and/or transactions
 
@@ -158,51 +301,80 @@ def ls(
 
     Use --only-ids flag to display only the ids of the accounts and/or transactions. Disabled by default.
 
+    Use --account to only display that account and it's transactions
+
+    Use --since and --until to only display transactions of those days and the days between, date format is YYYY-mm-dd eg. 2020-04-01
+
+    Use --offset and --limit to page through the accounts and transactions, each list is paged on it's own
+
+    Use --format jsonl to print one JSON entry per line without headings, default is text
+
     Exmaple:
 
     - banking ls --only-ids --no-show-accounts
+
+    - banking ls --no-show-accounts --since 2020-04-01 --limit 100 --format jsonl
     """
-    accounts = []
-    transactions = []
-    store = banking_app.ledger.store
+    if format not in ("text", "jsonl"):
+        typer.echo(f"Invalid format {style(format, is_success=False)}")
+        raise typer.Abort()
+    try:
+        account_id = UUID(account) if account else None
+        since_date = datetime.strptime(since, DATE_FORMAT).date() if since else None
+        until_date = datetime.strptime(until, DATE_FORMAT).date() if until else None
+    except ValueError:
+        typer.echo("Invalid account id or date")
+        raise typer.Abort()
     if show_accounts:
-        title: str = "Account Ids" if only_ids else "Accounts"
-        typer.echo(typer.style(f"\n{title}", fg=typer.colors.MAGENTA))
-        typer.echo(typer.style("===========", fg=typer.colors.MAGENTA))
-        accounts += (
-            [str(uid) for uid in store["accounts"].keys()]
-            if only_ids
-            else banking_app.all_accounts()
-        )
-        accounts = accounts or ["-----No open account---"]
-        typer.echo(
-            "\n".join(
-                typer.style(
-                    json.dumps(acc, indent=4, sort_keys=True),
-                    fg=typer.colors.BRIGHT_BLUE,
-                )
-                for acc in accounts
-            )
+        accounts = get_banking_app().stream_accounts(account_id, offset, limit)
+        echo_entries(
+            accounts,
+            "Account Ids" if only_ids else "Accounts",
+            "account_id" if only_ids else None,
+            "-----No open account---",
+            format,
         )
     if show_transactions:
-        title: str = "Transaction Ids" if only_ids else "Transactions"
-        typer.echo(typer.style(f"\n{title}", fg=typer.colors.MAGENTA))
-        typer.echo(typer.style("===========", fg=typer.colors.MAGENTA))
-        transactions += (
-            [str(uid) for uid in store["transactions"].keys()]
-            if only_ids
-            else banking_app.all_transactions()
+        transactions = get_banking_app().stream_transactions(
+            account_id, since_date, until_date, offset, limit
+        )
+        echo_entries(
+            transactions,
+            "Transaction Ids" if only_ids else "Transactions",
+            "transaction_id" if only_ids else None,
+            "-----No transaction----",
+            format,
         )
-        transactions = transactions or ["-----No transaction----"]
+
+
+def echo_entries(
+    entries: Iterator[dict],
+    title: str,
+    id_key: Optional[str],
+    placeholder: str,
+    format: str,
+):
+    """Echo entries as they are read, as JSON lines or pretty printed
+    under a title"""
+    if format == "jsonl":
+        for entry in entries:
+            typer.echo(json.dumps(entry[id_key] if id_key else entry, sort_keys=True))
+        return
+    typer.echo(typer.style(f"\n{title}", fg=typer.colors.MAGENTA))
+    typer.echo(typer.style("===========", fg=typer.colors.MAGENTA))
+    is_empty = True
+    for entry in entries:
+        is_empty = False
         typer.echo(
-            "\n".join(
-                typer.style(
-                    json.dumps(transaction, indent=4, sort_keys=True),
-                    fg=typer.colors.BRIGHT_BLUE,
-                )
-                for transaction in transactions
+            typer.style(
+                json.dumps(
+                    entry[id_key] if id_key else entry, indent=4, sort_keys=True
+                ),
+                fg=typer.colors.BRIGHT_BLUE,
             )
         )
+    if is_empty:
+        typer.echo(typer.style(json.dumps(placeholder), fg=typer.colors.BRIGHT_BLUE))
 
 
 @app.command()
@@ -217,28 +389,28 @@ def show(entity_id: str):
     """
     try:
         uid: UUID = UUID(entity_id)
-        if uid in banking_app.ledger.store["accounts"]:
+        if get_banking_app().has_account(uid):
             typer.echo(typer.style("Account", fg=typer.colors.MAGENTA))
             typer.echo(typer.style("=========", fg=typer.colors.MAGENTA))
             typer.echo(
                 typer.style(
                     json.dumps(
-                        banking_app.get_account_details(uid), indent=4, sort_keys=True
+                        get_banking_app().get_account_details(uid),
+                        indent=4,
+                        sort_keys=True,
                     ),
                     fg=typer.colors.BRIGHT_BLUE,
                 )
             )
             typer.Exit()
-        elif uid in banking_app.ledger.store["transactions"]:
+            return
+        transaction = get_banking_app().get_transaction_details(uid)
+        if transaction is not None:
             typer.echo(typer.style("Transaction", fg=typer.colors.MAGENTA))
             typer.echo(typer.style("=========", fg=typer.colors.MAGENTA))
             typer.echo(
                 typer.style(
-                    json.dumps(
-                        banking_app.ledger.store["transactions"][uid].to_dict(),
-                        indent=4,
-                        sort_keys=True,
-                    ),
+                    json.dumps(transaction, indent=4, sort_keys=True),
                     fg=typer.colors.BRIGHT_BLUE,
                 )
             )
@@ -272,7 +444,7 @@ def close(account_id: str, date: str = None):
     if not close:
         raise typer.Abort()
     try:
-        transaction_id = banking_app.close_account(UUID(account_id))
+        transaction_id = get_banking_app().close_account(UUID(account_id))
         if transaction_id is not None:
             typer.echo(f"Account {account_id} was not empty")
             typer.echo(f"Account balance has been withdrawn")
@@ -287,5 +459,155 @@ def close(account_id: str, date: str = None):
         raise typer.Abort()
 
 
+@app.command()
+def batch(
+    file: typer.FileText = typer.Argument("-", encoding="utf-8"),
+    format: str = None,
+    chunk_size: int = 1000,
+    report: typer.FileTextWrite = typer.Option("-", encoding="utf-8"),
+):
+    """Run deposits, withdrawals, account openings and closures from a file
+
+    file -- CSV or JSON lines file of operations, - reads from stdin
+
+    The CSV header names the columns used out of operation, account_id,
+    amount, account_type, atm and date. JSON lines have the same keys.
+    Operations are open, deposit, withdraw and close.
+
+    Use --format to set csv or jsonl, by default it's taken from the file
+    extension and stdin is read as csv
+
+    Use --chunk-size to set how many operations are run between writes of the
+    ledger. Default is 1000.
+
+    Use --report to write the result of each line to a file instead of stdout
+
+    Example:
+
+    - banking batch payroll.csv --report payroll-report.jsonl
+
+    - cat payroll.jsonl | banking batch - --format jsonl
+    """
+    if format is None:
+        format = "jsonl" if file.name.endswith((".jsonl", ".json")) else "csv"
+    if format not in ("csv", "jsonl"):
+        typer.echo(f"Invalid format {style(format, is_success=False)}")
+        raise typer.Abort()
+    from banking.batch import read_operations, run_batch
+
+    # The files are closed by typer once the command is done
+    result = run_batch(
+        get_banking_app(),  # type: ignore
+        read_operations(file, format),  # type: ignore
+        report,
+        chunk_size=chunk_size,
+    )
+    summary = (
+        f"{result.total} operations, {style(f'{result.succeeded} succeeded')}, "
+        f"{style(f'{result.failed} failed', is_success=not result.failed)} "
+        f"in {result.elapsed:.2f}s ({result.ops_per_second:.0f} ops/sec)"
+    )
+    typer.echo(summary, err=True)
+
+
+@app.command()
+def report(day: str = None):
+    """Report the balance of every open account, their daily withdrawal
+    totals and the totals by transaction type
+
+    Use --day to only list the withdrawal totals of that day, eg. for the
+    COVID daily withdrawal limit
+
+    day format is YYYY-mm-dd eg. 2020-04-01
+
+    Example:
+
+    - banking report
+
+    - banking report --day 2020-04-01
+    """
+    try:
+        withdrawals_on = datetime.strptime(day, DATE_FORMAT).date() if day else None
+    except ValueError:
+        typer.echo("Invalid date")
+        raise typer.Abort()
+    typer.echo(
+        typer.style(
+            json.dumps(
+                get_banking_app().report(withdrawals_on), indent=4, sort_keys=True
+            ),
+            fg=typer.colors.BRIGHT_BLUE,
+        )
+    )
+
+
+@app.command(name="serve")
+def serve_command(socket: str = SOCKET_PATH, metrics_port: int = None):
+    """Keep the ledger loaded and serve the other commands over a Unix socket
+
+    While the server is running the other commands send their work to it
+    instead of loading the ledger themselves. Stop it with Ctrl+C.
+
+    Use --socket to set the socket path, default is banking.sock or the
+    BANKING_SOCKET environment variable. Clients use the same setting.
+
+    Use --metrics-port to serve the server's metrics in Prometheus format
+    on http://127.0.0.1:<port>/metrics
+
+    Example:
+
+    - banking serve
+
+    - BANKING_SOCKET=/tmp/banking.sock banking serve --metrics-port 9100
+    """
+    metrics_server = None
+    if metrics_port is not None:
+        from banking.metrics import serve_metrics
+
+        metrics_server = serve_metrics(enable_metrics(), metrics_port)
+    try:
+        application = get_banking_app()
+        if isinstance(application, BankingClient):
+            typer.echo(style(f"A server is already running on {socket}", False))
+            raise typer.Abort()
+        typer.echo(f"Serving the ledger on {style(socket)}")
+        if metrics_server is not None:
+            host, port = metrics_server.server_address[:2]
+            typer.echo(f"Serving metrics on {style(f'http://{host}:{port}/metrics')}")
+        serve(application, socket)
+    finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
+            metrics_server.server_close()
+
+
+@app.command(name="reshard")
+def reshard_command(source: str, target: str, shards: int = DEFAULT_SHARDS):
+    """Copy a pickled or sharded ledger into a sharded ledger
+
+    source -- ledger file to reshard
+
+    target -- manifest file of the sharded ledger, give the source again to
+    reshard it in place
+
+    Use --shards to set the number of shards.
+
+    The other commands use a sharded ledger file as such, eg.
+    banking --ledger sharded.pkl ls
+
+    Example:
+
+    - banking reshard ledger.pkl sharded.pkl --shards 64
+    """
+    from banking.sharded_ledger import reshard
+
+    try:
+        ledger = reshard(source, target, shards)
+    except (OSError, LedgerError) as e:
+        typer.echo(style(str(e), is_success=False))
+        raise typer.Abort()
+    typer.echo(f"{style(target)} has {ledger.shard_count} shards")
+
+
 if __name__ == "__main__":
     app()
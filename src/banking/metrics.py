@@ -0,0 +1,289 @@
+"""Timers and counters of the application and ledger hot paths.
+
+Nothing is measured unless a Metrics object is given to the Application,
+which then replaces the instrumented methods of itself and it's ledger
+with timed ones. Without it the methods are called directly.
+"""
+
+import inspect
+import os
+import threading
+import time
+import typing
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Ledger methods timed under ledger_<name>. read_account builds the
+# accounts missing from get_account's cache with the balance and withdrawal
+# aggregations get_account_balance and get_total_withdrawn_amount_by_date.
+LEDGER_METHODS = (
+    "load",
+    "get_account",
+    "read_account",
+    "get_account_balance",
+    "get_total_withdrawn_amount_by_date",
+    "build_indexes",
+)
+
+
+class Histogram:
+    """Count and sum of observed values with the most recent of them kept
+    for quantiles"""
+
+    SAMPLES = 1024
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.sum = 0.0
+        self.samples: typing.Deque[float] = deque(maxlen=self.SAMPLES)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantile(self, fraction: float) -> float:
+        """Return the recent sample below which the given fraction of
+        recent samples fall, 0 if nothing was observed"""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Metrics:
+    """Registry of named counters and histograms.
+
+    Timed stages are histograms named <stage>_seconds, every call is also
+    counted in <stage>_calls_total and every call that raised in
+    <stage>_errors_total.
+    """
+
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, namespace: str = "banking") -> None:
+        """
+        Keyword Arguments:
+            namespace {str} -- prefix of the exported metric names
+            (default: {"banking"})
+        """
+        self.namespace = namespace
+        self.counters: typing.Dict[str, float] = {}
+        self.histograms: typing.Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, amount: float = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def record_call(self, stage: str, seconds: float, failed: bool = False):
+        """Record a call of stage that took seconds"""
+        with self.lock:
+            histogram = self.histograms.get(f"{stage}_seconds")
+            if histogram is None:
+                histogram = self.histograms[f"{stage}_seconds"] = Histogram()
+            histogram.observe(seconds)
+            calls = f"{stage}_calls_total"
+            self.counters[calls] = self.counters.get(calls, 0) + 1
+            if failed:
+                errors = f"{stage}_errors_total"
+                self.counters[errors] = self.counters.get(errors, 0) + 1
+
+    @contextmanager
+    def timer(self, stage: str) -> typing.Iterator[None]:
+        """Time the block as a call of stage"""
+        started_at = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.record_call(stage, time.perf_counter() - started_at, failed)
+
+    def timed(self, function: typing.Callable, stage: str) -> typing.Callable:
+        """Return function timed as stage. A generator function's call is
+        timed over it's whole iteration without the time spent by the
+        caller between items."""
+        perf_counter = time.perf_counter
+        record_call = self.record_call
+
+        if inspect.isgeneratorfunction(function):
+
+            @wraps(function)
+            def timed_generator(*args, **kwargs):
+                elapsed = 0.0
+                failed = True
+                generator = function(*args, **kwargs)
+                try:
+                    while True:
+                        started_at = perf_counter()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            failed = False
+                            return
+                        finally:
+                            elapsed += perf_counter() - started_at
+                        try:
+                            yield item
+                        except GeneratorExit:
+                            # Closed by the caller before the end
+                            failed = False
+                            raise
+                finally:
+                    generator.close()
+                    record_call(stage, elapsed, failed)
+
+            return timed_generator
+
+        @wraps(function)
+        def timed_function(*args, **kwargs):
+            started_at = perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                record_call(stage, perf_counter() - started_at, failed)
+
+        return timed_function
+
+    def instrument(self, obj: typing.Any, methods: typing.Iterable[str], prefix: str):
+        """Replace methods of obj with ones timed as <prefix>_<method>.
+
+        Only obj itself is changed, so methods calling each other through
+        self are timed too while calls through super() are not counted twice.
+        """
+        for name in methods:
+            setattr(obj, name, self.timed(getattr(obj, name), f"{prefix}_{name}"))
+
+    def instrument_ledger(self, ledger: typing.Any):
+        """Time the ledger's load, lookups and aggregations and it's
+        persists along with the bytes each of them wrote"""
+        self.instrument(ledger, LEDGER_METHODS, "ledger")
+        persist = ledger.persist
+
+        @wraps(persist)
+        def measured_persist():
+            bytes_written = ledger.bytes_written
+            with self.timer("ledger_persist"):
+                persist()
+            written = ledger.bytes_written - bytes_written
+            self.observe("ledger_persist_bytes", written)
+            self.increment("ledger_bytes_written_total", written)
+
+        ledger.persist = measured_persist
+
+    def profile(self) -> str:
+        """Return a table of the calls, total time and quantiles of every
+        timed stage, longest total first, times in milliseconds"""
+        lines = [
+            f"{'stage':<48} {'calls':>7} {'total ms':>10}"
+            + "".join(f" {f'p{fraction * 100:g} ms':>9}" for fraction in self.QUANTILES)
+        ]
+        with self.lock:
+            stages = [
+                (name[: -len("_seconds")], histogram)
+                for name, histogram in self.histograms.items()
+                if name.endswith("_seconds")
+            ]
+            stages.sort(key=lambda stage: stage[1].sum, reverse=True)
+            for stage, histogram in stages:
+                lines.append(
+                    f"{stage:<48} {histogram.count:>7} {histogram.sum * 1000:>10.3f}"
+                    + "".join(
+                        f" {histogram.quantile(fraction) * 1000:>9.3f}"
+                        for fraction in self.QUANTILES
+                    )
+                )
+        return "\n".join(lines)
+
+    def to_prometheus(self) -> str:
+        """Return every metric in the Prometheus text exposition format,
+        histograms as summaries with their QUANTILES"""
+        lines = []
+        # Held throughout as the histograms' samples change on every call
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{self.namespace}_{name}"
+                lines.append(f"# TYPE {metric} summary")
+                for fraction in self.QUANTILES:
+                    lines.append(
+                        f'{metric}{{quantile="{fraction:g}"}} '
+                        f"{histogram.quantile(fraction):.9g}"
+                    )
+                lines.append(f"{metric}_sum {histogram.sum:.9g}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, filename: str):
+        """Replace filename with the metrics in the Prometheus text format,
+        as read by the node exporter's textfile collector"""
+        temp_filename = f"{filename}.{os.getpid()}.tmp"
+        with open(temp_filename, "w") as metrics_file:
+            metrics_file.write(self.to_prometheus())
+        os.replace(temp_filename, filename)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Answers GET /metrics with the server's metrics"""
+
+    server: "MetricsServer"
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Scrapes are not logged"""
+
+
+class MetricsServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, metrics: Metrics, address: typing.Tuple[str, int]):
+        self.metrics = metrics
+        super().__init__(address, MetricsRequestHandler)
+
+
+def serve_metrics(
+    metrics: Metrics, port: int, host: str = "127.0.0.1"
+) -> MetricsServer:
+    """Serve the metrics on http://host:port/metrics from a background
+    thread until the returned server is shut down
+
+    Arguments:
+        metrics {Metrics} -- metrics to serve
+        port {int} -- port to listen on, 0 picks a free one
+
+    Keyword Arguments:
+        host {str} -- address to listen on (default: {"127.0.0.1"})
+    """
+    server = MetricsServer(metrics, (host, port))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
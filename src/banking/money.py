@@ -0,0 +1,134 @@
+import typing
+from decimal import ROUND_HALF_UP, Decimal
+from functools import total_ordering
+
+from banking.error import InvalidAmountError
+
+Amount = typing.Union["Money", int, float, Decimal, str]
+
+
+@total_ordering
+class Money:
+    """An amount of PLN held as a whole number of grosz.
+
+    Money can be added to and subtracted from other Money and plain
+    numbers, which are converted with Money.of first. It can be multiplied
+    by whole numbers. It's compared with other Money, ints, floats and
+    Decimals by their exact value without rounding them, so amounts equal
+    to Money hash alike, eg. Money.of(45.37) != 45.37 as the float isn't
+    exactly 45.37, compare with Money.of(45.37) instead.
+    """
+
+    __slots__ = ("grosz",)
+
+    CURRENCY = "PLN"
+    GROSZ_PER_ZLOTY = 100
+
+    def __init__(self, grosz: int = 0) -> None:
+        if not isinstance(grosz, int):
+            raise TypeError(f"Money holds a whole number of grosz, got {grosz!r}")
+        self.grosz = grosz
+
+    @classmethod
+    def of(cls, amount: Amount) -> "Money":
+        """Convert an amount in zloty to Money, rounding it to the nearest grosz
+
+        Arguments:
+            amount {Amount} -- Amount in zloty eg. 12.34 or "12.34"
+
+        Raises:
+            InvalidAmountError: If amount is a bool, NaN or infinite
+
+        Returns:
+            Money -- The amount in grosz
+        """
+        if isinstance(amount, Money):
+            return amount
+        if isinstance(amount, bool):
+            raise InvalidAmountError(f"Invalid amount {amount!r}")
+        if isinstance(amount, int):
+            return cls(amount * cls.GROSZ_PER_ZLOTY)
+        if isinstance(amount, float):
+            # repr gives the shortest decimal that reads back as the same float
+            # eg. 45.37 and not 45.36999999999999744
+            amount = repr(amount)
+        zloty = Decimal(amount)
+        if not zloty.is_finite():
+            raise InvalidAmountError(f"Invalid amount {amount}")
+        grosz = (zloty * cls.GROSZ_PER_ZLOTY).quantize(
+            Decimal(1), rounding=ROUND_HALF_UP
+        )
+        return cls(int(grosz))
+
+    def to_decimal(self) -> Decimal:
+        """Return the amount in zloty"""
+        return Decimal(self.grosz) / self.GROSZ_PER_ZLOTY
+
+    def __add__(self, other: Amount) -> "Money":
+        try:
+            return Money(self.grosz + Money.of(other).grosz)
+        except (TypeError, ArithmeticError):
+            return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other: Amount) -> "Money":
+        try:
+            return Money(self.grosz - Money.of(other).grosz)
+        except (TypeError, ArithmeticError):
+            return NotImplemented
+
+    def __rsub__(self, other: Amount) -> "Money":
+        try:
+            return Money(Money.of(other).grosz - self.grosz)
+        except (TypeError, ArithmeticError):
+            return NotImplemented
+
+    def __mul__(self, times: int) -> "Money":
+        if not isinstance(times, int):
+            return NotImplemented
+        return Money(self.grosz * times)
+
+    __rmul__ = __mul__
+
+    def __neg__(self) -> "Money":
+        return Money(-self.grosz)
+
+    def __abs__(self) -> "Money":
+        return Money(abs(self.grosz))
+
+    def __bool__(self) -> bool:
+        return self.grosz != 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.grosz == other.grosz
+        if isinstance(other, int):
+            return self.grosz == other * self.GROSZ_PER_ZLOTY
+        if isinstance(other, (float, Decimal)):
+            return self.to_decimal() == other
+        return NotImplemented
+
+    def __lt__(self, other) -> bool:
+        if isinstance(other, Money):
+            return self.grosz < other.grosz
+        if isinstance(other, int):
+            return self.grosz < other * self.GROSZ_PER_ZLOTY
+        if isinstance(other, (float, Decimal)):
+            try:
+                return self.to_decimal() < other
+            except ArithmeticError:
+                return NotImplemented
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        # Equal to the hash of ints and Decimals with the same value
+        return hash(self.to_decimal())
+
+    def __str__(self) -> str:
+        sign = "-" if self.grosz < 0 else ""
+        zloty, grosz = divmod(abs(self.grosz), self.GROSZ_PER_ZLOTY)
+        return f"{sign}{zloty}.{grosz:02d} {self.CURRENCY}"
+
+    def __repr__(self) -> str:
+        return f"Money({self})"
@@ -0,0 +1,254 @@
+import os
+import typing
+from datetime import date
+from uuid import UUID
+
+from banking.account import Transaction
+from banking.columns import (
+    TRANSACTION_TYPE_CODES,
+    TRANSACTION_TYPES,
+    ColumnarLedger,
+    TransactionColumns,
+    TransactionFile,
+)
+from banking.ledger import Ledger
+from banking.money import Money
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ColumnsType = typing.Union[TransactionColumns, TransactionFile]
+
+DEBIT_CODE = TRANSACTION_TYPE_CODES[Transaction.TransactionType.DEBIT]
+
+
+class LedgerReport:
+    """Balances, daily withdrawal totals and per type totals of a ledger,
+    as returned one at a time by get_account_balance and
+    get_total_withdrawn_amount_by_date"""
+
+    def __init__(
+        self,
+        balances: typing.Dict[UUID, Money],
+        daily_withdrawals: typing.Dict[typing.Tuple[UUID, date], Money],
+        type_totals: typing.Dict[Transaction.TransactionType, Money],
+        type_counts: typing.Dict[Transaction.TransactionType, int],
+    ) -> None:
+        self.balances = balances
+        self.daily_withdrawals = daily_withdrawals
+        self.type_totals = type_totals
+        self.type_counts = type_counts
+
+    def to_dict(self, withdrawals_on: typing.Optional[date] = None) -> dict:
+        """Return the report as JSON values
+
+        Keyword Arguments:
+            withdrawals_on {Optional[date]} -- only list the withdrawal
+            totals of this day (default: {None})
+        """
+        return {
+            "balances": {
+                str(account_id): str(balance)
+                for account_id, balance in self.balances.items()
+            },
+            "daily_withdrawals": [
+                {
+                    "account_id": str(account_id),
+                    "date": day.isoformat(),
+                    "amount": str(amount),
+                }
+                for (account_id, day), amount in sorted(
+                    self.daily_withdrawals.items(), key=lambda item: item[0][1]
+                )
+                if withdrawals_on is None or day == withdrawals_on
+            ],
+            "transactions": {
+                transaction_type.value: {
+                    "count": self.type_counts[transaction_type],
+                    "amount": str(self.type_totals[transaction_type]),
+                }
+                for transaction_type in TRANSACTION_TYPES
+            },
+        }
+
+
+def ledger_columns(ledger: Ledger) -> TransactionColumns:
+    """Return the transactions of any ledger as columns, the columnar
+    ledger's own columns are copied instead of rebuilt"""
+    if isinstance(ledger, ColumnarLedger):
+        with ledger.store_lock:
+            return ledger.columns.copy()
+    columns = TransactionColumns()
+    for transaction in ledger.all_transactions():
+        columns.append(transaction)
+    return columns
+
+
+def current_transaction_file(ledger: Ledger) -> typing.Optional[TransactionFile]:
+    """Map a columnar ledger's transaction file if it holds every stored
+    transaction, ie. the ledger keeps one and has no unflushed writes.
+    Must be called holding the ledger's flush and store locks."""
+    if (
+        not isinstance(ledger, ColumnarLedger)
+        or ledger.transaction_filename is None
+        or ledger.unflushed_writes
+        or not os.path.exists(ledger.transaction_filename)
+    ):
+        return None
+    transaction_file = ledger.open_transaction_file()
+    if len(transaction_file) != len(ledger.columns):
+        transaction_file.close()
+        return None
+    return transaction_file
+
+
+def build_report(
+    columns: ColumnsType,
+    account_ids: typing.Iterable[UUID],
+    use_numpy: typing.Optional[bool] = None,
+) -> LedgerReport:
+    """Aggregate every transaction in a single pass over the columns
+
+    Arguments:
+        columns {ColumnsType} -- the ledger's transactions
+        account_ids {Iterable[UUID]} -- the accounts to report on, usually
+        the open accounts
+
+    Keyword Arguments:
+        use_numpy {Optional[bool]} -- group with NumPy instead of a Python
+        loop, by default when NumPy is installed (default: {None})
+
+    Returns:
+        LedgerReport -- the report
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    aggregate = aggregate_with_numpy if use_numpy else aggregate_with_python
+    balances, withdrawals, type_totals, type_counts = aggregate(columns)
+    accounts = columns.account_ids
+    reported = list(account_ids)
+    reported_set = set(reported)
+    return LedgerReport(
+        balances={
+            account_id: Money(balances.get(account_id, 0)) for account_id in reported
+        },
+        daily_withdrawals={
+            (accounts[ordinal], date.fromordinal(day)): Money(amount)
+            for (ordinal, day), amount in withdrawals.items()
+            if accounts[ordinal] in reported_set
+        },
+        type_totals={
+            transaction_type: Money(type_totals.get(code, 0))
+            for code, transaction_type in enumerate(TRANSACTION_TYPES)
+        },
+        type_counts={
+            transaction_type: type_counts.get(code, 0)
+            for code, transaction_type in enumerate(TRANSACTION_TYPES)
+        },
+    )
+
+
+AggregatesType = typing.Tuple[
+    typing.Dict[UUID, int],
+    typing.Dict[typing.Tuple[int, int], int],
+    typing.Dict[int, int],
+    typing.Dict[int, int],
+]
+
+
+def aggregate_with_python(columns: ColumnsType) -> AggregatesType:
+    """Balances by account id, debits by (account ordinal, day ordinal)
+    and amounts and counts by type code, all in grosz"""
+    balances_by_ordinal: typing.Dict[int, int] = {}
+    withdrawals: typing.Dict[typing.Tuple[int, int], int] = {}
+    type_totals: typing.Dict[int, int] = {}
+    type_counts: typing.Dict[int, int] = {}
+    for ordinal, code, day, amount in zip(
+        columns.account_ordinals,
+        columns.transaction_types,
+        columns.days,
+        columns.amounts,
+    ):
+        type_totals[code] = type_totals.get(code, 0) + amount
+        type_counts[code] = type_counts.get(code, 0) + 1
+        if code == DEBIT_CODE:
+            key = (ordinal, day)
+            withdrawals[key] = withdrawals.get(key, 0) + amount
+            amount = -amount
+        balances_by_ordinal[ordinal] = balances_by_ordinal.get(ordinal, 0) + amount
+    accounts = columns.account_ids
+    balances = {
+        accounts[ordinal]: balance for ordinal, balance in balances_by_ordinal.items()
+    }
+    return balances, withdrawals, type_totals, type_counts
+
+
+def group_sums(keys, values) -> typing.Tuple[typing.Any, typing.Any]:
+    """Sum values by key with NumPy, returning the sorted distinct keys
+    and their sums. Sums stay in 64 bit integers unlike bincount weights."""
+    if len(keys) == 0:
+        return keys, values
+    order = numpy.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], numpy.add.reduceat(values[order], starts)
+
+
+def aggregate_with_numpy(columns: ColumnsType) -> AggregatesType:
+    """Same as aggregate_with_python with the grouping done by NumPy over
+    the columns' buffers, a transaction file's arrays are read in place"""
+    arrays = (
+        columns.arrays()
+        if isinstance(columns, TransactionFile)
+        else {
+            name: numpy.asarray(getattr(columns, name))
+            for name in ("account_ordinals", "transaction_types", "days", "amounts")
+        }
+    )
+    ordinals = arrays["account_ordinals"].astype(numpy.int64)
+    codes = arrays["transaction_types"]
+    days = arrays["days"].astype(numpy.int64)
+    amounts = arrays["amounts"].astype(numpy.int64, copy=False)
+    is_debit = codes == DEBIT_CODE
+    signed = numpy.where(is_debit, -amounts, amounts)
+
+    accounts = columns.account_ids
+    keys, sums = group_sums(ordinals, signed)
+    balances = {
+        accounts[ordinal]: balance
+        for ordinal, balance in zip(keys.tolist(), sums.tolist())
+    }
+    # Account and day ordinals both fit in 32 bits
+    keys, sums = group_sums(
+        (ordinals[is_debit] << 32) | days[is_debit], amounts[is_debit]
+    )
+    withdrawals = {
+        (key >> 32, key & 0xFFFFFFFF): amount
+        for key, amount in zip(keys.tolist(), sums.tolist())
+    }
+    keys, sums = group_sums(codes, amounts)
+    type_totals = dict(zip(keys.tolist(), sums.tolist()))
+    keys, counts = group_sums(codes, numpy.ones(len(codes), dtype=numpy.int64))
+    type_counts = dict(zip(keys.tolist(), counts.tolist()))
+    return balances, withdrawals, type_totals, type_counts
+
+
+def report_ledger(
+    ledger: Ledger, use_numpy: typing.Optional[bool] = None
+) -> LedgerReport:
+    """Report on the open accounts of a loaded ledger, see build_report.
+
+    The transactions are read from a columnar ledger's transaction file
+    when it's up to date and from a copy of the ledger's columns otherwise.
+    """
+    with ledger.flush_lock, ledger.store_lock:
+        transaction_file = current_transaction_file(ledger)
+        account_ids = list(ledger.all_account_ids())
+        if transaction_file is None:
+            columns = ledger_columns(ledger)
+    if transaction_file is None:
+        return build_report(columns, account_ids, use_numpy)
+    with transaction_file:
+        return build_report(transaction_file, account_ids, use_numpy)
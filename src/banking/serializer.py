@@ -0,0 +1,184 @@
+import pickle
+import struct
+import typing
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import date
+from uuid import UUID
+
+from banking.account import (
+    ACCOUNT_CLASS_TYPE_MAPPING,
+    ACCOUNT_TYPE_CLASS_MAPPING,
+    BankAccount,
+    Transaction,
+)
+from banking.error import LedgerCorruptedError
+from banking.money import Money
+
+# Transaction types are stored as their position in this list
+TRANSACTION_TYPES: typing.List[Transaction.TransactionType] = list(
+    Transaction.TransactionType
+)
+TRANSACTION_TYPE_CODES: typing.Dict[Transaction.TransactionType, int] = {
+    transaction_type: code for code, transaction_type in enumerate(TRANSACTION_TYPES)
+}
+
+# The store of a Ledger, see Ledger.empty_store
+StoreType = typing.Dict[str, typing.OrderedDict]
+
+BINARY_MAGIC = b"BANKBIN1"
+# Magic, number of account type tags, accounts and transactions
+BINARY_HEADER = struct.Struct("<8sBQQ")
+# Account id and the position of it's type tag in the header
+ACCOUNT_RECORD = struct.Struct("<16sB")
+# Transaction id, account id, type code, day ordinal and amount in grosz
+TRANSACTION_RECORD = struct.Struct("<16s16sBIq")
+
+
+class StoreSerializer(ABC):
+    """Converts a ledger store to the payload of the ledger file and back"""
+
+    @abstractmethod
+    def dumps(self, store: StoreType) -> bytes:
+        """Return the payload of store"""
+
+    @abstractmethod
+    def loads(self, payload: bytes) -> StoreType:
+        """Return the store of payload"""
+
+
+class PickleSerializer(StoreSerializer):
+    """The store pickled as it is, account classes and transactions
+    included. Binary payloads are loaded too."""
+
+    def dumps(self, store: StoreType) -> bytes:
+        return pickle.dumps(store, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, payload: bytes) -> StoreType:
+        if payload.startswith(BINARY_MAGIC):
+            return BinarySerializer().loads(payload)
+        return pickle.loads(payload)
+
+
+class BinarySerializer(StoreSerializer):
+    """The accounts and transactions of the store as fixed width records.
+
+    After BINARY_HEADER come the account type tags, each a length byte and
+    the tag eg. "covid" (see ACCOUNT_TYPE_CLASS_MAPPING), then an
+    ACCOUNT_RECORD per account and a TRANSACTION_RECORD per transaction in
+    store order. UUIDs take their 16 bytes, dates their day ordinal and
+    amounts their grosz, a transaction takes 45 bytes. Loading builds
+    objects from these values only, nothing in the file is executed, and
+    any other payload eg. a pickle is refused.
+    """
+
+    def dumps(self, store: StoreType) -> bytes:
+        if set(store) != {"accounts", "transactions"}:
+            raise ValueError(
+                "Only stores of accounts and transactions can be serialized"
+            )
+        tags = list(ACCOUNT_TYPE_CLASS_MAPPING)
+        tag_codes = {
+            account_class: tags.index(account_type)
+            for account_class, account_type in ACCOUNT_CLASS_TYPE_MAPPING.items()
+        }
+        accounts = store["accounts"]
+        transactions = store["transactions"]
+        chunks = [
+            BINARY_HEADER.pack(
+                BINARY_MAGIC, len(tags), len(accounts), len(transactions)
+            )
+        ]
+        for tag in tags:
+            encoded = tag.encode()
+            chunks.append(bytes([len(encoded)]) + encoded)
+        pack_account = ACCOUNT_RECORD.pack
+        chunks.extend(
+            pack_account(account_id.bytes, tag_codes[account_class])
+            for account_id, account_class in accounts.items()
+        )
+        pack_transaction = TRANSACTION_RECORD.pack
+        chunks.extend(
+            pack_transaction(
+                transaction.transaction_id.bytes,
+                transaction.account_id.bytes,
+                TRANSACTION_TYPE_CODES[transaction.transaction_type],
+                transaction.occurred_on.toordinal(),
+                transaction.amount.grosz,
+            )
+            for transaction in transactions.values()
+        )
+        return b"".join(chunks)
+
+    def loads(self, payload: bytes) -> StoreType:
+        """
+        Raises:
+            LedgerCorruptedError: If the payload isn't a binary store, is cut
+            short or names an unknown account type
+        """
+        try:
+            return self.read_store(memoryview(payload))
+        except (struct.error, IndexError, ValueError) as e:
+            raise LedgerCorruptedError(f"Ledger file records are damaged: {e}")
+
+    def read_store(self, payload: memoryview) -> StoreType:
+        magic, tag_count, account_count, transaction_count = BINARY_HEADER.unpack_from(
+            payload
+        )
+        if magic != BINARY_MAGIC:
+            raise ValueError("not a binary ledger")
+        offset = BINARY_HEADER.size
+        account_classes: typing.List[typing.Type[BankAccount]] = []
+        for _ in range(tag_count):
+            length = payload[offset]
+            tag = bytes(payload[offset + 1 : offset + 1 + length]).decode()
+            if tag not in ACCOUNT_TYPE_CLASS_MAPPING:
+                raise ValueError(f"unknown account type {tag}")
+            account_classes.append(ACCOUNT_TYPE_CLASS_MAPPING[tag])
+            offset += 1 + length
+
+        accounts_end = offset + account_count * ACCOUNT_RECORD.size
+        transactions_end = accounts_end + transaction_count * TRANSACTION_RECORD.size
+        if len(payload) != transactions_end:
+            raise ValueError("unexpected length")
+        accounts: typing.OrderedDict = OrderedDict(
+            (UUID(bytes=bytes(account_id)), account_classes[code])
+            for account_id, code in ACCOUNT_RECORD.iter_unpack(
+                payload[offset:accounts_end]
+            )
+        )
+
+        # Account ids and days repeat, each is built once and shared
+        account_ids: typing.Dict[bytes, UUID] = {
+            account_id.bytes: account_id for account_id in accounts
+        }
+        days: typing.Dict[int, date] = {}
+        transactions: typing.OrderedDict = OrderedDict()
+        for (
+            transaction_id,
+            account_id,
+            code,
+            day,
+            grosz,
+        ) in TRANSACTION_RECORD.iter_unpack(payload[accounts_end:]):
+            account_uuid = account_ids.get(account_id)
+            if account_uuid is None:
+                account_uuid = account_ids[account_id] = UUID(bytes=account_id)
+            occurred_on = days.get(day)
+            if occurred_on is None:
+                occurred_on = days[day] = date.fromordinal(day)
+            transaction_uuid = UUID(bytes=transaction_id)
+            transactions[transaction_uuid] = Transaction(
+                account_uuid,
+                TRANSACTION_TYPES[code],
+                Money(grosz),
+                occurred_on,
+                transaction_uuid,
+            )
+        return {"accounts": accounts, "transactions": transactions}
+
+
+SERIALIZER_CLASS_MAPPING: typing.Dict[str, typing.Type[StoreSerializer]] = {
+    "pickle": PickleSerializer,
+    "binary": BinarySerializer,
+}
@@ -0,0 +1,445 @@
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import types
+import typing
+from contextlib import contextmanager
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
+from banking import error
+from banking.date_helper import get_todays_date, set_todays_date
+from banking.error import RemoteError
+from banking.money import Amount, Money
+
+if typing.TYPE_CHECKING:
+    # Not imported at runtime so clients don't load every ledger backend
+    from banking.application import Application
+
+DEFAULT_SOCKET_PATH = "banking.sock"
+
+# Open streams of a connection by cursor
+CursorsType = typing.Dict[int, typing.Iterator]
+
+
+
+def error_classes(
+    base: typing.Type[Exception],
+) -> typing.Iterator[typing.Type[Exception]]:
+    """Yield an error class and every subclass of it"""
+    yield base
+    for subclass in base.__subclasses__():
+        yield from error_classes(subclass)
+
+
+# Errors raised by the application that are sent back to and re-raised
+# by the client, any other error is sent as the nearest of it's base
+# classes found here
+ERROR_CLASS_MAPPING: typing.Dict[str, typing.Type[Exception]] = {
+    error_class.__name__: error_class
+    for error_class in (
+        *error_classes(error.AccountError),
+        *error_classes(error.LedgerError),
+        KeyError,
+        ValueError,
+    )
+}
+
+
+def error_name(e: Exception) -> typing.Optional[str]:
+    """Name an error is sent as, None if it's not one of
+    ERROR_CLASS_MAPPING's errors"""
+    for error_class in type(e).__mro__:
+        if ERROR_CLASS_MAPPING.get(error_class.__name__) is error_class:
+            return error_class.__name__
+    return None
+
+
+def encode(value: typing.Any) -> typing.Any:
+    """Convert application results to JSON values"""
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (list, types.GeneratorType)):
+        return [encode(item) for item in value]
+    return value
+
+
+class BankingRequestHandler(socketserver.StreamRequestHandler):
+    """Reads JSON line requests from a connection and answers each with
+    a JSON line.
+
+    A request is `{"method": "deposit", "params": {...}}`, optionally
+    with the `"date"` it's performed on, and it's response
+    `{"result": ...}` or `{"error": "ErrorClass", "message": "..."}`.
+    A stream method answers with it's first page and, while there are more,
+    a `"cursor"` to read the next one with `{"method": "next_page",
+    "params": {"cursor": ...}}`. Cursors belong to the connection.
+    """
+
+    server: "BankingServer"
+
+    def handle(self):
+        cursors: CursorsType = {}
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.dispatch(line, cursors)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class BankingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Keeps one started Application in memory and serves it's methods
+    over a Unix domain socket.
+
+    Requests from all connections are applied one at a time, each on the
+    date it was sent with and otherwise on the server's date. Writes held
+    back by the batch durability policy are flushed once their batch window
+    passes even if no more writes arrive.
+    """
+
+    daemon_threads = True
+
+    METHODS = (
+        "open_account",
+        "deposit",
+        "withdraw",
+        "close_account",
+        "all_accounts",
+        "all_transactions",
+        "all_account_ids",
+        "all_transaction_ids",
+        "stream_accounts",
+        "stream_transactions",
+        "has_account",
+        "get_account_details",
+        "get_transaction_details",
+        "report",
+        "flush",
+        "next_page",
+        "ledger_file",
+    )
+    STREAM_METHODS = ("stream_accounts", "stream_transactions")
+    # Entries sent per stream response
+    PAGE_SIZE = 1000
+    # Streams a connection may leave unread, the oldest is dropped beyond
+    MAX_CURSORS = 16
+    UUID_PARAMS = ("account_id", "transaction_id")
+    DATE_PARAMS = ("withdrawals_on", "since", "until")
+
+    def __init__(self, app: "Application", socket_path: str = DEFAULT_SOCKET_PATH):
+        """
+        Arguments:
+            app {Application} -- a started application
+
+        Keyword Arguments:
+            socket_path {str} -- where the socket is created
+            (default: {DEFAULT_SOCKET_PATH})
+        """
+        self.app = app
+        self.socket_path = socket_path
+        self.lock = threading.Lock()
+        self.cursor_ids = itertools.count(1)
+        if os.path.exists(socket_path) and not is_serving(socket_path):
+            # Left behind by a server that didn't shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, BankingRequestHandler)
+
+    def dispatch(
+        self, line: bytes, cursors: typing.Optional[CursorsType] = None
+    ) -> dict:
+        """Run a single request against the application
+
+        Arguments:
+            line {bytes} -- the JSON request
+
+        Keyword Arguments:
+            cursors {Optional[CursorsType]} -- the streams opened by earlier
+            requests of the connection (default: {None})
+        """
+        if cursors is None:
+            cursors = {}
+        try:
+            request = json.loads(line)
+            method = request["method"]
+            if method not in self.METHODS:
+                raise ValueError(f"Invalid method {method}")
+            params = dict(request.get("params", {}))
+            occurring_on = request.get("date")
+            if occurring_on is not None:
+                occurring_on = date.fromisoformat(occurring_on)
+        except (ValueError, KeyError, TypeError) as e:
+            return {"error": "RemoteError", "message": f"Invalid request: {e}"}
+        try:
+            for name in self.UUID_PARAMS:
+                if params.get(name) is not None:
+                    params[name] = UUID(params[name])
+            for name in self.DATE_PARAMS:
+                if params.get(name) is not None:
+                    params[name] = date.fromisoformat(params[name])
+            with self.lock:
+                server_date = get_todays_date()
+                if occurring_on is not None:
+                    set_todays_date(occurring_on)
+                try:
+                    if method == "next_page":
+                        return self.next_page(cursors, params["cursor"])
+                    if method == "ledger_file":
+                        return {"result": os.path.abspath(self.app.ledger_file_name)}
+                    if method in self.STREAM_METHODS:
+                        entries = getattr(self.app, method)(snapshot=True, **params)
+                        return self.open_cursor(cursors, entries)
+                    result = encode(getattr(self.app, method)(**params))
+                finally:
+                    set_todays_date(server_date)
+            return {"result": result}
+        except Exception as e:
+            name = error_name(e)
+            if name is None:
+                return {"error": "RemoteError", "message": f"{type(e).__name__}: {e}"}
+            message = e.args[0] if e.args else ""
+            return {"error": name, "message": str(message)}
+
+    def open_cursor(self, cursors: CursorsType, entries: typing.Iterator) -> dict:
+        """Answer a stream request with it's first page. The stream lists
+        it's entries as the page is read so the pages that follow aren't
+        changed by writes made in between."""
+        cursor = next(self.cursor_ids)
+        cursors[cursor] = entries
+        while len(cursors) > self.MAX_CURSORS:
+            del cursors[next(iter(cursors))]
+        return self.next_page(cursors, cursor)
+
+    def next_page(self, cursors: CursorsType, cursor: int) -> dict:
+        """Answer with the next page of a stream and it's cursor unless the
+        stream is finished
+
+        Raises:
+            ValueError: If the cursor isn't an open stream of the connection
+        """
+        entries = cursors.get(cursor)
+        if entries is None:
+            raise ValueError(f"Invalid cursor {cursor}")
+        page = [encode(entry) for entry in itertools.islice(entries, self.PAGE_SIZE)]
+        if len(page) < self.PAGE_SIZE:
+            del cursors[cursor]
+            return {"result": page}
+        return {"result": page, "cursor": cursor}
+
+    def service_actions(self):
+        ledger = self.app.ledger
+        with self.lock:
+            if ledger.unflushed_writes and ledger.flush_due:
+                ledger.flush()
+
+    def server_close(self):
+        super().server_close()
+        with self.lock:
+            self.app.flush()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def is_serving(socket_path: str) -> bool:
+    """Returns True if a server is accepting connections on the socket"""
+    if not os.path.exists(socket_path):
+        return False
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(app: "Application", socket_path: str = DEFAULT_SOCKET_PATH):
+    """Serve the application until interrupted, then flush the ledger and
+    remove the socket"""
+    with BankingServer(app, socket_path) as server:
+        try:
+            server.serve_forever(poll_interval=0.1)
+        except KeyboardInterrupt:
+            pass
+
+
+class BankingClient:
+    """Application lookalike that runs every call on a BankingServer.
+
+    Used by the CLI when a server is running so commands don't have to
+    load the ledger themselves.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH) -> None:
+        self.socket_path = socket_path
+        self.connection: typing.Optional[socket.socket] = None
+        self.responses: typing.Optional[typing.BinaryIO] = None
+        # Sent with every call, the server's date is never changed
+        self.current_date: typing.Optional[date] = None
+
+    def connect(self):
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(self.socket_path)
+        self.responses = self.connection.makefile("rb")
+
+    def close(self):
+        if self.connection is not None:
+            self.responses.close()  # type: ignore
+            self.connection.close()
+            self.connection = None
+
+    def __enter__(self) -> "BankingClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, method: str, **params) -> typing.Any:
+        """Run an application method on the server and return it's result
+
+        Raises:
+            AccountError: As raised by the application
+            RemoteError: If the server rejects the request or goes away
+        """
+        return self.request(method, **params)["result"]
+
+    def request(self, method: str, **params) -> dict:
+        """Send a request to the server and return it's response
+
+        Raises:
+            AccountError: As raised by the application
+            RemoteError: If the server rejects the request or goes away
+        """
+        if self.connection is None:
+            self.connect()
+        request: typing.Dict[str, typing.Any] = {
+            "method": method,
+            "params": encode_params(params),
+        }
+        if self.current_date is not None:
+            request["date"] = self.current_date.isoformat()
+        self.connection.sendall(json.dumps(request).encode() + b"\n")  # type: ignore
+        line = self.responses.readline()  # type: ignore
+        if not line:
+            self.close()
+            raise RemoteError("Connection closed by the server")
+        response = json.loads(line)
+        if "error" in response:
+            error_class = ERROR_CLASS_MAPPING.get(response["error"], RemoteError)
+            raise error_class(response["message"])
+        return response
+
+    def start(self):
+        """The server has already loaded the ledger"""
+
+    def ledger_file(self) -> str:
+        """Returns the absolute path of the ledger the server serves"""
+        return self.call("ledger_file")
+
+    def flush(self):
+        self.call("flush")
+
+    @contextmanager
+    def batched_writes(self) -> typing.Iterator[None]:
+        """Writes follow the server's durability policy"""
+        yield
+
+    def change_current_date(self, new_date: date):
+        """Perform the following calls on new_date"""
+        self.current_date = new_date
+
+    def open_account(self, account_type: str) -> UUID:
+        return UUID(self.call("open_account", account_type=account_type))
+
+    def close_account(self, account_id: UUID) -> typing.Optional[UUID]:
+        transaction_id = self.call("close_account", account_id=account_id)
+        return UUID(transaction_id) if transaction_id is not None else None
+
+    def withdraw(self, account_id: UUID, amount: Amount, is_atm: bool) -> UUID:
+        return UUID(
+            self.call("withdraw", account_id=account_id, amount=amount, is_atm=is_atm)
+        )
+
+    def deposit(self, account_id: UUID, amount: Amount) -> UUID:
+        return UUID(self.call("deposit", account_id=account_id, amount=amount))
+
+    def all_accounts(self) -> typing.List[dict]:
+        return self.call("all_accounts")
+
+    def all_transactions(self) -> typing.List[dict]:
+        return self.call("all_transactions")
+
+    def all_account_ids(self) -> typing.List[UUID]:
+        return [UUID(account_id) for account_id in self.call("all_account_ids")]
+
+    def all_transaction_ids(self) -> typing.List[UUID]:
+        return [UUID(uid) for uid in self.call("all_transaction_ids")]
+
+    def stream_accounts(
+        self,
+        account_id: typing.Optional[UUID] = None,
+        offset: int = 0,
+        limit: typing.Optional[int] = None,
+    ) -> typing.Iterator[dict]:
+        return self.stream_pages(
+            "stream_accounts", account_id=account_id, offset=offset, limit=limit
+        )
+
+    def stream_transactions(
+        self,
+        account_id: typing.Optional[UUID] = None,
+        since: typing.Optional[date] = None,
+        until: typing.Optional[date] = None,
+        offset: int = 0,
+        limit: typing.Optional[int] = None,
+    ) -> typing.Iterator[dict]:
+        return self.stream_pages(
+            "stream_transactions",
+            account_id=account_id,
+            since=since,
+            until=until,
+            offset=offset,
+            limit=limit,
+        )
+
+    def stream_pages(self, method: str, **params) -> typing.Iterator[dict]:
+        """Fetch the entries of a stream method from the server a page at a
+        time so they are yielded before the whole stream is sent. The server
+        lists the entries when the stream starts, writes made while it's
+        read don't change it."""
+        response = self.request(method, **params)
+        while True:
+            yield from response["result"]
+            if "cursor" not in response:
+                return
+            response = self.request("next_page", cursor=response["cursor"])
+
+    def has_account(self, account_id: UUID) -> bool:
+        return self.call("has_account", account_id=account_id)
+
+    def get_account_details(self, account_id: UUID) -> dict:
+        return self.call("get_account_details", account_id=account_id)
+
+    def get_transaction_details(self, transaction_id: UUID) -> typing.Optional[dict]:
+        return self.call("get_transaction_details", transaction_id=transaction_id)
+
+    def report(self, withdrawals_on: typing.Optional[date] = None) -> dict:
+        return self.call("report", withdrawals_on=withdrawals_on)
+
+
+def encode_params(params: dict) -> dict:
+    """Convert call arguments to JSON values, amounts are sent as strings
+    so they reach the server unchanged"""
+    encoded = {}
+    for name, value in params.items():
+        if isinstance(value, (UUID, date)):
+            value = value.isoformat() if isinstance(value, date) else str(value)
+        elif isinstance(value, Money):
+            value = str(value.to_decimal())
+        elif isinstance(value, (float, Decimal)):
+            value = str(value)
+        encoded[name] = value
+    return encoded
@@ -0,0 +1,297 @@
+import json
+import os
+import typing
+from datetime import date
+from itertools import chain
+from uuid import UUID
+
+from banking.account import BankAccount, Transaction
+from banking.defaults import DEFAULT_SHARDS
+from banking.error import LedgerError
+from banking.ledger import (
+    CHECKED_FILE_HEADER,
+    AccountSummaryType,
+    Ledger,
+    is_checked,
+    pack_checked,
+    unpack_checked,
+    write_atomically,
+)
+from banking.money import Money
+
+MANIFEST_MAGIC = b"BANKSHRD"
+
+
+class ShardedLedger(Ledger):
+    """Ledger whose accounts are partitioned over several shard files by
+    their account id.
+
+    The ledger file itself is a small manifest holding the number of
+    shards. Each shard is a Ledger file holding the accounts whose
+    `account_id.int % shards` is it's index together with their
+    transactions. A shard is loaded the first time one of it's accounts is
+    used and only the shards changed since the last flush are persisted, so
+    an operation on an account reads and writes a single shard however big
+    the bank grows.
+
+    Listing accounts and transactions and looking up a transaction by it's
+    id load every shard. Transactions are listed in the order of their day,
+    in the order they were stored within a shard.
+    """
+
+    DEFAULT_SHARDS = DEFAULT_SHARDS
+
+    def __init__(
+        self, filename: str, shards: int = DEFAULT_SHARDS, **ledger_options
+    ) -> None:
+        """
+        Arguments:
+            filename {str} -- name of the manifest file
+
+        Keyword Arguments:
+            shards {int} -- number of shards of a new ledger, an existing
+            ledger keeps the number in it's manifest (default: {DEFAULT_SHARDS})
+            ledger_options -- durability options, see Ledger
+        """
+        if shards < 1:
+            raise ValueError("A sharded ledger needs at least one shard")
+        super().__init__(filename, **ledger_options)
+        self.shard_count = shards
+        self.manifest_written = False
+        self.shards: typing.List[typing.Optional[Ledger]] = [None] * shards
+        self.dirty_shards: typing.Set[int] = set()
+
+    def shard_filename(self, index: int) -> str:
+        return shard_filename(self.filename, index, self.shard_count)
+
+    def shard_index(self, account_id: UUID) -> int:
+        return account_id.int % self.shard_count
+
+    def shard(self, index: int) -> Ledger:
+        """Return a shard, loading it on first use"""
+        shard = self.shards[index]
+        if shard is None:
+            with self.store_lock:
+                shard = self.shards[index]
+                if shard is None:
+                    shard = Ledger(
+                        self.shard_filename(index),
+                        thread_safe=self.thread_safe,
+                        serializer=self.serializer_name,
+                        # Accounts are cached by the sharded ledger
+                        account_cache_size=0,
+                    )
+                    # Shards are written under the sharded ledger's store
+                    # lock, persist has to snapshot them under it too
+                    shard.store_lock = self.store_lock
+                    if os.path.exists(shard.filename):
+                        shard.load()
+                    self.shards[index] = shard
+        return shard
+
+    def account_shard(self, account_id: UUID) -> Ledger:
+        return self.shard(self.shard_index(account_id))
+
+    def all_shards(self) -> typing.List[Ledger]:
+        return [self.shard(index) for index in range(self.shard_count)]
+
+    def loaded_shards(self) -> typing.List[int]:
+        """Return the indexes of the shards loaded so far"""
+        return [index for index, shard in enumerate(self.shards) if shard is not None]
+
+    def load(self):
+        """Read the manifest. Shards are loaded when they are first used.
+
+        Raises:
+            LedgerError: If the ledger file isn't a sharded ledger eg. a
+            pickled ledger that has to be resharded first
+        """
+        with open(self.filename, "rb") as manifest_file:
+            data = manifest_file.read()
+        self.dirty_shards = set()
+        self.clear_account_cache()
+        if not data:
+            self.manifest_written = False
+            self.shards = [None] * self.shard_count
+            return
+        payload = unpack_checked(data) if is_checked(data) else b""
+        if not payload.startswith(MANIFEST_MAGIC):
+            raise LedgerError(
+                f"Ledger file {self.filename} is not a sharded ledger, "
+                "use reshard to convert it"
+            )
+        manifest = json.loads(payload[len(MANIFEST_MAGIC) :])
+        self.shard_count = manifest["shards"]
+        self.shards = [None] * self.shard_count
+        self.manifest_written = True
+
+    def write_manifest(self):
+        manifest = json.dumps({"shards": self.shard_count}).encode()
+        data = pack_checked(MANIFEST_MAGIC + manifest)
+        write_atomically(self.filename, data)
+        self.bytes_written += len(data)
+        self.manifest_written = True
+
+    def save_to_store(self, obj: typing.Union[BankAccount, Transaction]):
+        index = self.shard_index(obj.account_id)
+        self.shard(index).save_to_store(obj)
+        self.dirty_shards.add(index)
+
+    def remove_from_store(self, account_id: UUID):
+        index = self.shard_index(account_id)
+        self.shard(index).remove_from_store(account_id)
+        self.dirty_shards.add(index)
+
+    def persist(self):
+        """Persist the shards changed since the last persist"""
+        with self.store_lock:
+            dirty, self.dirty_shards = self.dirty_shards, set()
+        try:
+            if not self.manifest_written:
+                self.write_manifest()
+            for index in sorted(dirty):
+                shard = self.shard(index)
+                bytes_written = shard.bytes_written
+                shard.persist()
+                self.bytes_written += shard.bytes_written - bytes_written
+        except BaseException:
+            with self.store_lock:
+                self.dirty_shards |= dirty
+            raise
+
+    def read_account(self, account_id: UUID, current_date: date) -> BankAccount:
+        return self.account_shard(account_id).read_account(account_id, current_date)
+
+    def has_account(self, account_id: UUID) -> bool:
+        return self.account_shard(account_id).has_account(account_id)
+
+    def get_account_class(
+        self, account_id: UUID
+    ) -> typing.Optional[typing.Type[BankAccount]]:
+        return self.account_shard(account_id).get_account_class(account_id)
+
+    def account_summaries(self) -> typing.Iterator[AccountSummaryType]:
+        return chain.from_iterable(
+            shard.account_summaries() for shard in self.all_shards()
+        )
+
+    def get_account_balance(self, account_id: UUID) -> Money:
+        return self.account_shard(account_id).get_account_balance(account_id)
+
+    def get_total_withdrawn_amount_by_date(self, account_id: UUID, date: date) -> Money:
+        shard = self.account_shard(account_id)
+        return shard.get_total_withdrawn_amount_by_date(account_id, date)
+
+    def get_account_transactions(self, account_id: UUID) -> typing.List[Transaction]:
+        return self.account_shard(account_id).get_account_transactions(account_id)
+
+    def all_account_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        return chain.from_iterable(
+            shard.all_account_ids() for shard in self.all_shards()
+        )
+
+    def all_transaction_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        return (transaction.transaction_id for transaction in self.all_transactions())
+
+    def all_transactions(self) -> typing.Iterator[Transaction]:
+        # Shards list their transactions in the order they were stored,
+        # which isn't the order of their days when some were back dated
+        transactions = chain.from_iterable(
+            shard.all_transactions() for shard in self.all_shards()
+        )
+        return iter(
+            sorted(transactions, key=lambda transaction: transaction.occurred_on)
+        )
+
+    def get_transaction(self, transaction_id: UUID) -> typing.Optional[Transaction]:
+        # Shards already in memory are searched before loading the others
+        indexes = self.loaded_shards()
+        indexes += [index for index in range(self.shard_count) if index not in indexes]
+        for index in indexes:
+            transaction = self.shard(index).get_transaction(transaction_id)
+            if transaction is not None:
+                return transaction
+        return None
+
+    def verify_balances(self) -> typing.Dict[UUID, typing.Tuple[Money, Money]]:
+        mismatches = {}
+        for shard in self.all_shards():
+            mismatches.update(shard.verify_balances())
+        return mismatches
+
+    @property
+    def is_empty(self) -> bool:
+        return all(shard.is_empty for shard in self.all_shards())
+
+
+def is_sharded_ledger(filename: str) -> bool:
+    """Returns True if filename is the manifest of a sharded ledger, only
+    it's header is read"""
+    try:
+        with open(filename, "rb") as manifest_file:
+            header = manifest_file.read(CHECKED_FILE_HEADER.size + len(MANIFEST_MAGIC))
+    except FileNotFoundError:
+        return False
+    return is_checked(header) and header[CHECKED_FILE_HEADER.size :] == MANIFEST_MAGIC
+
+
+def shard_filename(filename: str, index: int, shards: int) -> str:
+    """Name of a shard file, it includes the number of shards so shards of
+    a resharded ledger never overwrite the shards it replaces"""
+    return f"{filename}.shard-{index}-of-{shards}"
+
+
+def reshard(
+    source_filename: str,
+    target_filename: str,
+    shards: int = ShardedLedger.DEFAULT_SHARDS,
+) -> ShardedLedger:
+    """Copy a pickled or sharded ledger into a sharded ledger with the
+    given number of shards.
+
+    The target may be the source itself, it's manifest is replaced only
+    once the new shards are written and the old shards are removed after.
+
+    Arguments:
+        source_filename {str} -- pickled ledger or sharded ledger manifest
+        target_filename {str} -- manifest of the sharded ledger to write
+
+    Keyword Arguments:
+        shards {int} -- number of shards (default: {ShardedLedger.DEFAULT_SHARDS})
+
+    Returns:
+        ShardedLedger -- The new sharded ledger
+    """
+    in_place = os.path.abspath(source_filename) == os.path.abspath(target_filename)
+    source = ShardedLedger(source_filename)
+    try:
+        source.load()
+        sources: typing.List[Ledger] = source.all_shards()
+        old_shards = [
+            source.shard_filename(index) for index in range(source.shard_count)
+        ]
+    except LedgerError:
+        sources = [Ledger(source_filename)]
+        sources[0].load()
+        old_shards = []
+    if in_place and old_shards and source.shard_count == shards:
+        return source
+    target = ShardedLedger(target_filename, shards)
+    target.manifest_written = True
+    with target.store_lock:
+        for ledger in sources:
+            for account_id, account_class in ledger.store["accounts"].items():
+                target.save_to_store(account_class(account_id))
+        for ledger in sources:
+            for transaction in ledger.all_transactions():
+                target.save_to_store(transaction)
+    # Every shard is written, even empty ones, before the manifest points
+    # to them
+    target.dirty_shards = set(range(shards))
+    target.flush()
+    target.write_manifest()
+    if in_place:
+        for filename in old_shards:
+            if os.path.exists(filename):
+                os.remove(filename)
+    return target
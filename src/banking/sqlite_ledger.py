@@ -0,0 +1,338 @@
+import sqlite3
+import typing
+from datetime import date
+from uuid import UUID
+
+from banking.account import (
+    ACCOUNT_CLASS_TYPE_MAPPING,
+    ACCOUNT_TYPE_CLASS_MAPPING,
+    BankAccount,
+    Transaction,
+)
+from banking.error import AccountNotFoundError
+from banking.ledger import AccountSummaryType, Ledger
+from banking.money import Money
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account_id BLOB PRIMARY KEY,
+    account_type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY,
+    transaction_id BLOB NOT NULL UNIQUE,
+    account_id BLOB NOT NULL,
+    transaction_type TEXT NOT NULL,
+    amount INTEGER NOT NULL, -- grosz
+    occurred_on TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_account_id
+    ON transactions (account_id);
+CREATE INDEX IF NOT EXISTS transactions_account_day_type
+    ON transactions (account_id, occurred_on, transaction_type);
+"""
+
+TRANSACTION_COLUMNS = (
+    "transaction_id, account_id, transaction_type, amount, occurred_on"
+)
+
+
+class SQLiteLedger(Ledger):
+    """Ledger stored in an SQLite database.
+
+    Accounts and transactions live in the `accounts` and `transactions`
+    tables and nothing is held in memory, balances and daily withdrawal
+    totals are computed by indexed aggregate queries. Writes are grouped
+    in a database transaction which is committed when they are flushed.
+
+    A single connection holds the pending writes, in thread safe mode it's
+    shared by every thread and only used under the store lock. Queries
+    read by several rows are then fetched whole under the lock instead of
+    from the cursor as they are read.
+
+    Account classes are stored by their account type
+    eg. international, see ACCOUNT_TYPE_CLASS_MAPPING.
+    """
+
+    ACCOUNT_CLASS_TYPE_MAPPING: typing.Dict[typing.Type[BankAccount], str] = (
+        ACCOUNT_CLASS_TYPE_MAPPING
+    )
+
+    def __init__(self, filename: str, **ledger_options) -> None:
+        super().__init__(filename, **ledger_options)
+        self.db: typing.Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection to the ledger database, opened on first use"""
+        with self.store_lock:
+            if self.db is None:
+                self.db = self.connect()
+            return self.db
+
+    def execute(self, sql: str, params: typing.Sequence = ()) -> sqlite3.Cursor:
+        """Run a statement on the connection under the store lock"""
+        with self.store_lock:
+            return self.connection.execute(sql, params)
+
+    def fetch_one(self, sql: str, params: typing.Sequence = ()) -> typing.Any:
+        """Return the first row of a query or None if there's none"""
+        with self.store_lock:
+            return self.connection.execute(sql, params).fetchone()
+
+    def fetch_rows(self, sql: str, params: typing.Sequence = ()) -> typing.Iterable:
+        """Return the rows of a query, read from the cursor as they are
+        iterated unless the ledger is thread safe"""
+        if not self.thread_safe:
+            return self.connection.execute(sql, params)
+        with self.store_lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def connect(self) -> sqlite3.Connection:
+        """Open the database in WAL mode and create the tables and indexes
+        if they don't exist yet"""
+        # The connection is used by one thread at a time, under the store
+        # lock in thread safe mode, but not always by the same one eg. by
+        # the server's connection threads
+        db = sqlite3.connect(self.filename, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # Commits are only fsynced if durability isn't left to the OS
+        synchronous = "NORMAL" if self.durability == "os" else "FULL"
+        db.execute(f"PRAGMA synchronous={synchronous}")
+        db.executescript(SCHEMA)
+        return db
+
+    def close(self):
+        """Flush pending writes and close the database connection"""
+        if self.db is not None:
+            if self.unflushed_writes:
+                self.flush()
+            with self.store_lock:
+                self.db.close()
+                self.db = None
+
+    def save_to_store(self, obj: typing.Union[BankAccount, Transaction]):
+        if isinstance(obj, BankAccount):
+            self.execute(
+                "INSERT OR REPLACE INTO accounts (account_id, account_type) "
+                "VALUES (?, ?)",
+                (obj.account_id.bytes, self.ACCOUNT_CLASS_TYPE_MAPPING[type(obj)]),
+            )
+        elif isinstance(obj, Transaction):
+            self.execute(
+                f"INSERT INTO transactions ({TRANSACTION_COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    obj.transaction_id.bytes,
+                    obj.account_id.bytes,
+                    obj.transaction_type.value,
+                    obj.amount.grosz,
+                    obj.occurred_on.isoformat(),
+                ),
+            )
+        else:
+            raise Exception("Programming Error: Invalid object type")
+
+    def persist(self):
+        """Commit the open database transaction, the pages SQLite writes
+        are not counted in bytes_written"""
+        with self.store_lock:
+            self.connection.commit()
+
+    def sync(self):
+        """Commits are already synced by SQLite, see PRAGMA synchronous"""
+
+    def load(self):
+        """(Re)open the ledger database"""
+        self.close()
+        self.clear_account_cache()
+        with self.store_lock:
+            self.db = self.connect()
+
+    def all_account_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        """Return all account Ids"""
+        for (account_id,) in self.fetch_rows(
+            "SELECT account_id FROM accounts ORDER BY rowid"
+        ):
+            yield UUID(bytes=account_id)
+
+    def all_transaction_ids(self) -> typing.Iterator[UUID]:  # type: ignore
+        """Return all transaction ids"""
+        for (transaction_id,) in self.fetch_rows(
+            "SELECT transaction_id FROM transactions ORDER BY seq"
+        ):
+            yield UUID(bytes=transaction_id)
+
+    def all_transactions(self) -> typing.Iterator[Transaction]:
+        """Return all transactions in the order they were stored"""
+        rows = self.fetch_rows(
+            f"SELECT {TRANSACTION_COLUMNS} FROM transactions ORDER BY seq"
+        )
+        for row in rows:
+            yield self.transaction_from_row(row)
+
+    def get_transaction(self, transaction_id: UUID) -> typing.Optional[Transaction]:
+        row = self.fetch_one(
+            f"SELECT {TRANSACTION_COLUMNS} FROM transactions "
+            "WHERE transaction_id = ?",
+            (transaction_id.bytes,),
+        )
+        return self.transaction_from_row(row) if row is not None else None
+
+    def get_account_transactions(self, account_id: UUID) -> typing.List[Transaction]:
+        rows = self.fetch_rows(
+            f"SELECT {TRANSACTION_COLUMNS} FROM transactions "
+            "WHERE account_id = ? ORDER BY seq",
+            (account_id.bytes,),
+        )
+        return [self.transaction_from_row(row) for row in rows]
+
+    def find_transactions(
+        self,
+        account_id: typing.Optional[UUID] = None,
+        since: typing.Optional[date] = None,
+        until: typing.Optional[date] = None,
+    ) -> typing.Iterator[Transaction]:
+        conditions, params = [], []
+        if account_id is not None:
+            conditions.append("account_id = ?")
+            params.append(account_id.bytes)
+        if since is not None:
+            conditions.append("occurred_on >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append("occurred_on <= ?")
+            params.append(until.isoformat())
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        rows = self.fetch_rows(
+            f"SELECT {TRANSACTION_COLUMNS} FROM transactions {where}ORDER BY seq",
+            params,
+        )
+        for row in rows:
+            yield self.transaction_from_row(row)
+
+    def has_account(self, account_id: UUID) -> bool:
+        return self.get_account_class(account_id) is not None
+
+    def get_account_class(
+        self, account_id: UUID
+    ) -> typing.Optional[typing.Type[BankAccount]]:
+        row = self.fetch_one(
+            "SELECT account_type FROM accounts WHERE account_id = ?",
+            (account_id.bytes,),
+        )
+        return ACCOUNT_TYPE_CLASS_MAPPING[row[0]] if row is not None else None
+
+    def account_summaries(self) -> typing.Iterator[AccountSummaryType]:
+        """Sum the balances of every account in a single grouped query"""
+        rows = self.fetch_rows(
+            "SELECT accounts.account_id, account_type, "
+            "COALESCE(SUM(CASE transaction_type WHEN ? THEN amount "
+            "ELSE -amount END), 0) FROM accounts LEFT JOIN transactions "
+            "ON transactions.account_id = accounts.account_id "
+            "GROUP BY accounts.account_id ORDER BY accounts.rowid",
+            (Transaction.TransactionType.CREDIT.value,),
+        )
+        for account_id, account_type, balance in rows:
+            yield (
+                UUID(bytes=account_id),
+                ACCOUNT_TYPE_CLASS_MAPPING[account_type],
+                Money(balance),
+            )
+
+    def get_account_balance(self, account_id: UUID) -> Money:
+        """Sum the account's CREDIT and DEBIT transactions
+
+        Arguments:
+            account_id {UUID} -- Target account id
+
+        Returns:
+            Money -- account balance
+        """
+        (balance,) = self.fetch_one(
+            "SELECT COALESCE(SUM(CASE transaction_type WHEN ? THEN amount "
+            "ELSE -amount END), 0) FROM transactions WHERE account_id = ?",
+            (Transaction.TransactionType.CREDIT.value, account_id.bytes),
+        )
+        return Money(balance)
+
+    def verify_balances(self) -> typing.Dict[UUID, typing.Tuple[Money, Money]]:
+        """Compare the balances computed by the database against a replay
+        of every stored transaction"""
+        replayed: typing.Dict[UUID, int] = {}
+        for transaction in self.all_transactions():
+            account_id = transaction.account_id
+            replayed[account_id] = (
+                replayed.get(account_id, 0) + transaction.signed_grosz
+            )
+        mismatches = {}
+        for account_id, expected in replayed.items():
+            balance = self.get_account_balance(account_id)
+            if balance.grosz != expected:
+                mismatches[account_id] = (balance, Money(expected))
+        return mismatches
+
+    def get_total_withdrawn_amount_by_date(self, account_id: UUID, date: date) -> Money:
+        """Get the sum of amount withdrawn by the account on the day
+        denoted by the passed in date.
+
+        Arguments:
+            account_id {UUID} -- Target account id
+            date {date} -- The date to fetch sum of withdrawal transactions for
+
+        Returns:
+            Money -- sum of amount of each withdrawal transaction on that day
+        """
+        (total,) = self.fetch_one(
+            "SELECT COALESCE(SUM(amount), 0) FROM transactions "
+            "WHERE account_id = ? AND occurred_on = ? AND transaction_type = ?",
+            (
+                account_id.bytes,
+                date.isoformat(),
+                Transaction.TransactionType.DEBIT.value,
+            ),
+        )
+        return Money(total)
+
+    def read_account(self, account_id: UUID, current_date: date) -> BankAccount:
+        account_class = self.get_account_class(account_id)
+        if account_class is None:
+            raise AccountNotFoundError(
+                "Account not found, it has probably being closed"
+            )
+        current_balance = self.get_account_balance(account_id)
+        amount_withdrawn_today = self.get_total_withdrawn_amount_by_date(
+            account_id, current_date
+        )
+        return account_class(account_id, current_balance, amount_withdrawn_today)
+
+    def close_account(self, account_id: UUID):
+        """Delete account from the database"""
+        cursor = self.execute(
+            "DELETE FROM accounts WHERE account_id = ?", (account_id.bytes,)
+        )
+        if cursor.rowcount == 0:
+            raise AccountNotFoundError(
+                "This account does not exist or has already been deleted"
+            )
+        self.discard_cached_account(account_id)
+        self.mark_unflushed(1)
+
+    @property
+    def is_empty(self) -> bool:
+        (is_empty,) = self.fetch_one(
+            "SELECT NOT EXISTS (SELECT 1 FROM accounts) "
+            "AND NOT EXISTS (SELECT 1 FROM transactions)"
+        )
+        return bool(is_empty)
+
+    @staticmethod
+    def transaction_from_row(row: tuple) -> Transaction:
+        transaction_id, account_id, transaction_type, amount, occurred_on = row
+        return Transaction(
+            UUID(bytes=account_id),
+            Transaction.TransactionType(transaction_type),
+            Money(amount),
+            date.fromisoformat(occurred_on),
+            UUID(bytes=transaction_id),
+        )
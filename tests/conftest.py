@@ -11,9 +11,18 @@ from banking.account import (
     Transaction,
 )
 from banking.application import Application
+from banking.date_helper import get_todays_date, set_todays_date
 from banking.ledger import Ledger
 
 
+@pytest.fixture(autouse=True)
+def restore_todays_date():
+    """Tests that change the current date don't change it for the next ones"""
+    todays_date = get_todays_date()
+    yield
+    set_todays_date(todays_date)
+
+
 @pytest.fixture
 def foreign_account() -> BankAccount_INT:
     account = BankAccount_INT.open()
@@ -17,6 +17,7 @@ from banking.error import (
     ClosingCompanyAccountError,
     DailyWithdrawalLimitError,
     InsufficientFundError,
+    InvalidAmountError,
 )
 
 
@@ -66,6 +67,15 @@ def test_withdraw_foreign_account_fail_insufficient_funds(
         foreign_account.withdraw(600, True)
 
 
+@pytest.mark.parametrize("amount", [0, -10, "0.001"])
+def test_non_positive_amounts_fail(foreign_account: BankAccount_INT, amount):
+    foreign_account.balance = 4000
+    with pytest.raises(InvalidAmountError):
+        foreign_account.deposit(amount)
+    with pytest.raises(InvalidAmountError):
+        foreign_account.withdraw(amount, False)
+
+
 def test_close_empty_account_ok(foreign_account: BankAccount_INT):
     foreign_account.balance = 0
     foreign_account.amount_withdrawn_today = 0
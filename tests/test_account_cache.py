@@ -0,0 +1,128 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+from banking.account import BankAccount_INT, Transaction
+from banking.account_cache import AccountCache
+from banking.application import Application
+from banking.error import AccountError, AccountNotFoundError
+from banking.journal import JournalLedger
+from banking.ledger import Ledger
+
+
+def assert_cached_account_is_current(ledger, account_id, today):
+    cached = ledger.get_account(account_id)
+    current = ledger.read_account(account_id, today)
+    assert type(cached) is type(current)
+    assert cached.balance == current.balance
+    assert cached.amount_withdrawn_today == current.amount_withdrawn_today
+
+
+@pytest.mark.parametrize(
+    "backend", ["pickle", "journal", "sqlite", "columnar", "sharded", "lazy"]
+)
+def test_account_cache(tmp_path, backend):
+    app = Application(str(tmp_path / "ledger"), backend, account_cache_size=2)
+    app.start()
+    ledger = app.ledger
+    today = date(2020, 4, 1)
+    app.change_current_date(today)
+    account_ids = [app.open_account("covid") for _ in range(3)]
+    rng = random.Random(0)
+    for _ in range(60):
+        account_id = rng.choice(account_ids)
+        try:
+            if rng.random() < 0.5:
+                app.deposit(account_id, rng.randint(1, 500))
+            else:
+                app.withdraw(account_id, rng.randint(1, 300), False)
+        except AccountError:
+            pass
+        if rng.random() < 0.2:
+            today += timedelta(days=1)
+            app.change_current_date(today)
+        assert_cached_account_is_current(ledger, account_id, today)
+        assert len(ledger.account_cache) <= 2
+
+    stats = ledger.account_cache.stats()
+    assert stats["hits"] > stats["misses"] > 0
+    assert stats["max_size"] == 2
+
+    app.close_account(account_ids[0])
+    with pytest.raises(AccountNotFoundError):
+        ledger.get_account(account_ids[0])
+    app.start()
+    assert len(ledger.account_cache) == 0
+    assert_cached_account_is_current(ledger, account_ids[1], today)
+
+
+def test_withdrawn_today_is_reset_on_a_new_day(app):
+    app.change_current_date(date(2020, 4, 1))
+    account_id = app.open_account("covid")
+    app.deposit(account_id, 2000)
+    app.withdraw(account_id, 900, False)
+    assert app.ledger.get_account(account_id).amount_withdrawn_today == 900
+    with pytest.raises(AccountError):
+        app.withdraw(account_id, 200, False)
+    app.change_current_date(date(2020, 4, 2))
+    assert app.ledger.get_account(account_id).amount_withdrawn_today == 0
+    app.withdraw(account_id, 200, False)
+    assert app.ledger.get_account(account_id).balance == 900
+
+
+def test_least_recently_used_account_is_dropped():
+    cache = AccountCache(2)
+    day = date(2020, 4, 1)
+    accounts = [BankAccount_INT.open() for _ in range(3)]
+    for account in accounts[:2]:
+        cache.put(account, day)
+    assert cache.get(accounts[0].account_id, day) is accounts[0]
+    cache.put(accounts[2], day)
+    assert cache.get(accounts[1].account_id, day) is None
+    assert cache.get(accounts[2].account_id, day) is accounts[2]
+    assert cache.get(accounts[0].account_id, day + timedelta(days=1)) is None
+    assert cache.stats() == {"size": 0, "max_size": 2, "hits": 2, "misses": 2}
+
+
+def test_account_changed_while_built_is_not_cached():
+    cache = AccountCache(2)
+    day = date(2020, 4, 1)
+    account = BankAccount_INT.open()
+    assert cache.get(account.account_id, day) is None
+    changes = cache.begin_read(account.account_id)
+    cache.saved(
+        Transaction(account.account_id, Transaction.TransactionType.CREDIT, 10, day)
+    )
+    cache.end_read(account.account_id, day, changes, account)
+    assert cache.get(account.account_id, day) is None
+    assert cache.reads == {}
+
+    changes = cache.begin_read(account.account_id)
+    cache.end_read(account.account_id, day, changes, account)
+    assert cache.get(account.account_id, day) is account
+
+
+def test_imported_ledger_updates_cached_accounts(tmp_path, covid_account):
+    journal = JournalLedger(str(tmp_path / "ledger.journal"))
+    journal.save_object(covid_account)
+    assert journal.get_account(covid_account.account_id).balance == 0
+    source = Ledger(str(tmp_path / "ledger.pkl"))
+    source.save_object(
+        Transaction(
+            covid_account.account_id,
+            Transaction.TransactionType.CREDIT,
+            100,
+            date(2020, 4, 1),
+        )
+    )
+    journal.import_ledger(source)
+    assert journal.get_account(covid_account.account_id).balance == 100
+
+
+def test_no_account_cache(tmp_path):
+    app = Application(str(tmp_path / "ledger"), account_cache_size=0)
+    app.start()
+    account_id = app.open_account("international")
+    assert app.ledger.account_cache is None
+    assert app.ledger.get_account(account_id) is not app.ledger.get_account(account_id)
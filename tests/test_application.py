@@ -36,7 +36,7 @@ def test_get_account_details(app: Application):
     account_id = app.open_account("international")
     account_details = app.get_account_details(account_id)
     assert isinstance(account_details, dict)
-    assert account_details["balance"] == "0 PLN"
+    assert account_details["balance"] == "0.00 PLN"
 
 
 def test_deposit_into_account(app: Application):
@@ -118,3 +118,55 @@ def test_close_account_ok(app: Application):
     assert transaction_id is None
     with pytest.raises(AccountNotFoundError):
         app.ledger.get_account(account_id)
+
+
+@pytest.mark.parametrize("backend", ["pickle", "columnar", "sqlite"])
+def test_stream_transactions_filters_and_pages(tmp_path, backend):
+    app = Application(str(tmp_path / "ledger"), backend)
+    app.start()
+    account_ids = [app.open_account("international") for _ in range(3)]
+    for day in (1, 2, 3, 4):
+        app.change_current_date(date(2020, 4, day))
+        for account_id in account_ids:
+            app.deposit(account_id, day)
+    transactions = app.stream_transactions(
+        account_ids[1], since=date(2020, 4, 2), until=date(2020, 4, 3)
+    )
+    assert [transaction["amount"] for transaction in transactions] == [
+        "2.00 PLN",
+        "3.00 PLN",
+    ]
+    page = list(app.stream_transactions(offset=4, limit=3))
+    assert page == app.all_transactions()[4:7]
+    accounts = list(app.stream_accounts(offset=1))
+    assert [account["account_id"] for account in accounts] == [
+        str(account_id) for account_id in account_ids[1:]
+    ]
+    assert list(app.stream_accounts(account_ids[2]))[0]["balance"] == "10.00 PLN"
+    with pytest.raises(ValueError):
+        list(app.stream_transactions(offset=-1))
+    with pytest.raises(ValueError):
+        list(app.stream_accounts(limit=-1))
+
+
+@pytest.mark.parametrize("backend", ["pickle", "sqlite", "sharded", "lazy"])
+def test_all_accounts_from_account_summaries(tmp_path, backend):
+    app = Application(str(tmp_path / "ledger"), backend)
+    app.start()
+    app.change_current_date(date(2020, 4, 1))
+    account_ids = {
+        account_type: app.open_account(account_type)
+        for account_type in ("international", "covid", "company")
+    }
+    app.deposit(account_ids["company"], 5000)
+    app.deposit(account_ids["covid"], 20)
+    app.withdraw(account_ids["covid"], 5.5, False)
+    app.close_account(app.open_account("international"))
+
+    accounts = {account["account_id"]: account for account in app.all_accounts()}
+    assert len(accounts) == 3
+    for account_type, account_id in account_ids.items():
+        assert accounts[str(account_id)] == app.get_account_details(account_id)
+        assert accounts[str(account_id)]["type"] == account_type
+    assert accounts[str(account_ids["covid"])]["balance"] == "14.50 PLN"
+    assert list(app.stream_accounts(offset=1, limit=1)) == app.all_accounts()[1:2]
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+
+import pytest
+
+from banking.application import Application
+from banking.async_application import AsyncApplication
+from banking.error import InsufficientFundError
+from banking.load_test import run_load_test
+
+
+def make_app(tmp_path, backend="pickle") -> Application:
+    app = Application(str(tmp_path / "ledger"), backend, thread_safe=True)
+    app.start()
+    return app
+
+
+def test_concurrent_withdrawals_on_one_account(tmp_path):
+    app = make_app(tmp_path)
+
+    async def withdraw_twice():
+        async with AsyncApplication(app) as bank:
+            account_id = await bank.open_account("international")
+            await bank.deposit(account_id, 100)
+            results = await asyncio.gather(
+                bank.withdraw(account_id, 60, False),
+                bank.withdraw(account_id, 60, False),
+                return_exceptions=True,
+            )
+            return account_id, results
+
+    account_id, results = asyncio.run(withdraw_twice())
+    assert sum(isinstance(result, InsufficientFundError) for result in results) == 1
+    assert app.ledger.get_account_balance(account_id) == 40
+    assert app.ledger.durability == "os"
+
+
+def test_operations_on_an_account_run_in_order(tmp_path):
+    app = make_app(tmp_path)
+
+    async def deposit_then_withdraw():
+        async with AsyncApplication(app) as bank:
+            account_id = await bank.open_account("international")
+            await asyncio.gather(
+                *(
+                    operation
+                    for _ in range(10)
+                    for operation in (
+                        bank.deposit(account_id, 100),
+                        bank.withdraw(account_id, 100, False),
+                    )
+                )
+            )
+            return account_id
+
+    account_id = asyncio.run(deposit_then_withdraw())
+    assert app.ledger.get_account_balance(account_id) == 0
+
+
+def test_operations_proceed_while_a_commit_is_written(tmp_path):
+    app = make_app(tmp_path)
+    flushing = threading.Event()
+    release = threading.Event()
+    flush = app.flush
+
+    def slow_flush():
+        flushing.set()
+        release.wait(5)
+        flush()
+
+    async def deposit_during_commit():
+        loop = asyncio.get_running_loop()
+        async with AsyncApplication(app) as bank:
+            first, second = [await bank.open_account("covid") for _ in range(2)]
+            app.flush = slow_flush  # type: ignore
+            committing = asyncio.ensure_future(bank.deposit(first, 10))
+            await loop.run_in_executor(None, flushing.wait, 5)
+            deposits = asyncio.gather(
+                bank.deposit(first, 5), bank.deposit(second, 5)
+            )
+            balances = None
+            for _ in range(500):
+                balances = [
+                    app.ledger.get_account_balance(account_id)
+                    for account_id in (first, second)
+                ]
+                if balances == [15, 5]:
+                    break
+                await asyncio.sleep(0.01)
+            stored_while_committing = not committing.done() and balances == [15, 5]
+            release.set()
+            await asyncio.gather(committing, deposits)
+            return stored_while_committing
+
+    assert asyncio.run(deposit_during_commit())
+
+
+def test_async_application_needs_a_thread_safe_ledger(tmp_path):
+    app = Application(str(tmp_path / "ledger"))
+    app.start()
+    with pytest.raises(ValueError):
+        AsyncApplication(app)
+
+
+def test_writes_are_group_committed(tmp_path):
+    app = make_app(tmp_path, "journal")
+
+    async def deposit_concurrently():
+        async with AsyncApplication(app) as bank:
+            account_ids = [await bank.open_account("covid") for _ in range(5)]
+            commits = bank.commits
+            await asyncio.gather(
+                *(bank.deposit(account_id, 10) for account_id in account_ids * 4)
+            )
+            return account_ids, bank.commits - commits
+
+    account_ids, commits = asyncio.run(deposit_concurrently())
+    assert commits < 20
+    reloaded = Application(app.ledger_file_name, "journal")
+    reloaded.start()
+    for account_id in account_ids:
+        assert reloaded.ledger.get_account_balance(account_id) == 40
+
+
+@pytest.mark.parametrize("backend", ["pickle", "journal", "sqlite"])
+def test_load_test_has_no_lost_updates(tmp_path, backend):
+    app = make_app(tmp_path, backend)
+    result = asyncio.run(run_load_test(app, clients=8, operations_per_client=20))
+    assert result.operations == 160
+    assert result.lost_updates == 0
+    assert result.commits < result.operations
@@ -0,0 +1,136 @@
+import io
+import json
+from datetime import date
+
+import pytest
+
+from banking.application import Application
+from banking.batch import read_operations, run_batch
+from banking.date_helper import get_todays_date
+
+
+def make_app(tmp_path) -> Application:
+    app = Application(str(tmp_path / "ledger.pkl"))
+    app.start()
+    return app
+
+
+def test_read_operations():
+    csv_lines = io.StringIO(
+        "operation,account_id,amount\ndeposit,abc,10.50\n\nwithdraw,abc,1\n"
+    )
+    assert list(read_operations(csv_lines, "csv")) == [
+        (2, {"operation": "deposit", "account_id": "abc", "amount": "10.50"}),
+        (4, {"operation": "withdraw", "account_id": "abc", "amount": "1"}),
+    ]
+    jsonl_lines = io.StringIO('{"operation": "open"}\n\n[1]\nnot json\n')
+    assert list(read_operations(jsonl_lines, "jsonl")) == [
+        (1, {"operation": "open"}),
+        (3, {"error": "Line is not a JSON object"}),
+        (4, {"error": "Line is not a JSON object"}),
+    ]
+
+
+def test_run_batch(tmp_path):
+    app = make_app(tmp_path)
+    account_id = app.open_account("international")
+    app.flush()
+    lines = ["operation,account_id,amount,account_type,atm"]
+    lines += [f"deposit,{account_id},10.10,," for _ in range(5)]
+    lines += [
+        f"withdraw,{account_id},50.50,,true",
+        f"withdraw,{account_id},0.01,,yes",
+        f"deposit,{account_id},not a number,,",
+        "deposit,not an id,1,,",
+        "open,,,savings,",
+        "open,,,covid,",
+    ]
+    report = io.StringIO()
+    result = run_batch(
+        app, read_operations(io.StringIO("\n".join(lines))), report, chunk_size=2
+    )
+    assert (result.total, result.succeeded, result.failed) == (11, 7, 4)
+    assert result.ops_per_second > 0
+    entries = [json.loads(line) for line in report.getvalue().splitlines()]
+    assert [entry["line"] for entry in entries] == list(range(2, 13))
+    assert [entry["status"] for entry in entries[5:]] == [
+        "ok",
+        "error",
+        "error",
+        "error",
+        "error",
+        "ok",
+    ]
+    assert entries[6]["error"].startswith("InsufficientFundError")
+    assert app.ledger.durability == "os"
+    assert app.ledger.unflushed_writes == 0
+
+    reloaded = make_app(tmp_path)
+    assert reloaded.ledger.get_account_balance(account_id) == 0.0
+    assert len(list(reloaded.ledger.all_account_ids())) == 2
+
+
+def test_batch_dates_only_apply_to_their_line(tmp_path):
+    app = make_app(tmp_path)
+    account_id = app.open_account("international")
+    batch_date = get_todays_date()
+    lines = [
+        "operation,account_id,amount,date",
+        f"deposit,{account_id},10,2021-01-04",
+        f"deposit,{account_id},10,",
+    ]
+    run_batch(app, read_operations(io.StringIO("\n".join(lines))), io.StringIO())
+    dated, undated = [
+        transaction.occurred_on
+        for transaction in app.ledger.get_account_transactions(account_id)
+    ]
+    assert dated == date(2021, 1, 4)
+    assert undated == batch_date
+    assert get_todays_date() == batch_date
+
+
+def test_run_batch_persists_per_chunk(tmp_path, monkeypatch):
+    app = make_app(tmp_path)
+    account_id = app.open_account("international")
+    flushes = []
+    monkeypatch.setattr(app.ledger, "persist", lambda: flushes.append(1))
+    operations = (
+        (line, {"operation": "deposit", "account_id": str(account_id), "amount": 1})
+        for line in range(1, 8)
+    )
+    run_batch(app, operations, io.StringIO(), chunk_size=3)
+    assert len(flushes) == 3
+
+
+def test_run_batch_reports_non_positive_amounts(tmp_path):
+    app = make_app(tmp_path)
+    account_id = app.open_account("international")
+    lines = [
+        "operation,account_id,amount",
+        f"deposit,{account_id},10",
+        f"deposit,{account_id},0",
+        f"withdraw,{account_id},-1",
+    ]
+    report = io.StringIO()
+    result = run_batch(app, read_operations(io.StringIO("\n".join(lines))), report)
+    assert (result.succeeded, result.failed) == (1, 2)
+    entries = [json.loads(line) for line in report.getvalue().splitlines()]
+    assert [entry["error"].split(":")[0] for entry in entries[1:]] == [
+        "InvalidAmountError",
+        "InvalidAmountError",
+    ]
+    assert make_app(tmp_path).ledger.get_account_balance(account_id) == 10
+
+
+def test_run_batch_keeps_writes_made_before_an_error(tmp_path):
+    app = make_app(tmp_path)
+    account_id = app.open_account("international")
+
+    def operations():
+        yield 2, {"operation": "deposit", "account_id": str(account_id), "amount": 10}
+        raise RuntimeError("Batch file can't be read")
+
+    with pytest.raises(RuntimeError):
+        run_batch(app, operations(), io.StringIO())
+    assert app.ledger.durability == "os"
+    assert make_app(tmp_path).ledger.get_account_balance(account_id) == 10
@@ -0,0 +1,69 @@
+import json
+from datetime import date
+
+from banking.application import Application
+from banking.benchmark import compare_results, generate_ledger, main, run_scenarios
+from banking.date_helper import get_todays_date, set_todays_date
+
+
+def test_generated_ledger_is_consistent(tmp_path):
+    app = Application(str(tmp_path / "ledger.pkl"))
+    app.start()
+    account_ids = generate_ledger(app, 50, 8, days=4)
+    ledger = app.ledger
+    assert len(list(ledger.all_transactions())) == 400
+    assert ledger.verify_balances() == {}
+    account_types = set()
+    for account_id in account_ids:
+        account = ledger.get_account(account_id)
+        account_types.add(type(account))
+        assert account.balance >= account.MINIMUM_ACCOUNT_BALANCE
+    assert len(account_types) == 3
+    days = {transaction.occurred_on for transaction in ledger.all_transactions()}
+    assert len(days) == 4
+    other = Application(str(tmp_path / "other.pkl"))
+    other.start()
+    assert generate_ledger(other, 50, 8, days=4) == account_ids
+
+
+def test_benchmark_results_and_regressions(tmp_path, capsys):
+    output = str(tmp_path / "results.json")
+    assert main(["--sizes", "100", "--samples", "5", "--output", output]) == 0
+    with open(output) as results_file:
+        results = json.load(results_file)
+    (run,) = results["results"]
+    assert run["backend"] == "pickle"
+    assert run["transactions"] == 100
+    assert run["metrics"]["load_seconds"] > 0
+    assert run["metrics"]["deposit_ops_per_second"] > 0
+    assert compare_results(results, results) == []
+
+    slower = json.loads(json.dumps(results))
+    slower["results"][0]["metrics"]["load_seconds"] *= 2
+    slower["results"][0]["metrics"]["deposit_ops_per_second"] /= 2
+    regressions = compare_results(results, slower)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("pickle 100 transactions load_seconds")
+
+    # A much slower baseline can't be regressed from, a much faster one is
+    for factor, exit_code in ((1000, 0), (1 / 1000, 1)):
+        baseline = json.loads(json.dumps(results))
+        metrics = baseline["results"][0]["metrics"]
+        for metric in metrics:
+            if metric.endswith("_per_second"):
+                metrics[metric] /= factor
+            else:
+                metrics[metric] *= factor
+        baseline_file_name = str(tmp_path / "baseline.json")
+        with open(baseline_file_name, "w") as baseline_file:
+            json.dump(baseline, baseline_file)
+        assert (
+            main(["--sizes", "100", "--samples", "5", "--baseline", baseline_file_name])
+            == exit_code
+        )
+
+
+def test_scenarios_restore_the_date(tmp_path):
+    set_todays_date(date(2020, 4, 15))
+    run_scenarios(str(tmp_path / "ledger.pkl"), "pickle", 100, samples=5)
+    assert get_todays_date() == date(2020, 4, 15)
@@ -1,10 +1,29 @@
+import json
+import os
+import subprocess
+import sys
+import threading
+
 from typer.testing import CliRunner
 
+from banking import main
+from banking.application import Application
+from banking.lazy_ledger import LazyJournalLedger
 from banking.main import app
+from banking.server import BankingServer
 
 runner = CliRunner()
 
 
+def make_stderr_runner() -> CliRunner:
+    """Runner keeping stderr apart from stdout, click before 8.2 mixes
+    them unless told not to and 8.2 dropped the option"""
+    try:
+        return CliRunner(mix_stderr=False)
+    except TypeError:
+        return CliRunner()
+
+
 def test_open_command():
     result = runner.invoke(app, ["open", "covid"])
     assert result.exit_code == 0
@@ -48,3 +67,182 @@ def test_ls_command_only_ids():
 
 def test_show_command():
     pass
+
+
+def test_batch_command():
+    result = runner.invoke(
+        app,
+        ["batch", "-", "--format", "jsonl"],
+        input='{"operation": "open", "account_type": "covid"}\n{"operation": "x"}\n',
+    )
+    assert result.exit_code == 0
+    assert '"status": "ok"' in result.stdout
+    assert "2 operations" in result.output
+
+
+def test_report_command():
+    result = runner.invoke(app, ["report", "--day", "2020-04-01"])
+    assert result.exit_code == 0
+    assert '"daily_withdrawals"' in result.stdout
+    assert runner.invoke(app, ["report", "--day", "April"]).exit_code == 1
+
+
+def test_ls_command_jsonl_page():
+    result = runner.invoke(
+        app, ["ls", "--no-show-accounts", "--format", "jsonl", "--limit", "2"]
+    )
+    assert result.exit_code == 0
+    lines = result.stdout.splitlines()
+    assert len(lines) <= 2
+    assert all(json.loads(line)["transaction_id"] for line in lines)
+    result = runner.invoke(app, ["ls", "--since", "April"])
+    assert result.exit_code == 1
+    assert runner.invoke(app, ["ls", "--offset", "-1"]).exit_code == 2
+    assert runner.invoke(app, ["ls", "--limit", "-1"]).exit_code == 2
+
+
+# Microseconds `import banking.main` may take, well above the ~100ms it
+# takes so only loading the ledger or every backend at import fails it
+IMPORT_TIME_BUDGET = 400_000
+
+
+def test_import_time_budget():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import banking.main"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        imports[name.strip()] = int(cumulative)
+    assert "banking.application" not in imports
+    assert "banking.ledger" not in imports
+    assert imports["banking.main"] < IMPORT_TIME_BUDGET
+
+
+def test_help_does_not_load_ledger(tmp_path):
+    ledger_file = tmp_path / "ledger.pkl"
+    ledger_file.write_bytes(b"not a ledger")
+    result = runner.invoke(app, ["--ledger", str(ledger_file), "--help"])
+    assert result.exit_code == 0
+    assert "ls" in result.stdout
+    result = runner.invoke(app, ["--ledger", str(ledger_file), "show"])
+    assert result.exit_code == 2
+
+
+def test_ledger_option(tmp_path, monkeypatch):
+    # The commands of the other tests keep using the default ledger
+    monkeypatch.setattr(main, "ledger_path", main.ledger_path)
+    monkeypatch.setattr(main, "banking_app", main.banking_app)
+    ledger_file = str(tmp_path / "ledger.pkl")
+    result = runner.invoke(app, ["--ledger", ledger_file, "open", "covid"])
+    assert result.exit_code == 0
+    assert os.path.getsize(ledger_file) > 0
+    result = runner.invoke(
+        app,
+        ["ls", "--only-ids", "--format", "jsonl"],
+        env={"BANKING_LEDGER": ledger_file},
+    )
+    assert len(result.stdout.splitlines()) == 1
+
+
+def test_ledger_option_with_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ledger_path", main.ledger_path)
+    monkeypatch.setattr(main, "banking_app", main.banking_app)
+    served_ledger = str(tmp_path / "served.pkl")
+    server_app = Application(served_ledger)
+    server_app.start()
+    server = BankingServer(server_app, str(tmp_path / "banking.sock"))
+    monkeypatch.setattr(main, "SOCKET_PATH", server.socket_path)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    try:
+        other_ledger = str(tmp_path / "other.pkl")
+        result = runner.invoke(app, ["--ledger", other_ledger, "open", "covid"])
+        assert result.exit_code == 1
+        assert f"serves {served_ledger}" in result.stdout
+        assert not os.path.exists(other_ledger)
+        result = runner.invoke(app, ["--ledger", served_ledger, "open", "covid"])
+        assert result.exit_code == 0
+        assert len(server_app.all_account_ids()) == 1
+    finally:
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+
+def test_profile_option(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ledger_path", main.ledger_path)
+    monkeypatch.setattr(main, "banking_app", main.banking_app)
+    ledger_file = str(tmp_path / "ledger.pkl")
+    metrics_file = str(tmp_path / "metrics.prom")
+    stderr_runner = make_stderr_runner()
+    result = stderr_runner.invoke(
+        app,
+        ["--ledger", ledger_file, "--profile", "--metrics-file", metrics_file]
+        + ["open", "covid"],
+    )
+    assert result.exit_code == 0
+    assert "Account successfully created" in result.stdout
+    stages = [line.split()[0] for line in result.stderr.splitlines()]
+    assert stages[:2] == ["stage", "command"]
+    assert {"application_open_account", "ledger_load", "ledger_persist"} <= set(stages)
+    with open(metrics_file) as prometheus:
+        assert "banking_application_open_account_calls_total 1\n" in prometheus.read()
+    # Metrics are only recorded for the profiled command
+    assert main.app_metrics is None
+    result = stderr_runner.invoke(app, ["--ledger", ledger_file, "--profile", "ls"])
+    assert result.exit_code == 0
+    stages = {line.split()[0] for line in result.stderr.splitlines()}
+    assert {
+        "application_start",
+        "application_stream_accounts",
+        "application_stream_transactions",
+    } <= stages
+    result = stderr_runner.invoke(app, ["--ledger", ledger_file, "ls", "--only-ids"])
+    assert result.exit_code == 0
+    assert not result.stderr
+
+
+def test_reshard_command(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ledger_path", main.ledger_path)
+    monkeypatch.setattr(main, "banking_app", main.banking_app)
+    ledger_file = str(tmp_path / "ledger.pkl")
+    sharded_file = str(tmp_path / "sharded.pkl")
+    runner.invoke(app, ["--ledger", ledger_file, "open", "covid"])
+    result = runner.invoke(app, ["reshard", ledger_file, "--shards", "4"])
+    assert result.exit_code == 2
+    result = runner.invoke(app, ["reshard", ledger_file, sharded_file])
+    assert result.exit_code == 0
+    result = runner.invoke(
+        app, ["--ledger", sharded_file, "ls", "--only-ids", "--format", "jsonl"]
+    )
+    assert result.exit_code == 0
+    assert len(result.stdout.splitlines()) == 1
+
+
+def test_backend_option(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ledger_path", main.ledger_path)
+    monkeypatch.setattr(main, "ledger_backend", main.ledger_backend)
+    monkeypatch.setattr(main, "banking_app", main.banking_app)
+    ledger_file = str(tmp_path / "ledger.journal")
+    result = runner.invoke(
+        app, ["--ledger", ledger_file, "--backend", "journal", "open", "covid"]
+    )
+    assert result.exit_code == 0
+    journal_app = Application(ledger_file, "journal")
+    journal_app.start()
+    (account_id,) = journal_app.all_account_ids()
+    result = runner.invoke(
+        app,
+        ["--ledger", ledger_file, "show", str(account_id)],
+        env={"BANKING_BACKEND": "lazy"},
+    )
+    assert result.exit_code == 0
+    assert isinstance(main.banking_app, Application)
+    assert isinstance(main.banking_app.ledger, LazyJournalLedger)
+    result = runner.invoke(app, ["--backend", "csv", "ls"])
+    assert result.exit_code == 1
+    assert "Invalid backend" in result.stdout
@@ -0,0 +1,222 @@
+import pickle
+from datetime import date, datetime
+from uuid import uuid4
+
+import pytest
+
+from banking.account import Transaction
+from banking.application import Application
+from banking.columns import (
+    ColumnarLedger,
+    TransactionColumns,
+    TransactionFile,
+    write_transaction_file,
+)
+from banking.date_helper import get_todays_date
+from banking.error import LedgerCorruptedError
+from banking.ledger import Ledger
+
+
+def test_transaction_columns_round_trip():
+    columns = TransactionColumns()
+    account_id = uuid4()
+    today = datetime(2020, 4, 1).date()
+    credit = Transaction(account_id, Transaction.TransactionType.CREDIT, 37.99, today)
+    debit = Transaction(account_id, Transaction.TransactionType.DEBIT, 400.0, today)
+    assert columns.append(credit) == 0
+    assert columns.append(debit) == 1
+    assert len(columns) == 2
+    assert columns.account_ids == [account_id]
+    assert columns.nbytes == 2 * 33
+    assert columns.transaction(0).to_dict() == credit.to_dict()
+    assert columns.transaction(1).to_dict() == debit.to_dict()
+    assert columns.find(debit.transaction_id) == 1
+    assert columns.find(uuid4()) is None
+    unpickled = pickle.loads(pickle.dumps(columns))
+    assert "row_by_transaction_id" not in columns.__getstate__()
+    assert unpickled.find(credit.transaction_id) == 0
+    assert unpickled.find(debit.transaction_id) == 1
+
+
+def test_columnar_ledger(tmp_path, foreign_account):
+    ledger = ColumnarLedger(str(tmp_path / "ledger.pkl"))
+    assert ledger.is_empty
+    today = get_todays_date()
+    account_id = foreign_account.account_id
+    deposit = Transaction(account_id, Transaction.TransactionType.CREDIT, 400, today)
+    withdrawal = Transaction(account_id, Transaction.TransactionType.DEBIT, 150, today)
+    ledger.save([foreign_account, deposit, withdrawal])
+    assert len(ledger.store["transactions"]) == 0
+    assert ledger.get_account(account_id).balance == 250
+    assert ledger.get_account(account_id).amount_withdrawn_today == 150
+
+    reloaded = ColumnarLedger(ledger.filename)
+    reloaded.load()
+    assert list(reloaded.all_transaction_ids()) == [
+        deposit.transaction_id,
+        withdrawal.transaction_id,
+    ]
+    assert reloaded.get_account_balance(account_id) == 250
+    assert reloaded.get_transaction(withdrawal.transaction_id).amount == 150
+    assert len(reloaded.get_account_transactions(account_id)) == 2
+    assert reloaded.verify_balances() == {}
+
+
+def test_columnar_ledger_loads_pickle_ledger(tmp_path, foreign_account):
+    ledger = Ledger(str(tmp_path / "ledger.pkl"))
+    ledger.save([foreign_account, foreign_account.deposit(400)])
+    columnar = ColumnarLedger(ledger.filename)
+    columnar.load()
+    assert columnar.get_account_balance(foreign_account.account_id) == 400
+
+
+@pytest.mark.parametrize("window_days", [1, 3])
+def test_columnar_ledger_indexes_columns_like_rows(
+    tmp_path, monkeypatch, window_days
+):
+    monkeypatch.setattr(ColumnarLedger, "WITHDRAWAL_WINDOW_DAYS", window_days)
+    ledger = ColumnarLedger(str(tmp_path / "ledger.pkl"))
+    account_ids = [uuid4(), uuid4(), uuid4()]
+    credit, debit = Transaction.TransactionType.CREDIT, Transaction.TransactionType.DEBIT
+    for number, day in enumerate((3, 1, 5, 4, 5, 2, 4)):
+        account_id = account_ids[number % 2]
+        ledger.save(
+            [
+                Transaction(account_id, credit, 10, date(2020, 4, day)),
+                Transaction(account_id, debit, day, date(2020, 4, day)),
+            ]
+        )
+    ledger.save([Transaction(account_ids[2], credit, 1, date(2020, 4, 9))])
+
+    reloaded = ColumnarLedger(ledger.filename)
+    reloaded.load()
+    assert reloaded.rows_by_account == ledger.rows_by_account
+    assert reloaded.balances == ledger.balances
+    assert reloaded.withdrawals == ledger.withdrawals
+    assert reloaded.withdrawals_since == ledger.withdrawals_since
+
+
+def test_slotted_transaction_loads_dict_state():
+    transaction = Transaction.__new__(Transaction)
+    transaction.__setstate__(
+        {
+            "transaction_id": uuid4(),
+            "account_id": uuid4(),
+            "transaction_type": Transaction.TransactionType.CREDIT,
+            "amount": 10,
+            "occurred_on": datetime(2020, 4, 1).date(),
+        }
+    )
+    assert transaction.amount == 10
+    assert not hasattr(transaction, "__dict__")
+
+
+def test_application_with_columnar_backend(tmp_path):
+    app = Application(str(tmp_path / "ledger.pkl"), "columnar")
+    app.start()
+    account_id = app.open_account("international")
+    app.deposit(account_id, 400)
+    assert app.all_transactions()[0]["amount"] == "400.00 PLN"
+
+
+def test_transaction_file_views(tmp_path):
+    filename = str(tmp_path / "ledger.transactions")
+    account_ids = [uuid4(), uuid4()]
+    transactions = [
+        Transaction(
+            account_ids[(day + 1) % 2],
+            (
+                Transaction.TransactionType.DEBIT
+                if day % 3 == 0
+                else Transaction.TransactionType.CREDIT
+            ),
+            day,
+            date(2020, 4, day),
+        )
+        for day in range(1, 11)
+    ]
+    write_transaction_file(filename, transactions)
+    with TransactionFile(filename) as transaction_file:
+        assert len(transaction_file) == 10
+        assert transaction_file.account_ids == account_ids
+        assert transaction_file.amounts.tolist() == [day * 100 for day in range(1, 11)]
+        assert [
+            transaction_file.transaction(row).to_dict()
+            for row in range(len(transaction_file))
+        ] == [transaction.to_dict() for transaction in transactions]
+        rows = list(
+            transaction_file.select(
+                account_id=account_ids[0],
+                since=date(2020, 4, 3),
+                until=date(2020, 4, 8),
+            )
+        )
+        assert rows == [2, 4, 6]
+        assert transaction_file.signed_total(rows) == -3 + 5 + 7
+        assert transaction_file.signed_total().grosz == sum(
+            transaction.signed_grosz for transaction in transactions
+        )
+        assert list(transaction_file.select(account_id=uuid4())) == []
+        assert transaction_file.account_ordinal(account_ids[1]) == 1
+        assert transaction_file.account_ordinal(uuid4()) is None
+
+
+def test_transaction_file_byteswaps_columns(tmp_path, monkeypatch):
+    # As on a host of the other byte order, the columns are swapped when
+    # they are written and swapped back when they are read
+    monkeypatch.setattr(TransactionFile, "BYTESWAP", True)
+    filename = str(tmp_path / "ledger.transactions")
+    account_id = uuid4()
+    today = date(2020, 4, 1)
+    transactions = [
+        Transaction(account_id, Transaction.TransactionType.CREDIT, 400, today),
+        Transaction(account_id, Transaction.TransactionType.DEBIT, 150, today),
+    ]
+    write_transaction_file(filename, transactions)
+    with TransactionFile(filename) as transaction_file:
+        assert transaction_file.amounts.tolist() == [40000, 15000]
+        assert transaction_file.days.tolist() == [today.toordinal()] * 2
+        assert [transaction_file.transaction(row).to_dict() for row in range(2)] == [
+            transaction.to_dict() for transaction in transactions
+        ]
+
+
+def test_transaction_file_numpy_arrays(tmp_path):
+    numpy = pytest.importorskip("numpy")
+    filename = str(tmp_path / "ledger.transactions")
+    account_id = uuid4()
+    today = date(2020, 4, 1)
+    write_transaction_file(
+        filename,
+        [
+            Transaction(account_id, Transaction.TransactionType.CREDIT, 400, today),
+            Transaction(account_id, Transaction.TransactionType.DEBIT, 150, today),
+        ],
+    )
+    transaction_file = TransactionFile(filename)
+    arrays = transaction_file.arrays()
+    assert arrays["amounts"].tolist() == [40000, 15000]
+    assert not arrays["amounts"].flags.owndata
+    assert numpy.all(arrays["days"] == today.toordinal())
+    del arrays
+    transaction_file.close()
+
+
+def test_transaction_file_rejects_other_files(tmp_path):
+    filename = str(tmp_path / "ledger.transactions")
+    write_transaction_file(filename, [])
+    with open(filename, "ab") as transaction_file:
+        transaction_file.write(b"x")
+    with pytest.raises(LedgerCorruptedError):
+        TransactionFile(filename)
+
+
+def test_columnar_ledger_keeps_transaction_file(tmp_path):
+    app = Application(str(tmp_path / "ledger.pkl"), "columnar", transaction_file=True)
+    app.start()
+    account_id = app.open_account("international")
+    app.deposit(account_id, 400)
+    app.withdraw(account_id, 150, False)
+    with app.ledger.open_transaction_file() as transaction_file:
+        assert transaction_file.signed_total() == 250
+        assert transaction_file.account_ids == [account_id]
@@ -0,0 +1,219 @@
+import pickle
+import struct
+from datetime import datetime
+
+import pytest
+
+from banking.account import BankAccount_COVID19, BankAccount_INT, Transaction
+from banking.application import Application
+from banking.error import AccountNotFoundError, LedgerCorruptedError
+from banking.journal import (
+    ACCOUNT_RECORD,
+    TRANSACTION_RECORD,
+    JournalLedger,
+    migrate_from_pickle,
+)
+from banking.ledger import Ledger
+
+
+@pytest.fixture
+def journal_file(tmp_path) -> str:
+    filename = str(tmp_path / "ledger.journal")
+    open(filename, "wb").close()
+    return filename
+
+
+def test_journal_replays_saved_objects(journal_file):
+    ledger = JournalLedger(journal_file)
+    account = BankAccount_INT.open()
+    closed_account = BankAccount_COVID19.open()
+    deposit = Transaction(
+        account.account_id,
+        Transaction.TransactionType.CREDIT,
+        400,
+        datetime(2020, 4, 1).date(),
+    )
+    ledger.save([account, closed_account, deposit])
+    ledger.close_account(closed_account.account_id)
+
+    replayed = JournalLedger(journal_file)
+    replayed.load()
+    assert list(replayed.all_account_ids()) == [account.account_id]
+    assert list(replayed.all_transaction_ids()) == [deposit.transaction_id]
+    assert replayed.get_account_balance(account.account_id) == 400
+    with pytest.raises(AccountNotFoundError):
+        replayed.get_account(closed_account.account_id)
+
+
+def test_journal_only_appends_new_records(journal_file):
+    ledger = JournalLedger(journal_file)
+    ledger.save_object(BankAccount_INT.open())
+    with open(journal_file, "rb") as journal:
+        first_write = journal.read()
+    ledger.save_object(BankAccount_INT.open())
+    with open(journal_file, "rb") as journal:
+        assert journal.read().startswith(first_write)
+
+
+def test_journal_ignores_truncated_record(journal_file):
+    ledger = JournalLedger(journal_file)
+    account = BankAccount_INT.open()
+    ledger.save_object(account)
+    ledger.save_object(BankAccount_INT.open())
+    with open(journal_file, "rb+") as journal:
+        journal.truncate(len(journal.read()) - 3)
+
+    replayed = JournalLedger(journal_file)
+    replayed.load()
+    assert list(replayed.all_account_ids()) == [account.account_id]
+
+
+def test_journal_appends_after_torn_record(journal_file):
+    ledger = JournalLedger(journal_file)
+    account = BankAccount_INT.open()
+    ledger.save_object(account)
+    ledger.save_object(BankAccount_INT.open())
+    with open(journal_file, "rb+") as journal:
+        journal.truncate(len(journal.read()) - 3)
+
+    replayed = JournalLedger(journal_file)
+    replayed.load()
+    new_account = BankAccount_INT.open()
+    replayed.save_object(new_account)
+    reloaded = JournalLedger(journal_file)
+    reloaded.load()
+    assert list(reloaded.all_account_ids()) == [
+        account.account_id,
+        new_account.account_id,
+    ]
+
+
+def test_migrate_from_pickle(tmp_path, foreign_account):
+    pickle_file = str(tmp_path / "ledger.pkl")
+    ledger = Ledger(pickle_file)
+    deposit = foreign_account.deposit(250)
+    ledger.save([foreign_account, deposit])
+
+    journal_file = str(tmp_path / "ledger.journal")
+    migrate_from_pickle(pickle_file, journal_file)
+    journal = JournalLedger(journal_file)
+    journal.load()
+    assert list(journal.all_account_ids()) == [foreign_account.account_id]
+    assert list(journal.all_transaction_ids()) == [deposit.transaction_id]
+
+
+def test_application_with_journal_backend(tmp_path):
+    app = Application(str(tmp_path / "ledger.journal"), "journal")
+    assert isinstance(app.ledger, JournalLedger)
+    app.start()
+    account_id = app.open_account("international")
+    app.deposit(account_id, 400)
+
+    restarted = Application(str(tmp_path / "ledger.journal"), "journal")
+    restarted.start()
+    assert restarted.ledger.get_account_balance(account_id) == 400
+
+
+def test_checkpoint_then_replay_tail(journal_file):
+    ledger = JournalLedger(journal_file)
+    account = BankAccount_INT.open()
+    today = datetime(2020, 4, 1).date()
+    deposit = Transaction(
+        account.account_id, Transaction.TransactionType.CREDIT, 400, today
+    )
+    ledger.save([account, deposit])
+    ledger.checkpoint()
+    withdrawal = Transaction(
+        account.account_id, Transaction.TransactionType.DEBIT, 150, today
+    )
+    ledger.save_object(withdrawal)
+
+    restarted = JournalLedger(journal_file)
+    restarted.load()
+    assert not restarted.history_loaded
+    assert list(restarted.store["transactions"]) == [withdrawal.transaction_id]
+    assert restarted.get_account_balance(account.account_id) == 250
+    assert (
+        restarted.get_total_withdrawn_amount_by_date(account.account_id, today) == 150
+    )
+    assert list(restarted.all_transaction_ids()) == [
+        deposit.transaction_id,
+        withdrawal.transaction_id,
+    ]
+    assert restarted.history_loaded
+    assert restarted.verify_balances() == {}
+
+
+def test_checkpoint_triggers(journal_file):
+    ledger = JournalLedger(journal_file, checkpoint_every_records=2)
+    ledger.save_object(BankAccount_INT.open())
+    assert ledger.read_snapshot() is None
+    ledger.save_object(BankAccount_INT.open())
+    assert ledger.read_snapshot()["offset"] == ledger.journal_size
+
+    ledger = JournalLedger(journal_file, checkpoint_every_bytes=1)
+    ledger.load()
+    ledger.save_object(BankAccount_INT.open())
+    assert len(ledger.read_snapshot()["accounts"]) == 3
+
+
+def test_snapshot_ignored_when_journal_is_shorter(journal_file):
+    ledger = JournalLedger(journal_file)
+    ledger.save_object(BankAccount_INT.open())
+    ledger.checkpoint()
+    open(journal_file, "wb").close()
+
+    restarted = JournalLedger(journal_file)
+    restarted.load()
+    assert restarted.is_empty
+
+
+def test_journal_detects_corrupt_record(journal_file):
+    ledger = JournalLedger(journal_file)
+    ledger.save_object(BankAccount_INT.open())
+    first_record_end = ledger.journal_size
+    ledger.save_object(BankAccount_INT.open())
+    with open(journal_file, "rb+") as journal:
+        journal.seek(first_record_end - 1)
+        journal.write(b"\x00")
+    with pytest.raises(LedgerCorruptedError):
+        JournalLedger(journal_file).load()
+
+
+def test_journal_rejects_other_files(journal_file):
+    with open(journal_file, "wb") as journal:
+        journal.write(b"not a journal")
+    with pytest.raises(LedgerCorruptedError):
+        JournalLedger(journal_file).load()
+
+
+def test_journal_without_magic_is_converted(journal_file):
+    account = BankAccount_INT.open()
+    deposit = Transaction(
+        account.account_id,
+        Transaction.TransactionType.CREDIT,
+        400,
+        datetime(2020, 4, 1).date(),
+    )
+    # Records as appended before journals had a magic and checksums, the
+    # last one cut short by a crash
+    records = [
+        pickle.dumps((ACCOUNT_RECORD, (account.account_id, BankAccount_INT))),
+        pickle.dumps((TRANSACTION_RECORD, deposit)),
+        pickle.dumps((TRANSACTION_RECORD, deposit)),
+    ]
+    with open(journal_file, "wb") as journal:
+        for record in records:
+            journal.write(struct.pack(">I", len(record)) + record)
+        journal.truncate(journal.tell() - 3)
+
+    ledger = JournalLedger(journal_file)
+    ledger.load()
+    assert ledger.get_account_balance(account.account_id) == 400
+    with open(journal_file, "rb") as journal:
+        assert journal.read().startswith(JournalLedger.JOURNAL_MAGIC)
+    ledger.save_object(BankAccount_INT.open())
+    reloaded = JournalLedger(journal_file)
+    reloaded.load()
+    assert len(list(reloaded.all_account_ids())) == 2
+    assert reloaded.get_account_balance(account.account_id) == 400
@@ -0,0 +1,137 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+
+import pytest
+
+from banking.application import Application
+from banking.error import AccountNotFoundError
+
+
+def make_app(filename: str, **ledger_options) -> Application:
+    app = Application(filename, "lazy", **ledger_options)
+    app.start()
+    return app
+
+
+def fill(app: Application, accounts: int) -> list:
+    account_ids = [app.open_account("international") for _ in range(accounts)]
+    for account_id in account_ids:
+        app.deposit(account_id, 10)
+        app.withdraw(account_id, 3, False)
+    return account_ids
+
+
+def test_startup_loads_no_history(tmp_path):
+    filename = str(tmp_path / "ledger")
+    app = make_app(filename, checkpoint_every_records=None)
+    account_ids = fill(app, 20)
+    app.ledger.checkpoint()
+    assert os.path.exists(filename + ".index")
+
+    reloaded = make_app(filename)
+    ledger = reloaded.ledger
+    assert ledger.index.account_count == 20
+    assert ledger.index.transaction_count == 40
+    assert len(ledger.store["accounts"]) == 0
+    assert len(ledger.store["transactions"]) == 0
+    assert reloaded.get_account_details(account_ids[3])["balance"] == "7.00 PLN"
+    assert list(ledger.resident) == [account_ids[3]]
+    assert len(ledger.store["transactions"]) == 2
+    assert set(reloaded.all_account_ids()) == set(account_ids)
+    assert len(reloaded.all_transaction_ids()) == 40
+
+
+def test_resident_accounts_are_bounded(tmp_path):
+    filename = str(tmp_path / "ledger")
+    account_ids = fill(make_app(filename), 10)
+
+    app = make_app(filename, max_resident_accounts=3)
+    for account_id in account_ids:
+        app.deposit(account_id, 1)
+    ledger = app.ledger
+    assert list(ledger.resident) == account_ids[-3:]
+    assert set(ledger.balances) == set(account_ids[-3:])
+    assert len(ledger.store["transactions"]) == 9
+    # Evicted accounts are read back with the writes made before eviction
+    assert app.get_account_details(account_ids[0])["balance"] == "8.00 PLN"
+    assert ledger.verify_balances() == {}
+
+    reloaded = make_app(filename)
+    for account_id in account_ids:
+        assert reloaded.get_account_details(account_id)["balance"] == "8.00 PLN"
+
+
+def test_concurrent_reads_of_evicted_accounts(tmp_path):
+    filename = str(tmp_path / "ledger")
+    account_ids = fill(make_app(filename), 8)
+
+    app = make_app(
+        filename, max_resident_accounts=1, thread_safe=True, account_cache_size=0
+    )
+    ledger = app.ledger
+
+    def read(account_id: UUID):
+        return (
+            ledger.get_account(account_id).balance,
+            ledger.get_account_balance(account_id),
+        )
+
+    # Switch threads often so one evicts while another reads
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            balances = list(executor.map(read, account_ids * 200))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert balances == [(7, 7)] * len(balances)
+
+
+def test_show_transaction_without_paging_in(tmp_path):
+    filename = str(tmp_path / "ledger")
+    app = make_app(filename, checkpoint_every_records=5)
+    account_ids = fill(app, 4)
+    # Some transactions are in the index, the rest in the journal tail
+    assert app.ledger.index.transaction_count > 0
+    assert app.ledger.tail_transactions
+
+    reloaded = make_app(filename)
+    for transaction_id in app.all_transaction_ids():
+        details = reloaded.get_transaction_details(transaction_id)
+        assert UUID(details["account_id"]) in account_ids
+    assert len(reloaded.ledger.resident) == 0
+    assert reloaded.has_account(account_ids[0])
+    assert len(reloaded.ledger.resident) == 0
+
+
+def test_closed_accounts_are_dropped_from_the_index(tmp_path):
+    filename = str(tmp_path / "ledger")
+    app = make_app(filename)
+    account_ids = fill(app, 3)
+    app.ledger.checkpoint()
+    app.close_account(account_ids[0])
+    assert not app.has_account(account_ids[0])
+
+    reloaded = make_app(filename)
+    assert not reloaded.has_account(account_ids[0])
+    reloaded.ledger.checkpoint()
+    assert reloaded.ledger.index.account_count == 2
+    with pytest.raises(AccountNotFoundError):
+        reloaded.ledger.get_account(account_ids[0])
+    assert set(reloaded.all_account_ids()) == set(account_ids[1:])
+
+
+def test_damaged_index_is_rebuilt_from_the_journal(tmp_path):
+    filename = str(tmp_path / "ledger")
+    app = make_app(filename)
+    account_ids = fill(app, 5)
+    app.ledger.checkpoint()
+    with open(filename + ".index", "r+b") as index_file:
+        index_file.write(b"garbage!")
+
+    reloaded = make_app(filename)
+    assert reloaded.ledger.index.account_count == 0
+    assert set(reloaded.all_account_ids()) == set(account_ids)
+    assert reloaded.get_account_details(account_ids[4])["balance"] == "7.00 PLN"
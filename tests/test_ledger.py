@@ -1,9 +1,20 @@
+import os
+import pickle
+import sys
+import time
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from uuid import uuid4
 
-from banking.account import Transaction
+import pytest
+from pytest_mock import MockFixture
+
+from banking.account import BankAccount_INT, Transaction
+from banking.application import Application
+from banking.error import InsufficientFundError, LedgerCorruptedError
 from banking.ledger import Ledger
+from banking.money import Money
 
 # todo write better ledger tests
 
@@ -63,4 +74,232 @@ def test_get_account_balance():
     ledger.save(transactions)  # type: ignore
     assert not ledger.is_empty
     current_balance = ledger.get_account_balance(mock_account_id)
-    assert current_balance == (400 + 37.99 - 23.47 - 350.26 + 600)
+    assert current_balance == Money.of(400 + 37.99 - 23.47 - 350.26 + 600)
+
+
+def test_transactions_indexed_by_account():
+    ledger = Ledger("test_ledger.p")
+    account_id = uuid4()
+    other_account_id = uuid4()
+    today = datetime.now().date()
+    credit = Transaction(account_id, Transaction.TransactionType.CREDIT, 400, today)
+    other = Transaction(
+        other_account_id, Transaction.TransactionType.CREDIT, 100, today
+    )
+    debit = Transaction(account_id, Transaction.TransactionType.DEBIT, 150, today)
+    ledger.save([credit, other, debit])  # type: ignore
+    assert ledger.get_account_transactions(account_id) == [credit, debit]
+    assert ledger.get_account_transactions(other_account_id) == [other]
+    assert ledger.get_account_transactions(uuid4()) == []
+    ledger.transactions_by_account.clear()
+    ledger.load()
+    assert [t.transaction_id for t in ledger.get_account_transactions(account_id)] == [
+        credit.transaction_id,
+        debit.transaction_id,
+    ]
+    assert ledger.get_account_balance(account_id) == 250
+
+
+def test_running_balances_match_replay():
+    ledger = Ledger("test_ledger.p")
+    account_id = uuid4()
+    today = datetime.now().date()
+    ledger.save(
+        [
+            Transaction(account_id, Transaction.TransactionType.CREDIT, 400, today),
+            Transaction(account_id, Transaction.TransactionType.DEBIT, 23.47, today),
+        ]  # type: ignore
+    )
+    assert ledger.balances[account_id] == 37653
+    assert ledger.verify_balances() == {}
+    ledger.balances[account_id] = 1
+    assert ledger.verify_balances() == {account_id: (Money(1), Money(37653))}
+    ledger.load()
+    assert ledger.verify_balances() == {}
+    assert ledger.get_account_balance(account_id) == Money.of(400 - 23.47)
+
+
+def test_total_withdrawn_amount_by_date():
+    ledger = Ledger("test_ledger.p")
+    account_id = uuid4()
+    yesterday = datetime(2020, 3, 31).date()
+    today = datetime(2020, 4, 1).date()
+    debit = Transaction.TransactionType.DEBIT
+    ledger.save(
+        [
+            Transaction(account_id, debit, 300, yesterday),
+            Transaction(account_id, debit, 200, today),
+            Transaction(account_id, debit, 100, today),
+            Transaction(account_id, Transaction.TransactionType.CREDIT, 900, today),
+        ]  # type: ignore
+    )
+    assert ledger.get_total_withdrawn_amount_by_date(account_id, today) == 300
+    assert ledger.get_total_withdrawn_amount_by_date(account_id, yesterday) == 300
+    assert (account_id, yesterday) not in ledger.withdrawals
+    assert ledger.get_total_withdrawn_amount_by_date(uuid4(), today) == 0
+    ledger.load()
+    assert ledger.withdrawals == {(account_id, today): 30000}
+
+
+def test_invalid_durability_policy():
+    with pytest.raises(ValueError):
+        Ledger("test_ledger.p", durability="never")  # type: ignore
+
+
+def test_batch_durability_groups_writes(
+    tmp_path, mocker: MockFixture, foreign_account, covid_account, company_account
+):
+    fsync = mocker.patch("banking.ledger.os.fsync")
+    filename = str(tmp_path / "ledger.pkl")
+    ledger = Ledger(filename, durability="batch", batch_size=2, batch_window=60)
+    ledger.save_object(foreign_account)
+    assert not os.path.exists(filename)
+    ledger.save_object(covid_account)
+    assert os.path.exists(filename)
+    # The temporary ledger file and the rename into place
+    assert fsync.call_count == 2
+    with ledger:
+        ledger.save_object(company_account)
+        assert ledger.unflushed_writes == 1
+    assert ledger.unflushed_writes == 0
+    assert fsync.call_count == 4
+    reloaded = Ledger(filename)
+    reloaded.load()
+    assert len(reloaded.store["accounts"]) == 3
+
+
+def test_batch_window_flushes_idle_writes(tmp_path, covid_account):
+    filename = str(tmp_path / "ledger.pkl")
+    ledger = Ledger(filename, durability="batch", batch_window=0.05, thread_safe=True)
+    ledger.save_object(covid_account)
+    assert ledger.unflushed_writes == 1
+    deadline = time.monotonic() + 5
+    while not os.path.exists(filename) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert ledger.unflushed_writes == 0
+    reloaded = Ledger(filename)
+    reloaded.load()
+    assert reloaded.has_account(covid_account.account_id)
+
+
+def test_always_durability_syncs_every_write(tmp_path, mocker: MockFixture):
+    fsync = mocker.patch("banking.ledger.os.fsync")
+    ledger = Ledger(str(tmp_path / "ledger.pkl"), durability="always")
+    ledger.save_object(BankAccount_INT.open())
+    ledger.save_object(BankAccount_INT.open())
+    assert fsync.call_count == 4
+
+
+def test_load_detects_corrupt_ledger(tmp_path, foreign_account):
+    filename = str(tmp_path / "ledger.pkl")
+    open(filename, "wb").close()
+    ledger = Ledger(filename)
+    ledger.load()
+    assert ledger.is_empty
+    ledger.save_object(foreign_account)
+    with open(filename, "rb") as ledger_file:
+        data = bytearray(ledger_file.read())
+    data[-1] ^= 0xFF
+    with open(filename, "wb") as ledger_file:
+        ledger_file.write(data)
+    with pytest.raises(LedgerCorruptedError):
+        ledger.load()
+    with open(filename, "wb") as ledger_file:
+        ledger_file.write(b"not a ledger")
+    with pytest.raises(LedgerCorruptedError):
+        ledger.load()
+
+
+def test_load_legacy_pickle_ledger(tmp_path, foreign_account):
+    filename = str(tmp_path / "ledger.pkl")
+    store = Ledger.empty_store()
+    store["accounts"][foreign_account.account_id] = BankAccount_INT
+    with open(filename, "wb") as ledger_file:
+        pickle.dump(store, ledger_file)
+    ledger = Ledger(filename)
+    ledger.load()
+    assert ledger.has_account(foreign_account.account_id)
+
+
+def test_persist_failure_keeps_previous_ledger(
+    tmp_path, mocker: MockFixture, foreign_account, covid_account
+):
+    filename = str(tmp_path / "ledger.pkl")
+    ledger = Ledger(filename)
+    ledger.save_object(foreign_account)
+    mocker.patch("banking.ledger.os.fsync", side_effect=OSError)
+    with pytest.raises(OSError):
+        ledger.save_object(covid_account)
+    assert os.listdir(tmp_path) == ["ledger.pkl"]
+    reloaded = Ledger(filename)
+    reloaded.load()
+    assert list(reloaded.all_account_ids()) == [foreign_account.account_id]
+
+
+@pytest.fixture
+def short_switch_interval():
+    # Switch threads often so unguarded races would show up
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+@pytest.mark.parametrize("backend", ["pickle", "journal", "sqlite", "columnar"])
+def test_thread_safe_ledger_across_accounts(tmp_path, backend, short_switch_interval):
+    app = Application(
+        str(tmp_path / "ledger"),
+        backend,
+        thread_safe=True,
+        durability="batch",
+        batch_size=25,
+    )
+    app.start()
+    account_ids = [app.open_account("international") for _ in range(8)]
+
+    def deposit_and_withdraw(account_id):
+        for _ in range(50):
+            app.deposit(account_id, 2)
+            app.withdraw(account_id, 1, False)
+
+    def read_and_flush():
+        for _ in range(20):
+            list(app.ledger.all_transactions())
+            app.ledger.flush()
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        futures = [
+            executor.submit(deposit_and_withdraw, account_id)
+            for account_id in account_ids * 2
+        ]
+        futures.append(executor.submit(read_and_flush))
+        for future in futures:
+            future.result()
+    app.flush()
+    assert app.ledger.verify_balances() == {}
+    reloaded = Application(str(tmp_path / "ledger"), backend)
+    reloaded.start()
+    for account_id in account_ids:
+        assert reloaded.ledger.get_account_balance(account_id) == 100
+    assert len(list(reloaded.ledger.all_transactions())) == 8 * 200
+
+
+def test_thread_safe_ledger_withdrawals_cannot_overdraw(
+    tmp_path, short_switch_interval
+):
+    app = Application(str(tmp_path / "ledger"), thread_safe=True, durability="batch")
+    app.start()
+    account_id = app.open_account("international")
+    app.deposit(account_id, 50)
+
+    def withdraw():
+        try:
+            app.withdraw(account_id, 1, False)
+            return True
+        except InsufficientFundError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: withdraw(), range(200)))
+    assert results.count(True) == 50
+    assert app.ledger.get_account_balance(account_id) == 0
@@ -0,0 +1,119 @@
+import time
+import urllib.request
+from datetime import date
+
+import pytest
+
+from banking.application import Application
+from banking.metrics import Histogram, Metrics, serve_metrics
+
+
+@pytest.mark.parametrize("backend", ["pickle", "journal", "sharded", "lazy"])
+def test_application_metrics(tmp_path, backend):
+    metrics = Metrics()
+    app = Application(str(tmp_path / "ledger"), backend, metrics)
+    app.start()
+    app.change_current_date(date(2020, 4, 1))
+    account_id = app.open_account("covid")
+    app.deposit(account_id, 100)
+    app.withdraw(account_id, 20, False)
+    with pytest.raises(Exception):
+        app.withdraw(account_id, 20, True)
+    app.get_account_details(account_id)
+
+    assert metrics.counters["application_deposit_calls_total"] == 1
+    assert metrics.counters["application_withdraw_calls_total"] == 2
+    assert metrics.counters["application_withdraw_errors_total"] == 1
+    assert metrics.histograms["application_withdraw_seconds"].count == 2
+    assert metrics.counters["ledger_load_calls_total"] == 1
+    assert metrics.counters["ledger_get_account_calls_total"] == 4
+    # The other accounts come from the account cache
+    assert metrics.counters["ledger_read_account_calls_total"] == 1
+    if backend != "sharded":
+        # The sharded ledger's shards aggregate balances themselves
+        assert metrics.counters["ledger_get_account_balance_calls_total"] == 1
+    persists = metrics.histograms["ledger_persist_bytes"]
+    assert persists.count == metrics.counters["ledger_persist_calls_total"] == 3
+    assert persists.sum == metrics.counters["ledger_bytes_written_total"] > 0
+
+
+def test_generators_are_timed_over_their_iteration(tmp_path):
+    metrics = Metrics()
+    app = Application(str(tmp_path / "ledger"), metrics=metrics)
+    app.start()
+    account_id = app.open_account("covid")
+    for amount in range(1, 4):
+        app.deposit(account_id, amount)
+    stream = app.stream_transactions(account_id)
+    assert "application_stream_transactions_seconds" not in metrics.histograms
+    assert len(list(stream)) == 3
+    histogram = metrics.histograms["application_stream_transactions_seconds"]
+    assert histogram.count == 1
+    # Time spent by the caller between transactions isn't counted and a
+    # stream closed early isn't an error
+    stream = app.stream_transactions(account_id)
+    next(stream)
+    time.sleep(0.1)
+    stream.close()
+    assert histogram.count == 2
+    assert histogram.sum < 0.1
+    assert "application_stream_transactions_errors_total" not in metrics.counters
+
+
+def test_no_metrics(tmp_path):
+    app = Application(str(tmp_path / "ledger"))
+    assert "deposit" not in vars(app)
+    assert "get_account" not in vars(app.ledger)
+
+
+def test_prometheus_format(tmp_path):
+    metrics = Metrics()
+    for milliseconds in range(1, 101):
+        metrics.observe("stage_seconds", milliseconds / 1000)
+    metrics.increment("stage_calls_total", 100)
+    histogram = metrics.histograms["stage_seconds"]
+    assert [histogram.quantile(fraction) for fraction in metrics.QUANTILES] == [
+        0.051,
+        0.096,
+        0.1,
+    ]
+    assert Histogram().quantile(0.5) == 0
+    text = metrics.to_prometheus()
+    assert text.splitlines() == [
+        "# TYPE banking_stage_calls_total counter",
+        "banking_stage_calls_total 100",
+        "# TYPE banking_stage_seconds summary",
+        'banking_stage_seconds{quantile="0.5"} 0.051',
+        'banking_stage_seconds{quantile="0.95"} 0.096',
+        'banking_stage_seconds{quantile="0.99"} 0.1',
+        "banking_stage_seconds_sum 5.05",
+        "banking_stage_seconds_count 100",
+    ]
+    metrics_file = str(tmp_path / "banking.prom")
+    metrics.write_prometheus(metrics_file)
+    with open(metrics_file) as prometheus:
+        assert prometheus.read() == text
+    assert metrics.profile().splitlines()[1].split() == [
+        "stage",
+        "100",
+        "5050.000",
+        "51.000",
+        "96.000",
+        "100.000",
+    ]
+
+
+def test_serve_metrics():
+    metrics = Metrics()
+    metrics.increment("requests_total")
+    server = serve_metrics(metrics, 0)
+    try:
+        host, port = server.server_address[:2]
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert b"banking_requests_total 1\n" in response.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://{host}:{port}/")
+    finally:
+        server.shutdown()
+        server.server_close()
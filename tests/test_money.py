@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pytest
+
+from banking.error import InvalidAmountError
+from banking.money import Money
+
+
+def test_money_of():
+    assert Money.of(12).grosz == 1200
+    assert Money.of(45.37).grosz == 4537
+    assert Money.of("0.005").grosz == 1
+    assert Money.of(Decimal("-3.10")).grosz == -310
+    money = Money(5)
+    assert Money.of(money) is money
+    with pytest.raises(TypeError):
+        Money(1.5)  # type: ignore
+
+
+def test_money_arithmetic_is_exact():
+    total = sum([Money.of(0.1)] * 10, Money())
+    assert total == 1
+    assert total.grosz == 100
+    assert Money.of(400) - 23.47 == Money(37653)
+    assert 1000 - Money.of(0.01) == Money(99999)
+    assert Money.of(1000) * 3 == 3000
+    assert -Money(5) == Money(-5)
+    assert abs(Money(-5)) == Money(5)
+    assert not Money()
+
+
+def test_money_comparisons():
+    assert Money.of(5000) > 4999.99
+    assert Money.of(0.1) < 1
+    assert Money.of(400) == 400.0
+    assert Money.of(400) != "not money"
+    assert hash(Money.of(400)) == hash(400)
+
+
+def test_money_formatting():
+    assert str(Money(1234)) == "12.34 PLN"
+    assert str(Money(5)) == "0.05 PLN"
+    assert str(Money(-1234)) == "-12.34 PLN"
+    assert str(Money.of(1000)) == "1000.00 PLN"
+    assert Money(1234).to_decimal() == Decimal("12.34")
+
+
+def test_money_equals_only_exact_amounts():
+    assert Money.of(45.37) != 45.37
+    assert Money.of(45.37) == Money.of(45.37)
+    assert Money(4537) != 45.371
+    assert Money(4537) != 45.369
+    assert Money.of("0.01") != 0.005
+    assert Money.of("0.01") > 0.005
+    assert Money(1) == Decimal("0.01")
+    assert Money(1) != Decimal("0.005")
+    assert Money(1) != float("nan")
+    assert Money.of(0.5) == 0.5
+    assert Money.of("12.34") != "12.34"
+    for amount in (Money(1234), 12, 12.5, Decimal("12.34")):
+        assert Money.of(amount) == amount
+        assert hash(Money.of(amount)) == hash(amount)
+
+
+@pytest.mark.parametrize(
+    "amount", [float("nan"), float("inf"), -float("inf"), "NaN", "-Infinity", True]
+)
+def test_money_refuses_amounts_that_are_not_numbers_of_zloty(amount):
+    with pytest.raises(InvalidAmountError):
+        Money.of(amount)
@@ -0,0 +1,105 @@
+from datetime import date
+
+import pytest
+
+from banking.account import Transaction
+from banking.application import Application
+from banking.columns import write_transaction_file, TransactionFile
+from banking import report
+from banking.report import build_report, ledger_columns, report_ledger
+
+
+def fill(app: Application) -> list:
+    account_ids = [app.open_account("covid") for _ in range(5)]
+    account_ids.append(app.open_account("international"))
+    for day in (1, 2, 3):
+        app.change_current_date(date(2020, 4, day))
+        for number, account_id in enumerate(account_ids):
+            app.deposit(account_id, 100 * (number + 1))
+            app.withdraw(account_id, 10.01 * day, False)
+            if number % 2:
+                app.withdraw(account_id, day, False)
+    app.close_account(account_ids.pop())
+    return account_ids
+
+
+@pytest.mark.parametrize("backend", ["pickle", "columnar", "journal"])
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_report_matches_ledger(tmp_path, backend, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    app = Application(str(tmp_path / "ledger"), backend)
+    app.start()
+    account_ids = fill(app)
+    ledger = app.ledger
+    report = report_ledger(ledger, use_numpy)
+
+    assert report.balances == {
+        account_id: ledger.get_account_balance(account_id) for account_id in account_ids
+    }
+    assert len(report.daily_withdrawals) == len(account_ids) * 3
+    for (account_id, day), amount in report.daily_withdrawals.items():
+        assert amount == ledger.get_total_withdrawn_amount_by_date(account_id, day)
+    transactions = list(ledger.all_transactions())
+    for transaction_type in Transaction.TransactionType:
+        of_type = [
+            transaction
+            for transaction in transactions
+            if transaction.transaction_type == transaction_type
+        ]
+        assert report.type_counts[transaction_type] == len(of_type)
+        assert report.type_totals[transaction_type].grosz == sum(
+            transaction.amount.grosz for transaction in of_type
+        )
+
+
+def test_report_from_transaction_file(tmp_path):
+    pytest.importorskip("numpy")
+    app = Application(str(tmp_path / "ledger"))
+    app.start()
+    account_ids = fill(app)
+    filename = str(tmp_path / "ledger.transactions")
+    write_transaction_file(filename, ledger_columns(app.ledger))
+    expected = report_ledger(app.ledger, use_numpy=False)
+    with TransactionFile(filename) as transaction_file:
+        report = build_report(transaction_file, account_ids, use_numpy=True)
+        assert report.balances == expected.balances
+        assert report.daily_withdrawals == expected.daily_withdrawals
+
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_report_reads_current_transaction_file(tmp_path, monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+    app = Application(
+        str(tmp_path / "ledger"),
+        "columnar",
+        transaction_file=True,
+        durability="batch",
+        batch_size=1000,
+    )
+    app.start()
+    fill(app)
+    # Unflushed writes aren't in the transaction file yet
+    expected = report_ledger(app.ledger, use_numpy=False)
+    app.flush()
+
+    def columns_rebuilt(ledger):
+        raise AssertionError("columns rebuilt")
+
+    monkeypatch.setattr(report, "ledger_columns", columns_rebuilt)
+    reported = report_ledger(app.ledger, use_numpy)
+    assert reported.to_dict() == expected.to_dict()
+
+
+def test_application_report(tmp_path):
+    app = Application(str(tmp_path / "ledger"))
+    app.start()
+    account_ids = fill(app)
+    report = app.report(withdrawals_on=date(2020, 4, 2))
+    assert report["balances"][str(account_ids[0])] == "239.94 PLN"
+    assert {withdrawal["date"] for withdrawal in report["daily_withdrawals"]} == {
+        "2020-04-02"
+    }
+    assert report["transactions"]["credit"]["count"] == 18
+    assert Application(str(tmp_path / "empty")).report()["balances"] == {}
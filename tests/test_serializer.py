@@ -0,0 +1,137 @@
+import pickle
+from datetime import date
+from uuid import uuid4
+
+import pytest
+
+from banking.account import Transaction
+from banking.application import Application
+from banking.error import LedgerCorruptedError
+from banking.ledger import Ledger, migrate_to_binary, pack_checked, unpack_checked
+from banking.serializer import (
+    BINARY_MAGIC,
+    BinarySerializer,
+    PickleSerializer,
+    StoreSerializer,
+)
+
+
+def transaction_values(store):
+    return [
+        (
+            transaction_id,
+            transaction.transaction_id,
+            transaction.account_id,
+            transaction.transaction_type,
+            transaction.amount,
+            transaction.occurred_on,
+        )
+        for transaction_id, transaction in store["transactions"].items()
+    ]
+
+
+@pytest.mark.parametrize("backend", ["pickle", "sharded"])
+def test_binary_ledger(
+    tmp_path, backend, foreign_account, covid_account, company_account
+):
+    filename = str(tmp_path / "ledger")
+    app = Application(filename, backend, serializer="binary")
+    app.start()
+    app.ledger.save([foreign_account, covid_account, company_account])
+    app.change_current_date(date(2020, 3, 31))
+    app.deposit(company_account.account_id, 5000.01)
+    app.deposit(covid_account.account_id, 300)
+    app.withdraw(covid_account.account_id, 120.5, True)
+    app.close_account(foreign_account.account_id)
+
+    reloaded = Application(filename, backend)
+    reloaded.start()
+    assert reloaded.all_accounts() == app.all_accounts()
+    assert reloaded.all_transactions() == app.all_transactions()
+    account = reloaded.ledger.get_account(covid_account.account_id)
+    assert type(account) is type(covid_account)
+    assert account.balance == 179.5
+    assert account.amount_withdrawn_today == 120.5
+
+
+def test_binary_serializer_round_trip(tmp_path, covid_account, company_account):
+    ledger = Ledger(str(tmp_path / "ledger"))
+    ledger.save(
+        [
+            covid_account,
+            company_account,
+            Transaction(
+                uuid4(), Transaction.TransactionType.DEBIT, 12.34, date(2020, 4, 1)
+            ),
+            Transaction(
+                covid_account.account_id,
+                Transaction.TransactionType.CREDIT,
+                2**50,
+                date(1, 1, 1),
+            ),
+        ]
+    )
+    payload = BinarySerializer().dumps(ledger.store)
+    assert payload.startswith(BINARY_MAGIC)
+    store = BinarySerializer().loads(payload)
+    assert PickleSerializer().loads(payload).keys() == store.keys()
+    assert store["accounts"] == ledger.store["accounts"]
+    assert transaction_values(store) == transaction_values(ledger.store)
+    # Header, type tags, then 17 bytes per account and 45 per transaction
+    assert len(payload) == 25 + 28 + 2 * 17 + 2 * 45
+
+    with pytest.raises(LedgerCorruptedError):
+        BinarySerializer().loads(payload[:-1])
+    with pytest.raises(LedgerCorruptedError):
+        BinarySerializer().loads(payload.replace(b"covid", b"cobid"))
+
+
+def test_invalid_serializer(tmp_path):
+    with pytest.raises(TypeError):
+        StoreSerializer()
+    with pytest.raises(ValueError):
+        Ledger(str(tmp_path / "ledger"), serializer="json")
+    for backend in ("columnar", "journal", "lazy"):
+        with pytest.raises(ValueError):
+            Application(str(tmp_path / "ledger"), backend, serializer="binary")
+
+
+class Exploit:
+    unpickled = False
+
+    def __reduce__(self):
+        return (setattr, (Exploit, "unpickled", True))
+
+
+@pytest.mark.parametrize("checked", [True, False])
+def test_binary_ledger_refuses_pickles(tmp_path, checked):
+    filename = str(tmp_path / "ledger")
+    payload = pickle.dumps(Exploit())
+    with open(filename, "wb") as ledger_file:
+        ledger_file.write(pack_checked(payload) if checked else payload)
+    with pytest.raises(LedgerCorruptedError):
+        Ledger(filename, serializer="binary").load()
+    assert not Exploit.unpickled
+
+
+def test_migrate_to_binary(tmp_path, covid_account, company_account):
+    filename = str(tmp_path / "ledger")
+    ledger = Ledger(filename)
+    ledger.save([covid_account, company_account])
+    ledger.save_object(
+        Transaction(
+            covid_account.account_id,
+            Transaction.TransactionType.CREDIT,
+            100,
+            date(2020, 4, 1),
+        )
+    )
+    migrated = migrate_to_binary(filename, filename)
+    assert migrated.get_account_balance(covid_account.account_id) == 100
+    with open(filename, "rb") as ledger_file:
+        assert unpack_checked(ledger_file.read()).startswith(BINARY_MAGIC)
+
+    reloaded = Ledger(filename, serializer="binary")
+    reloaded.load()
+    assert reloaded.store["accounts"] == ledger.store["accounts"]
+    assert transaction_values(reloaded.store) == transaction_values(ledger.store)
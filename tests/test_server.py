@@ -0,0 +1,128 @@
+import json
+import threading
+from datetime import date
+from itertools import islice
+
+import pytest
+
+from banking.application import Application
+from banking.date_helper import get_todays_date
+from banking.error import (
+    AccountError,
+    InsufficientFundError,
+    InvalidAmountError,
+    RemoteError,
+)
+from banking.server import BankingClient, BankingServer, error_name, is_serving
+
+
+@pytest.fixture
+def server(tmp_path):
+    app = Application(str(tmp_path / "ledger.pkl"), durability="batch")
+    app.start()
+    server = BankingServer(app, str(tmp_path / "banking.sock"))
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,))
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+
+def test_client_runs_application_on_server(server):
+    assert is_serving(server.socket_path)
+    with BankingClient(server.socket_path) as client:
+        account_id = client.open_account("international")
+        transaction_id = client.deposit(account_id, 100.10)
+        client.withdraw(account_id, "0.10", is_atm=True)
+        assert client.has_account(account_id)
+        assert client.all_account_ids() == [account_id]
+        assert client.get_account_details(account_id)["balance"] == "100.00 PLN"
+        details = client.get_transaction_details(transaction_id)
+        assert details["amount"] == "100.10 PLN"
+        assert len(client.all_transactions()) == 2
+        with pytest.raises(InsufficientFundError):
+            client.withdraw(account_id, 1000, is_atm=False)
+        client.change_current_date(date(2020, 4, 1))
+        assert client.close_account(account_id) is not None
+        assert client.all_accounts() == []
+        with pytest.raises(RemoteError):
+            client.call("persist")
+
+
+def test_client_raises_rejected_amounts(server):
+    with BankingClient(server.socket_path) as client:
+        account_id = client.open_account("international")
+        for amount in (0, -5):
+            with pytest.raises(InvalidAmountError):
+                client.deposit(account_id, amount)
+        with pytest.raises(AccountError):
+            client.withdraw(account_id, -5, is_atm=False)
+        assert client.get_account_details(account_id)["balance"] == "0.00 PLN"
+    # Errors that aren't mapped are sent as their nearest mapped base class
+    assert error_name(json.JSONDecodeError("Expecting value", "", 0)) == "ValueError"
+    assert error_name(RuntimeError()) is None
+
+
+def test_client_dates_only_apply_to_their_requests(server):
+    server_date = get_todays_date()
+    with BankingClient(server.socket_path) as client, BankingClient(
+        server.socket_path
+    ) as other_client:
+        client.change_current_date(date(2021, 1, 4))
+        account_id = client.open_account("international")
+        dated = client.get_transaction_details(client.deposit(account_id, 10))
+        undated = other_client.get_transaction_details(
+            other_client.deposit(account_id, 10)
+        )
+        assert dated["occurred_on"] == "2021-01-04"
+        assert undated["occurred_on"] == server_date.isoformat()
+        assert get_todays_date() == server_date
+        with pytest.raises(RemoteError):
+            client.call("change_current_date", new_date=date(2021, 1, 4))
+
+
+def test_client_streams_pages(server, mocker):
+    with BankingClient(server.socket_path) as client:
+        account_id = client.open_account("covid")
+        for amount in range(1, 8):
+            client.deposit(account_id, amount)
+        mocker.patch.object(BankingServer, "PAGE_SIZE", 3)
+        request = mocker.spy(client, "request")
+        transactions = client.stream_transactions(account_id, offset=1)
+        amounts = [transaction["amount"] for transaction in islice(transactions, 2)]
+        # Writes made while the stream is read don't shift it's pages
+        client.deposit(account_id, 100)
+        amounts += [transaction["amount"] for transaction in transactions]
+        assert amounts == [f"{amount}.00 PLN" for amount in range(2, 8)]
+        assert request.call_count == 4
+        with pytest.raises(ValueError):
+            client.call("next_page", cursor=0)
+        transactions = client.stream_transactions(
+            since=date(2020, 1, 1), offset=2, limit=4
+        )
+        assert len(list(transactions)) == 4
+
+
+def test_server_flushes_held_writes(server):
+    ledger = server.app.ledger
+    with BankingClient(server.socket_path) as client:
+        client.open_account("covid")
+    assert ledger.unflushed_writes == 1
+    ledger.batch_window = 0
+    server.service_actions()
+    assert ledger.unflushed_writes == 0
+    reloaded = Application(ledger.filename)
+    reloaded.start()
+    assert len(reloaded.all_account_ids()) == 1
+
+
+def test_server_close_removes_socket(tmp_path):
+    app = Application(str(tmp_path / "ledger.pkl"))
+    app.start()
+    socket_path = str(tmp_path / "banking.sock")
+    open(socket_path, "w").close()
+    server = BankingServer(app, socket_path)
+    assert is_serving(socket_path)
+    server.server_close()
+    assert not is_serving(socket_path)
@@ -0,0 +1,113 @@
+import os
+from datetime import date
+
+import pytest
+
+from banking.application import Application
+from banking.error import LedgerCorruptedError, LedgerError
+from banking.ledger import Ledger
+from banking.sharded_ledger import ShardedLedger, is_sharded_ledger, reshard
+
+
+def make_app(filename: str, **ledger_options) -> Application:
+    app = Application(filename, "sharded", **ledger_options)
+    app.start()
+    return app
+
+
+def test_operations_touch_a_single_shard(tmp_path):
+    filename = str(tmp_path / "ledger")
+    app = make_app(filename, shards=4)
+    account_ids = [app.open_account("international") for _ in range(20)]
+    for account_id in account_ids:
+        app.deposit(account_id, 10)
+
+    reloaded = make_app(filename, shards=99)
+    ledger = reloaded.ledger
+    assert ledger.shard_count == 4
+    assert ledger.loaded_shards() == []
+    account_id = account_ids[0]
+    reloaded.withdraw(account_id, 5, False)
+    assert ledger.loaded_shards() == [ledger.shard_index(account_id)]
+    assert reloaded.get_account_details(account_id)["balance"] == "5.00 PLN"
+    assert set(reloaded.all_account_ids()) == set(account_ids)
+    assert len(reloaded.all_transactions()) == 21
+    assert ledger.verify_balances() == {}
+
+
+def test_only_changed_shards_are_persisted(tmp_path, mocker):
+    app = make_app(str(tmp_path / "ledger"), shards=8)
+    account_id = app.open_account("covid")
+    shard = app.ledger.account_shard(account_id)
+    other = app.ledger.shard((app.ledger.shard_index(account_id) + 1) % 8)
+    shard_persist = mocker.spy(shard, "persist")
+    other_persist = mocker.spy(other, "persist")
+    app.deposit(account_id, 100)
+    assert shard_persist.call_count == 1
+    assert other_persist.call_count == 0
+
+
+def test_transactions_are_sorted_by_day(tmp_path):
+    app = make_app(str(tmp_path / "ledger"), shards=3)
+    account_ids = [app.open_account("international") for _ in range(6)]
+    # Back dated deposits are stored after later ones
+    for day in (2, 3, 1):
+        app.change_current_date(date(2020, 4, day))
+        for account_id in account_ids:
+            app.deposit(account_id, day)
+    app.change_current_date(date(2020, 4, 1))
+    days = [transaction["occurred_on"] for transaction in app.all_transactions()]
+    assert days == sorted(days)
+    transaction_id = app.all_transaction_ids()[-1]
+    assert app.get_transaction_details(transaction_id)["amount"] == "3.00 PLN"
+
+
+def test_thread_safe_shards_share_the_store_lock(tmp_path):
+    ledger = ShardedLedger(str(tmp_path / "ledger"), shards=2, thread_safe=True)
+    assert all(shard.store_lock is ledger.store_lock for shard in ledger.all_shards())
+
+
+def test_reshard_pickled_ledger_in_place(tmp_path):
+    filename = str(tmp_path / "ledger.pkl")
+    app = Application(filename)
+    app.start()
+    account_ids = [app.open_account("international") for _ in range(10)]
+    for account_id in account_ids:
+        app.deposit(account_id, 7)
+    app.close_account(account_ids[0])
+    with pytest.raises(LedgerError):
+        make_app(filename)
+
+    reshard(filename, filename, shards=4)
+    assert is_sharded_ledger(filename)
+    with pytest.raises(LedgerCorruptedError):
+        Application(filename).start()
+    sharded = make_app(filename)
+    assert sharded.ledger.shard_count == 4
+    assert set(sharded.all_account_ids()) == set(account_ids[1:])
+    assert sharded.ledger.get_account_balance(account_ids[1]) == 7
+    assert len(sharded.all_transactions()) == 11
+
+    reshard(filename, filename, shards=2)
+    assert not os.path.exists(sharded.ledger.shard_filename(0))
+    resharded = make_app(filename)
+    assert resharded.ledger.shard_count == 2
+    assert set(resharded.all_account_ids()) == set(account_ids[1:])
+    assert resharded.ledger.verify_balances() == {}
+
+
+def test_sharded_ledger_needs_a_shard(tmp_path):
+    with pytest.raises(ValueError):
+        ShardedLedger(str(tmp_path / "ledger"), shards=0)
+    assert isinstance(ShardedLedger(str(tmp_path / "ledger")), Ledger)
+
+
+def test_is_sharded_ledger(tmp_path):
+    filename = str(tmp_path / "ledger")
+    assert not is_sharded_ledger(filename)
+    app = Application(filename)
+    app.start()
+    app.open_account("covid")
+    assert not is_sharded_ledger(filename)
+    make_app(str(tmp_path / "sharded")).open_account("covid")
+    assert is_sharded_ledger(str(tmp_path / "sharded"))
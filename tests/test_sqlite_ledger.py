@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+
+from banking.account import (
+    BankAccount_COVID19,
+    BankAccount_COVID19_Company,
+    Transaction,
+)
+from banking.application import Application
+from banking.error import AccountNotFoundError
+from banking.sqlite_ledger import SQLiteLedger
+
+
+@pytest.fixture
+def ledger(tmp_path) -> SQLiteLedger:
+    ledger = SQLiteLedger(str(tmp_path / "ledger.db"))
+    ledger.load()
+    yield ledger
+    ledger.close()
+
+
+def test_sqlite_ledger_save_and_get_account(ledger, covid_account):
+    assert ledger.is_empty
+    today = datetime(2020, 4, 1).date()
+    yesterday = datetime(2020, 3, 31).date()
+    account_id = covid_account.account_id
+    deposit = Transaction(account_id, Transaction.TransactionType.CREDIT, 900, today)
+    ledger.save(
+        [
+            covid_account,
+            deposit,
+            Transaction(account_id, Transaction.TransactionType.DEBIT, 300, yesterday),
+            Transaction(account_id, Transaction.TransactionType.DEBIT, 200, today),
+        ]
+    )
+    assert not ledger.is_empty
+    assert list(ledger.all_account_ids()) == [account_id]
+    assert ledger.get_account_balance(account_id) == 400
+    assert ledger.get_total_withdrawn_amount_by_date(account_id, today) == 200
+    assert ledger.get_total_withdrawn_amount_by_date(account_id, yesterday) == 300
+    assert ledger.verify_balances() == {}
+
+    account = ledger.get_account(account_id)
+    assert isinstance(account, BankAccount_COVID19)
+    assert account.balance == 400
+
+    stored = ledger.get_transaction(deposit.transaction_id)
+    assert stored.transaction_id == deposit.transaction_id
+    assert stored.account_id == account_id
+    assert stored.transaction_type == Transaction.TransactionType.CREDIT
+    assert stored.amount == 900
+    assert stored.occurred_on == today
+    assert len(ledger.get_account_transactions(account_id)) == 3
+
+
+def test_sqlite_ledger_close_account(ledger, company_account):
+    ledger.save_object(company_account)
+    reopened = SQLiteLedger(ledger.filename)
+    assert isinstance(
+        reopened.get_account(company_account.account_id), BankAccount_COVID19_Company
+    )
+    ledger.close_account(company_account.account_id)
+    assert not ledger.has_account(company_account.account_id)
+    with pytest.raises(AccountNotFoundError):
+        ledger.close_account(company_account.account_id)
+    reopened.close()
+
+
+def test_application_with_sqlite_backend(tmp_path):
+    app = Application(str(tmp_path / "ledger.db"), "sqlite")
+    app.start()
+    account_id = app.open_account("international")
+    app.deposit(account_id, 400)
+    assert app.get_account_details(account_id)["type"] == "international"
+    assert len(app.all_transactions()) == 1
+    app.ledger.close()
+
+
+def test_thread_safe_sqlite_ledger_reads_rows_under_the_lock(tmp_path, covid_account):
+    ledger = SQLiteLedger(str(tmp_path / "ledger.db"), thread_safe=True)
+    ledger.load()
+    ledger.save_object(covid_account)
+    rows = ledger.fetch_rows("SELECT account_id FROM accounts")
+    # Rows are fetched whole so another thread can use the connection
+    # while they are read
+    assert rows == [(covid_account.account_id.bytes,)]
+    ledger.close()